@@ -1,20 +1,48 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash, send_from_directory, jsonify, Response
+from flask import Flask, render_template, request, redirect, session, url_for, flash, send_from_directory, jsonify, Response, g, has_request_context, make_response
 import csv
 import io
+import json
 import sqlite3
 import os
 import shutil
 import random
+import uuid
+import zlib
+import time as time_module
+from collections import Counter, OrderedDict
+from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_mail import Mail, Message
+from jinja2 import FileSystemBytecodeCache, TemplateError
+from werkzeug.wsgi import ClosingIterator, FileWrapper
 import threading
+import queue
+import click
+import heapq
+from bisect import bisect_right
+import atexit
+from urllib.request import pathname2url
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from math import log, sqrt
+from html.parser import HTMLParser
+
+try:
+    import numpy as np
+except ImportError:  # optional: the FAQ index falls back to pure Python
+    np = None
+
+try:
+    import brotli
+except ImportError:  # optional: responses are gzip-only without it
+    brotli = None
 
 app = Flask(__name__, static_folder="static", template_folder=".")
 
 # ========== PROJECT CONFIGURATION ==========
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_NAME = os.path.join(BASE_DIR, "database.db")
+DB_NAME = os.environ.get("DATABASE_PATH") or os.path.join(BASE_DIR, "database.db")
 app.secret_key = os.environ.get("SECRET_KEY", "super_secret_key_development_only")
 
 # ========== SYSTEM ENVIRONMENT CHECKS ==========
@@ -22,6 +50,79 @@ def is_render():
     """Detect if the application is running on Render production"""
     return os.environ.get('RENDER') == 'true'
 
+# ========== TEMPLATE BYTECODE CACHE ==========
+# Compiled templates are kept on disk, so a restarted worker loads bytecode instead of
+# parsing every template again; `flask precompile-templates` fills it at build time
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR') or os.path.join(BASE_DIR, ".jinja_cache")
+# Compile every template at startup, before the worker takes traffic
+app.config['WARMUP_TEMPLATES'] = os.environ.get('WARMUP_TEMPLATES', 'false').lower() == 'true'
+
+def setup_template_cache():
+    try:
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+    except OSError as e:
+        # Read-only filesystems (e.g. serverless) just compile in memory as before
+        print(f"Note: Jinja bytecode cache disabled - {e}")
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+
+def site_templates():
+    """Every template the app can render: the .html files in the template folder"""
+    folder = os.path.join(app.root_path, app.template_folder)
+    return sorted(name for name in os.listdir(folder) if name.endswith(".html"))
+
+def precompile_templates():
+    """Compile every template without rendering it (writing the bytecode cache);
+    returns (how many compiled, ["name (error)" for each that didn't])"""
+    compiled, failed = 0, []
+    for name in site_templates():
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateError as e:
+            failed.append(f"{name} ({type(e).__name__}: {e})")
+    return compiled, failed
+
+def warm_templates():
+    """Compile every template into this worker's template cache so first requests
+    skip the work. A broken template is reported here; the worker still starts."""
+    started = time_module.perf_counter()
+    compiled, failed = precompile_templates()
+    print(f"🔥 Warmed {compiled} templates in {(time_module.perf_counter() - started) * 1000:.0f} ms")
+    for failure in failed:
+        print(f"   ↳ broken: {failure}")
+    return compiled, failed
+
+setup_template_cache()
+
+# ========== STARTUP ==========
+# Importing the app has no side effects, so build steps (`flask precompile-templates`)
+# and tools that only need its functions never create or migrate a database.
+# Each server process runs startup() once: gunicorn from its post_worker_init hook
+# (gunicorn.conf.py), anything else (flask run, serverless) on its first request.
+_started_pid = None
+_startup_lock = threading.Lock()
+
+def startup():
+    """Static files, schema and seed data, the FAQ index, the digest flusher and (optionally) warm templates"""
+    global _started_pid
+    with _startup_lock:
+        if _started_pid == os.getpid():
+            return
+        setup_static_files()
+        init_db()
+        load_faq_index()
+        # Also sends digests a previous worker queued but didn't live to send
+        notification_queue.start()
+        if app.config['WARMUP_TEMPLATES']:
+            warm_templates()
+        _started_pid = os.getpid()
+
+@app.before_request
+def ensure_started():
+    if _started_pid != os.getpid():
+        startup()
+
 # ========== EMAIL CONFIGURATION (SAFE FALLBACK) ==========
 # Prioritize environment variables for production security
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -76,12 +177,783 @@ def send_email(subject, recipient, body_html):
         # Absolute fallback: if thread initialization fails, do not crash the app
         print(f"❌ Failed to initiate email thread: {e}")
 
+def send_email_batch_async(app_context, messages):
+    """Background thread: deliver a whole batch over a single SMTP session"""
+    with app_context:
+        try:
+            with mail.connect() as connection:
+                for msg in messages:
+                    connection.send(msg)
+            print(f"✅ Background batch of {len(messages)} email(s) sent successfully")
+        except Exception as e:
+            print(f"📧 SMTP background batch issue (ignored): {e}")
+
+def send_email_batch(emails, background=True):
+    """
+    Send many (subject, recipient, body_html) emails with one thread and one SMTP
+    connection instead of one of each per message. Same safety rules as send_email.
+    """
+    if not emails:
+        return
+    if not ENABLE_REAL_EMAILS or not app.config.get('MAIL_USERNAME'):
+        for subject, recipient, _ in emails:
+            print(f"📝 EMAIL SIMULATION (SMTP disabled on Render):\nTo: {recipient}\nSubject: {subject}")
+        return
+
+    try:
+        messages = []
+        for subject, recipient, body_html in emails:
+            msg = Message(subject, recipients=[recipient])
+            msg.html = body_html
+            messages.append(msg)
+
+        if not background:
+            send_email_batch_async(app.app_context(), messages)
+            return
+
+        thread = threading.Thread(
+            target=send_email_batch_async,
+            args=(app.app_context(), messages),
+            daemon=True
+        )
+        thread.start()
+        print(f"🚀 Batch of {len(messages)} email(s) offloaded to background")
+    except Exception as e:
+        print(f"❌ Failed to initiate email batch thread: {e}")
+
+# ========== NOTIFICATION DIGESTS ==========
+# Appointment emails are held per recipient for a short window so a burst of changes
+# (book, confirm, cancel...) goes out as one digest instead of one email per step.
+# The window is also how long every confirmation waits, so keep it short.
+#
+# Pending digests live in the notification_queue table, so changes for one patient
+# handled by different workers share a digest, and a worker that is killed (OOM,
+# gunicorn timeout, SIGKILL) loses nothing: any worker's flusher sends its rows.
+# A digest is claimed for NOTIFY_CLAIM_SECONDS while it is sent and deleted after;
+# one whose sender died is sent again once the claim lapses.
+app.config['NOTIFY_WINDOW_SECONDS'] = float(os.environ.get('NOTIFY_WINDOW_SECONDS', 15))
+app.config['NOTIFY_CLAIM_SECONDS'] = float(os.environ.get('NOTIFY_CLAIM_SECONDS', 120))
+
+_email_templates = {}
+
+def email_template(name):
+    """Compile an email template once per process and reuse it for every send"""
+    template = _email_templates.get(name)
+    if template is None:
+        template = _email_templates[name] = app.jinja_env.get_template(name)
+    return template
+
+def notification_subject(items):
+    if len(items) > 1:
+        return f"Your MediBook appointment updates ({len(items)}) 🩺"
+    item = items[0]
+    if item["is_new"] and item["status"] == "Pending":
+        return "Appointment Requested! 📅"
+    if item["status"] == "Cancelled":
+        return "Appointment Cancelled ❌"
+    return f"Appointment {item['status']}! 🩺"
+
+class NotificationQueue:
+    """This worker's flusher for the shared notification_queue table, plus its counters"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.stats = Counter()
+        self.pid = None
+
+    def start(self):
+        """Start the flusher in this worker (again after a fork); also picks up rows
+        left behind by a worker that died"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                threading.Thread(target=self._run, daemon=True).start()
+
+    def add(self, changes):
+        """Upsert (recipient, user_name, appointment_id, doctor_name, date, time, old_status,
+        new_status) changes; a later change to an appointment that is still waiting
+        replaces the earlier one but keeps its first status"""
+        now = time_module.time()
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for recipient, user_name, appointment_id, doctor_name, date, time, old_status, new_status in changes:
+                row = conn.execute("""
+                    INSERT INTO notification_queue(recipient, user_name, appointment_id, doctor_name, date, time,
+                                                   first_status, status, due_at)
+                    VALUES(?,?,?,?,?,?,?,?, COALESCE(
+                        (SELECT MIN(due_at) FROM notification_queue WHERE recipient = ? AND claimed_until IS NULL), ?))
+                    ON CONFLICT(recipient, appointment_id) WHERE claimed_until IS NULL DO UPDATE SET
+                        user_name = excluded.user_name, doctor_name = excluded.doctor_name, date = excluded.date,
+                        time = excluded.time, status = excluded.status, updates = updates + 1
+                    RETURNING updates
+                """, (recipient, user_name, appointment_id, doctor_name, date, time, old_status, new_status,
+                      recipient, now + app.config['NOTIFY_WINDOW_SECONDS'])).fetchone()
+                # Only the latest state matters; the patient never needs the intermediate steps
+                self.count(queued=1, coalesced=1 if row["updates"] else 0)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.start()
+        with self.lock:
+            self.changed.notify()
+
+    def count(self, **amounts):
+        with self.lock:
+            self.stats.update(amounts)
+
+    def claim(self, force=False):
+        """Claim every digest whose window has closed (all of them with force):
+        [(recipient, user_name, [rows])], oldest change first"""
+        now = time_module.time()
+        conn = get_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute("""
+                UPDATE notification_queue SET claimed_until = ?
+                WHERE recipient IN (
+                    SELECT recipient FROM notification_queue
+                    WHERE claimed_until IS NULL OR claimed_until <= ?
+                    GROUP BY recipient HAVING ? OR MIN(due_at) <= ?
+                ) AND (claimed_until IS NULL OR claimed_until <= ?)
+                RETURNING *
+            """, (now + app.config['NOTIFY_CLAIM_SECONDS'], now, force, now, now)).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        digests = {}
+        for row in sorted(rows, key=lambda row: row["id"]):
+            digests.setdefault(row["recipient"], (row["user_name"], []))[1].append(row)
+        return [(recipient, user_name, items) for recipient, (user_name, items) in digests.items()]
+
+    def done(self, ids):
+        """Forget claimed rows once their digests have gone out"""
+        if not ids:
+            return
+        conn = get_db()
+        try:
+            conn.execute(f"DELETE FROM notification_queue WHERE id IN ({','.join('?' * len(ids))})", ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def next_due(self):
+        """Seconds until the next digest closes, or None when nothing is waiting"""
+        conn = get_db()
+        try:
+            due = conn.execute("""
+                SELECT MIN(COALESCE(claimed_until, due_at)) FROM notification_queue
+            """).fetchone()[0]
+        finally:
+            conn.close()
+        return None if due is None else due - time_module.time()
+
+    def metrics(self):
+        try:
+            conn = get_db()
+            try:
+                row = conn.execute("SELECT COUNT(DISTINCT recipient), COUNT(*) FROM notification_queue").fetchone()
+            finally:
+                conn.close()
+            pending = {"pending_recipients": row[0], "pending_items": row[1]}
+        except sqlite3.Error:
+            pending = {"pending_recipients": None, "pending_items": None}
+        with self.lock:
+            return {**self.stats, **pending}
+
+    def _run(self):
+        while True:
+            try:
+                delay = self.next_due()
+                if delay is None or delay > 0:
+                    # Woken early by this worker's own changes; rows queued by other
+                    # workers are seen within one window
+                    window = app.config['NOTIFY_WINDOW_SECONDS']
+                    with self.lock:
+                        self.changed.wait(window if delay is None else min(delay, window))
+                    continue
+                flush_notifications(background=False)
+            except Exception as e:
+                print(f"⚠️ Notification flush error: {e}")
+                time_module.sleep(app.config['NOTIFY_WINDOW_SECONDS'])
+
+notification_queue = NotificationQueue()
+
+def queue_notification(recipient, user_name, appointment_id, doctor_name, date, time, old_status, new_status):
+    """Queue an appointment change for the patient's next digest (old_status None = new booking)"""
+    notification_queue.add([(recipient, user_name, appointment_id, doctor_name, date, time, old_status, new_status)])
+
+def queue_notifications(changes):
+    """queue_notification for many changes in one write transaction"""
+    if changes:
+        notification_queue.add(changes)
+
+def flush_notifications(force=False, background=True):
+    """Render and send every digest whose window has closed (or all of them with force)"""
+    emails, ids = [], []
+    for recipient, user_name, rows in notification_queue.claim(force):
+        ids.extend(row["id"] for row in rows)
+        items = []
+        for row in rows:
+            # Superseded changes cancel out: booked then cancelled, or approved then back to pending
+            if row["status"] == row["first_status"] or (row["first_status"] is None and row["status"] == "Cancelled"):
+                notification_queue.count(collapsed=1)
+                continue
+            items.append({"doctor_name": row["doctor_name"], "date": row["date"], "time": row["time"],
+                          "first_status": row["first_status"], "status": row["status"],
+                          "is_new": row["first_status"] is None})
+        if not items:
+            continue
+        html = email_template("email_digest.html").render(user_name=user_name, items=items)
+        emails.append((notification_subject(items), recipient, html))
+
+    with app.app_context():
+        send_email_batch(emails, background=background)
+    notification_queue.done(ids)
+    notification_queue.count(sent=len(emails))
+    return len(emails)
+
+def _flush_at_exit():
+    # Send what is due on a clean shutdown; anything else stays queued for the next worker.
+    # Processes that never queued or flushed (build steps, CLI tools) leave the database alone
+    if notification_queue.pid != os.getpid():
+        return
+    try:
+        flush_notifications(background=False)
+    except Exception as e:
+        print(f"⚠️ Notification flush at exit skipped: {e}")
+
+atexit.register(_flush_at_exit)
+
+# ========== PASSWORD HASHING ==========
+# scrypt/pbkdf2 are deliberately CPU-heavy. Running them inline lets a login spike
+# take every core, so they go through a small bounded process pool instead. This
+# bounds CPU, not threads: the request thread still waits for its hash (at most
+# PASSWORD_HASH_TIMEOUT). Each gunicorn worker has its own pool, so up to
+# workers x PASSWORD_HASH_WORKERS hashes run at once.
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+app.config['PASSWORD_HASH_QUEUE_LIMIT'] = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 32))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+_hash_stats_lock = threading.Lock()
+_hash_stats = {"jobs": 0, "inline": 0, "rejected": 0, "timed_out": 0, "in_flight": 0,
+               "queue_wait_total": 0.0, "queue_wait_max": 0.0}
+_hash_prefix_cache = {}
+
+def _password_job(kind, submitted_at, *args):
+    """Runs inside the pool; also reports how long the job sat in the queue"""
+    queue_wait = max(0.0, time_module.time() - submitted_at)
+    if kind == "hash":
+        return generate_password_hash(*args), queue_wait
+    return check_password_hash(*args), queue_wait
+
+def _get_hash_pool():
+    """One pool per worker process, created lazily so it survives gunicorn's fork"""
+    global _hash_pool, _hash_pool_pid
+    if app.config['PASSWORD_HASH_WORKERS'] <= 0:
+        return None
+    with _hash_pool_lock:
+        if _hash_pool is None or _hash_pool_pid != os.getpid():
+            try:
+                _hash_pool = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'])
+                _hash_pool_pid = os.getpid()
+            except (OSError, NotImplementedError) as e:
+                # Some serverless platforms have no multiprocessing support
+                print(f"⚠️ Password hash pool unavailable, hashing inline: {e}")
+                app.config['PASSWORD_HASH_WORKERS'] = 0
+                return None
+        return _hash_pool
+
+def _run_password_job(kind, *args):
+    """Run a hash/check job in the pool and wait for it. Raises RuntimeError when the
+    queue is full or the job doesn't finish within PASSWORD_HASH_TIMEOUT."""
+    global _hash_pool
+    pool = _get_hash_pool()
+    if pool is None:
+        with _hash_stats_lock:
+            _hash_stats["inline"] += 1
+        return _password_job(kind, time_module.time(), *args)[0]
+
+    if not _hash_slots.acquire(timeout=app.config['PASSWORD_HASH_TIMEOUT']):
+        with _hash_stats_lock:
+            _hash_stats["rejected"] += 1
+        raise RuntimeError("Password hashing queue is full")
+    with _hash_stats_lock:
+        _hash_stats["in_flight"] += 1
+    try:
+        future = pool.submit(_password_job, kind, time_module.time(), *args)
+        result, queue_wait = future.result(timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+    except FuturesTimeoutError:
+        # Builtin TimeoutError on 3.11+, a separate class before that
+        future.cancel()
+        with _hash_stats_lock:
+            _hash_stats["timed_out"] += 1
+        raise RuntimeError("Password hashing timed out")
+    except BrokenProcessPool:
+        print("⚠️ Password hash pool crashed; recreating it and hashing inline")
+        with _hash_pool_lock:
+            _hash_pool = None
+        with _hash_stats_lock:
+            _hash_stats["inline"] += 1
+        return _password_job(kind, time_module.time(), *args)[0]
+    finally:
+        with _hash_stats_lock:
+            _hash_stats["in_flight"] -= 1
+        _hash_slots.release()
+
+    with _hash_stats_lock:
+        _hash_stats["jobs"] += 1
+        _hash_stats["queue_wait_total"] += queue_wait
+        _hash_stats["queue_wait_max"] = max(_hash_stats["queue_wait_max"], queue_wait)
+    return result
+
+def hash_password(password):
+    return _run_password_job("hash", password, app.config['PASSWORD_HASH_METHOD'])
+
+def verify_password(stored_hash, password):
+    return _run_password_job("check", stored_hash, password)
+
+def password_needs_rehash(stored_hash):
+    """True when a stored hash was made with different parameters than configured"""
+    method = app.config['PASSWORD_HASH_METHOD']
+    if method not in _hash_prefix_cache:
+        # werkzeug fills in defaults (e.g. pbkdf2 iterations), so ask it for the full prefix
+        _hash_prefix_cache[method] = generate_password_hash("probe", method).split("$", 1)[0]
+    return stored_hash.split("$", 1)[0] != _hash_prefix_cache[method]
+
+def password_hash_metrics():
+    jobs = _hash_stats["jobs"]
+    return {
+        "workers": app.config['PASSWORD_HASH_WORKERS'],
+        "queue_limit": app.config['PASSWORD_HASH_QUEUE_LIMIT'],
+        "in_flight": _hash_stats["in_flight"],
+        "jobs": jobs,
+        "inline_jobs": _hash_stats["inline"],
+        "rejected": _hash_stats["rejected"],
+        "timed_out": _hash_stats["timed_out"],
+        "queue_wait_avg_ms": round(_hash_stats["queue_wait_total"] / jobs * 1000, 2) if jobs else 0.0,
+        "queue_wait_max_ms": round(_hash_stats["queue_wait_max"] * 1000, 2),
+    }
+
+# ========== SQL TRACING CONFIGURATION ==========
+# With SQL_TRACE on, every get_db() connection is instrumented so we can see what
+# each page costs. Server-Timing headers are only sent in debug mode unless explicitly enabled.
+app.config['SQL_TRACE'] = os.environ.get('SQL_TRACE', 'False') == 'True'
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 3))
+app.config['SQL_TIMING_HEADERS'] = os.environ.get('SQL_TIMING_HEADERS') == 'true'
+
+def _request_sql_stats():
+    """Per-request query counters, or None when running outside a request"""
+    if not has_request_context():
+        return None
+    if "sql_stats" not in g:
+        g.sql_stats = {"count": 0, "time": 0.0, "statements": Counter()}
+    return g.sql_stats
+
+def _explain_query_plan(conn, sql, parameters):
+    """Run EXPLAIN QUERY PLAN on a plain cursor so it isn't counted as a query"""
+    try:
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        return [row[-1] for row in rows]
+    except Exception as e:
+        return [f"(plan unavailable: {e})"]
+
+def _record_query_time(conn, sql, parameters, elapsed, explain=True):
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= app.config['SLOW_QUERY_MS']:
+        print(f"🐢 Slow query ({elapsed_ms:.1f} ms): {' '.join(sql.split())}")
+        if explain and sql.lstrip()[:6].upper() in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            for line in _explain_query_plan(conn, sql, parameters):
+                print(f"   ↳ {line}")
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    Cursor that counts each statement by its SQL text (placeholders, not values, so
+    the same query run for every id in a loop adds up) and times it from execute
+    until its rows have been read.
+    """
+    _statement = None  # [sql, parameters, seconds so far] while rows are being read
+
+    def _spend(self, elapsed):
+        stats = _request_sql_stats()
+        if stats is not None:
+            stats["time"] += elapsed
+        if self._statement is not None:
+            self._statement[2] += elapsed
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None:
+            _record_query_time(self.connection, *statement)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        stats = _request_sql_stats()
+        if stats is not None:
+            stats["count"] += 1
+            stats["statements"][sql] += 1
+        self._statement = [sql, parameters, 0.0]
+        start = time_module.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._spend(time_module.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        stats = _request_sql_stats()
+        if stats is not None:
+            stats["count"] += 1
+            stats["statements"][sql] += 1
+        start = time_module.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time_module.perf_counter() - start
+            self._spend(elapsed)
+            _record_query_time(self.connection, sql, (), elapsed, explain=False)
+
+    def fetchone(self):
+        start = time_module.perf_counter()
+        row = super().fetchone()
+        self._spend(time_module.perf_counter() - start)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time_module.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._spend(time_module.perf_counter() - start)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time_module.perf_counter()
+        rows = super().fetchall()
+        self._spend(time_module.perf_counter() - start)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time_module.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._spend(time_module.perf_counter() - start)
+            self._finish()
+            raise
+        self._spend(time_module.perf_counter() - start)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Callers often read one row and drop the cursor; report the statement then
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors are TracedCursor instances"""
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@app.after_request
+def report_sql_stats(response):
+    """Flag repeated statements (N+1) and expose DB cost via Server-Timing"""
+    stats = g.pop("sql_stats", None)
+    if stats is None:
+        return response
+
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    for statement, count in stats["statements"].items():
+        # Several short transactions per request are normal, not an N+1
+        if count >= threshold and (statement.split() or [""])[0].upper() not in ("", "BEGIN", "COMMIT", "ROLLBACK"):
+            print(f"🔁 Possible N+1 on {request.path}: {count}x {' '.join(statement.split())}")
+
+    if app.debug or app.config['SQL_TIMING_HEADERS']:
+        db_ms = stats["time"] * 1000
+        response.headers.add("Server-Timing", f'db;dur={db_ms:.2f};desc="{stats["count"]} queries"')
+    return response
+
+# ========== RESPONSE COMPRESSION ==========
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+# Larger buffered bodies go out as they are rather than being read into memory to encode
+app.config['COMPRESS_MAX_SIZE'] = int(os.environ.get('COMPRESS_MAX_SIZE', 5 * 1024 * 1024))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+COMPRESSIBLE_MIMETYPES = ("text/html", "text/css", "text/plain", "text/csv", "text/event-stream",
+                          "application/json", "application/javascript", "text/javascript")
+
+def negotiate_encoding(accept_encoding):
+    """'br' or 'gzip' from an Accept-Encoding header (honouring q=0), or None"""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip()] = q
+    wildcard = offered.get("*", 0)
+    for encoding in (("br", "gzip") if brotli else ("gzip",)):
+        if offered.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+class _Encoder:
+    """Incremental gzip/brotli encoder; flush() ends a block so the client can decode it now"""
+    def __init__(self, encoding):
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=app.config['COMPRESS_BROTLI_QUALITY'])
+            self.compress, self.finish = self.compressor.process, self.compressor.finish
+            self.flush = self.compressor.flush
+        else:
+            # wbits 31 = zlib deflate with a gzip header and trailer
+            self.compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+            self.compress, self.finish = self.compressor.compress, self.compressor.flush
+            self.flush = lambda: self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    WSGI middleware that gzip/brotli-encodes text responses. Buffered responses below
+    COMPRESS_MIN_SIZE or above COMPRESS_MAX_SIZE go out as they are; streamed responses
+    (no Content-Length, e.g. SSE) are encoded chunk by chunk and flushed after each so
+    nothing is held back. HEAD requests and file responses (send_file's file wrapper,
+    which the server may hand to sendfile) are never touched.
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def count(self, **amounts):
+        with self.lock:
+            self.stats.update(amounts)
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["ratio"] = round(stats["bytes_out"] / stats["bytes_in"], 3) if stats.get("bytes_in") else None
+        return stats
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, start_response)
+
+        captured = {}
+        def capture(status, headers, exc_info=None):
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return self._write_unsupported
+
+        body = self.wsgi_app(environ, capture)
+        status, headers = captured["status"], captured["headers"]
+        header = {name.lower(): value for name, value in headers}
+        mimetype = header.get("content-type", "").split(";")[0].strip()
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(body, FileWrapper) or (isinstance(file_wrapper, type) and isinstance(body, file_wrapper)):
+            self.count(skipped_file=1)
+            start_response(status, headers, captured["exc_info"])
+            return body
+        if (mimetype not in COMPRESSIBLE_MIMETYPES or "content-encoding" in header
+                or int(status[:3]) in (204, 206, 304) or "no-transform" in header.get("cache-control", "")):
+            start_response(status, headers, captured["exc_info"])
+            return body
+
+        # Caches must keep the encoded and identity variants apart
+        vary = [v.strip() for name, value in headers if name.lower() == "vary" for v in value.split(",")]
+        if "accept-encoding" not in (v.lower() for v in vary):
+            vary.append("Accept-Encoding")
+        headers = [(name, value) for name, value in headers if name.lower() != "vary"] + [("Vary", ", ".join(vary))]
+
+        if "content-length" in header:
+            return self._buffered(body, status, headers, int(header["content-length"]), encoding, start_response, captured)
+        return self._streamed(body, status, headers, encoding, start_response, captured)
+
+    @staticmethod
+    def _write_unsupported(data):
+        raise RuntimeError("CompressionMiddleware does not support the WSGI write() callable")
+
+    def _buffered(self, body, status, headers, length, encoding, start_response, captured):
+        if length < app.config['COMPRESS_MIN_SIZE']:
+            self.count(skipped_small=1)
+            start_response(status, headers, captured["exc_info"])
+            return body
+        if length > app.config['COMPRESS_MAX_SIZE']:
+            self.count(skipped_large=1)
+            start_response(status, headers, captured["exc_info"])
+            return body
+        try:
+            raw = b"".join(body)
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+        encoder = _Encoder(encoding)
+        data = encoder.compress(raw) + encoder.finish()
+        self.count(**{"responses": 1, encoding: 1, "bytes_in": len(raw), "bytes_out": len(data)})
+        start_response(status, self._encoded_headers(headers, encoding, len(data)), captured["exc_info"])
+        return [data]
+
+    def _streamed(self, body, status, headers, encoding, start_response, captured):
+        start_response(status, self._encoded_headers(headers, encoding, None), captured["exc_info"])
+        self.count(**{"streamed": 1, encoding: 1})
+
+        def generate():
+            encoder = _Encoder(encoding)
+            for chunk in body:
+                if not chunk:
+                    continue
+                data = encoder.compress(chunk) + encoder.flush()
+                self.count(bytes_in=len(chunk), bytes_out=len(data))
+                yield data
+            data = encoder.finish()
+            self.count(bytes_out=len(data))
+            yield data
+        # The server's close() must reach the wrapped body even if generate() never started
+        return ClosingIterator(generate(), getattr(body, "close", None))
+
+    def _encoded_headers(self, headers, encoding, length):
+        encoded = []
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered == "content-length":
+                continue
+            if lowered == "etag" and not value.startswith("W/"):
+                # The encoded bytes differ from the identity ones, so a strong ETag no longer holds
+                value = f"W/{value}"
+            encoded.append((name, value))
+        encoded.append(("Content-Encoding", encoding))
+        if length is not None:
+            encoded.append(("Content-Length", str(length)))
+        return encoded
+
+compression = app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+
 # ========== DATABASE & INITIALIZATION ==========
-def get_db():
-    conn = sqlite3.connect(DB_NAME)
+def _connect(database, uri=False):
+    if app.config['SQL_TRACE']:
+        conn = sqlite3.connect(database, uri=uri, factory=TracedConnection)
+    else:
+        conn = sqlite3.connect(database, uri=uri)
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_db():
+    return _connect(DB_NAME)
+
+# ========== BACKUPS & READ-ONLY SNAPSHOTS ==========
+app.config['SNAPSHOT_DIR'] = os.environ.get('SNAPSHOT_DIR') or os.path.join(BASE_DIR, "snapshots")
+app.config['SNAPSHOT_KEEP'] = int(os.environ.get('SNAPSHOT_KEEP', 3))
+app.config['BACKUP_PAGES_PER_STEP'] = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+app.config['BACKUP_STEP_SLEEP'] = float(os.environ.get('BACKUP_STEP_SLEEP', 0.05))
+# Steps a commit may send back to the start before the rest is copied in one go
+app.config['BACKUP_MAX_RESTARTS'] = int(os.environ.get('BACKUP_MAX_RESTARTS', 3))
+# Heavy reports (CSV export, analytics) read the latest snapshot instead of the live database
+app.config['REPORTS_FROM_SNAPSHOT'] = os.environ.get('REPORTS_FROM_SNAPSHOT', 'False') == 'True'
+
+SNAPSHOT_PREFIX = "medibook-"
+
+def list_snapshots():
+    """Published snapshots, newest first"""
+    folder = app.config['SNAPSHOT_DIR']
+    if not os.path.isdir(folder):
+        return []
+    names = sorted((n for n in os.listdir(folder) if n.startswith(SNAPSHOT_PREFIX) and n.endswith(".db")),
+                   reverse=True)
+    return [os.path.join(folder, n) for n in names]
+
+class _BackupRestarted(Exception):
+    pass
+
+def backup_database(keep=None):
+    """
+    Copy the live database with SQLite's online backup API, BACKUP_PAGES_PER_STEP
+    pages at a time with a BACKUP_STEP_SLEEP pause between steps. The database runs
+    in WAL mode, so a step only reads and never blocks bookings. A commit from
+    another connection sends a stepped copy back to the start, though, so once that
+    has happened BACKUP_MAX_RESTARTS times the rest is copied in a single step,
+    which under WAL is one consistent read that still doesn't block writers. The
+    copy is written under a temporary name and renamed into place, so readers only
+    ever see complete snapshots.
+    """
+    keep = app.config['SNAPSHOT_KEEP'] if keep is None else keep
+    folder = app.config['SNAPSHOT_DIR']
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    partial = target + ".partial"
+
+    restarts, last_remaining = 0, None
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts >= app.config['BACKUP_MAX_RESTARTS']:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        time_module.sleep(app.config['BACKUP_STEP_SLEEP'])
+
+    source = sqlite3.connect(DB_NAME)
+    destination = sqlite3.connect(partial)
+    try:
+        try:
+            source.backup(destination, pages=app.config['BACKUP_PAGES_PER_STEP'], progress=progress)
+        except _BackupRestarted:
+            source.backup(destination, pages=-1)
+        # Snapshots are opened immutable, which needs a self-contained file rather than a WAL one
+        destination.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        destination.close()
+        source.close()
+
+    os.chmod(partial, 0o444)
+    os.replace(partial, target)
+
+    for old in list_snapshots()[max(keep, 1):]:
+        os.remove(old)
+    return target
+
+def get_report_db():
+    """
+    Connection for long read-only reports: the newest snapshot when
+    REPORTS_FROM_SNAPSHOT is on (and one exists), otherwise the live database.
+    Returns (conn, snapshot_path_or_None).
+    """
+    if app.config['REPORTS_FROM_SNAPSHOT']:
+        snapshots = list_snapshots()
+        if snapshots:
+            # Published snapshots never change, so immutable=1 skips locking entirely
+            uri = f"file:{pathname2url(snapshots[0])}?mode=ro&immutable=1"
+            return _connect(uri, uri=True), snapshots[0]
+    return get_db(), None
+
 def setup_static_files():
     """Ensure style.css is in the static folder for production"""
     if not os.path.exists("static"):
@@ -92,10 +964,17 @@ def setup_static_files():
         # Always sync for local development updates
         shutil.copy("style.css", "static/style.css")
 
+# Bump whenever init_db changes the schema; /readyz flags a database that is behind
+SCHEMA_VERSION = 2
+
 def init_db():
     conn = get_db()
     cursor = conn.cursor()
 
+    # Readers (reports, backups) and the single writer no longer block each other;
+    # the setting is stored in the database file, so every later connection gets it
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -116,6 +995,33 @@ def init_db():
         )
     """)
 
+    # Schedule summaries parsed once on write, so listings can filter by weekday and
+    # capacity in SQL instead of re-parsing the free-text schedule per request
+    doctor_columns = {row["name"] for row in cursor.execute("PRAGMA table_info(doctors)")}
+    if "weekday_mask" not in doctor_columns:
+        cursor.execute("ALTER TABLE doctors ADD COLUMN weekday_mask INTEGER")
+    if "slots_per_day" not in doctor_columns:
+        cursor.execute("ALTER TABLE doctors ADD COLUMN slots_per_day INTEGER")
+    # Removal is a soft delete first; a background job clears the doctor's rows later
+    if "deleted_at" not in doctor_columns:
+        cursor.execute("ALTER TABLE doctors ADD COLUMN deleted_at TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctors_specialization ON doctors(specialization)")
+
+    # Bumped on any write to doctors, so per-worker slot bitmaps notice schedule edits
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS doctor_revision(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO doctor_revision(id, revision) VALUES(1, 0)")
+    for operation in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_doctors_revision_{operation.lower()} AFTER {operation} ON doctors BEGIN
+                UPDATE doctor_revision SET revision = revision + 1 WHERE id = 1;
+            END
+        """)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS appointments(
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -129,61 +1035,1638 @@ def init_db():
         )
     """)
 
-    # Add UNIQUE constraint to prevent double booking
-    try:
-        cursor.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS unique_doctor_time_slot 
-            ON appointments(doctor_id, date, time) 
-            WHERE status != 'Cancelled'
-        """)
-        print("✅ Created unique constraint for appointments")
-    except Exception as e:
-        print(f"Note: Index creation - {e}")
+    # Add UNIQUE constraint to prevent double booking
+    try:
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS unique_doctor_time_slot 
+            ON appointments(doctor_id, date, time) 
+            WHERE status != 'Cancelled'
+        """)
+        print("✅ Created unique constraint for appointments")
+    except Exception as e:
+        print(f"Note: Index creation - {e}")
+
+    # Lets per-patient conflict checks and dashboards avoid scanning every appointment
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_appointments_user_date
+        ON appointments(user_id, date)
+    """)
+
+    # Sortable start time ('YYYY-MM-DD HH:MM', 24h) derived from the stored date and
+    # '09:30 AM' time, so time-ordered scans such as reminders can walk an index
+    columns = {row["name"] for row in cursor.execute("PRAGMA table_xinfo(appointments)")}
+    if "starts_at" not in columns:
+        cursor.execute("""
+            ALTER TABLE appointments ADD COLUMN starts_at TEXT GENERATED ALWAYS AS (
+                date || ' ' || printf('%02d:%s',
+                    substr(time, 1, 2) % 12 + CASE WHEN substr(time, 7, 2) = 'PM' THEN 12 ELSE 0 END,
+                    substr(time, 4, 2))
+            ) VIRTUAL
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_starts_at ON appointments(starts_at)")
+    # Lets a doctor's removal walk their appointments in chunks without scanning the table.
+    # unique_doctor_time_slot leads with doctor_id too, but it is partial (status != 'Cancelled'),
+    # so the planner can't use it for a bare doctor_id = ? that must also reach cancelled rows
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor ON appointments(doctor_id)")
+
+    # Recurring bookings: one row per series, each visit points back at it
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_series(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            first_date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            interval_weeks INTEGER NOT NULL,
+            occurrences INTEGER NOT NULL,
+            end_date TEXT,
+            status TEXT NOT NULL DEFAULT 'Active',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(doctor_id) REFERENCES doctors(id)
+        )
+    """)
+    if "series_id" not in columns:
+        cursor.execute("ALTER TABLE appointments ADD COLUMN series_id INTEGER REFERENCES appointment_series(id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_series ON appointments(series_id) WHERE series_id IS NOT NULL")
+
+    # Append-only change log of appointment status transitions. Live streams and
+    # caches read it by id instead of re-querying the appointments table.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_events(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            appointment_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            old_status TEXT,
+            new_status TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Analytics rollups, maintained by a trigger on appointment_events so every write
+    # path (booking, status changes, bulk updates, imports) keeps them current
+    rollups_existed = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='doctor_daily_stats'").fetchone()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS doctor_daily_stats(
+            doctor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            requested INTEGER NOT NULL DEFAULT 0,
+            active INTEGER NOT NULL DEFAULT 0,
+            cancelled INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(doctor_id, date)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_doctor_daily_stats_date ON doctor_daily_stats(date)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS demand_heatmap(
+            doctor_id INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            requested INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(doctor_id, weekday, hour)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS booking_lead_times(
+            doctor_id INTEGER NOT NULL,
+            lead_days INTEGER NOT NULL,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(doctor_id, lead_days)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_appointment_events_rollups
+        AFTER INSERT ON appointment_events
+        BEGIN
+            INSERT INTO doctor_daily_stats(doctor_id, date, requested, active, cancelled, completed)
+            VALUES(NEW.doctor_id, NEW.date,
+                   (NEW.new_status IS NOT NULL) - (NEW.old_status IS NOT NULL),
+                   (NEW.new_status IS NOT NULL AND NEW.new_status != 'Cancelled')
+                       - (NEW.old_status IS NOT NULL AND NEW.old_status != 'Cancelled'),
+                   (NEW.new_status IS 'Cancelled') - (NEW.old_status IS 'Cancelled'),
+                   (NEW.new_status IS 'Completed') - (NEW.old_status IS 'Completed'))
+            ON CONFLICT(doctor_id, date) DO UPDATE SET
+                requested = requested + excluded.requested,
+                active = active + excluded.active,
+                cancelled = cancelled + excluded.cancelled,
+                completed = completed + excluded.completed;
+
+            INSERT INTO demand_heatmap(doctor_id, weekday, hour, requested)
+            SELECT NEW.doctor_id, CAST(strftime('%w', NEW.date) AS INTEGER),
+                   substr(NEW.time, 1, 2) % 12 + CASE WHEN substr(NEW.time, 7, 2) = 'PM' THEN 12 ELSE 0 END,
+                   (NEW.new_status IS NOT NULL) - (NEW.old_status IS NOT NULL)
+            WHERE (NEW.new_status IS NULL) != (NEW.old_status IS NULL)
+            ON CONFLICT(doctor_id, weekday, hour) DO UPDATE SET requested = requested + excluded.requested;
+
+            -- Lead time is only known at the moment a booking is made (imports of past visits are skipped)
+            INSERT INTO booking_lead_times(doctor_id, lead_days, bookings)
+            SELECT NEW.doctor_id, MIN({LEAD_DAYS_CAP}, CAST(julianday(NEW.date) - julianday(date('now', 'localtime')) AS INTEGER)), 1
+            WHERE NEW.old_status IS NULL AND NEW.new_status IS NOT NULL
+              AND julianday(NEW.date) >= julianday(date('now', 'localtime'))
+            ON CONFLICT(doctor_id, lead_days) DO UPDATE SET bookings = bookings + 1;
+        END
+    """)
+
+    # Full-text index over the doctor directory (external content: rows live in doctors,
+    # triggers keep the index in step). Skipped if this SQLite build lacks FTS5.
+    global DOCTOR_FTS
+    DOCTOR_FTS = None  # detected again on the next search
+    try:
+        fts_existed = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='doctors_fts'").fetchone()
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5(
+                name, specialization, available_days, time_slots,
+                content='doctors', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_doctors_fts_insert AFTER INSERT ON doctors BEGIN
+                INSERT INTO doctors_fts(rowid, name, specialization, available_days, time_slots)
+                VALUES(NEW.id, NEW.name, NEW.specialization, NEW.available_days, NEW.time_slots);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_doctors_fts_delete AFTER DELETE ON doctors BEGIN
+                INSERT INTO doctors_fts(doctors_fts, rowid, name, specialization, available_days, time_slots)
+                VALUES('delete', OLD.id, OLD.name, OLD.specialization, OLD.available_days, OLD.time_slots);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_doctors_fts_update
+            AFTER UPDATE OF name, specialization, available_days, time_slots ON doctors BEGIN
+                INSERT INTO doctors_fts(doctors_fts, rowid, name, specialization, available_days, time_slots)
+                VALUES('delete', OLD.id, OLD.name, OLD.specialization, OLD.available_days, OLD.time_slots);
+                INSERT INTO doctors_fts(rowid, name, specialization, available_days, time_slots)
+                VALUES(NEW.id, NEW.name, NEW.specialization, NEW.available_days, NEW.time_slots);
+            END
+        """)
+        if not fts_existed:
+            cursor.execute("INSERT INTO doctors_fts(doctors_fts) VALUES('rebuild')")
+    except sqlite3.OperationalError as e:
+        print(f"Note: FTS5 unavailable, doctor search falls back to LIKE - {e}")
+
+    # Cold storage for finished appointments; ids are kept so history links stay valid.
+    # AUTOINCREMENT on appointments guarantees an archived id is never reissued.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointments_archive(
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT NOT NULL,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_user_date
+        ON appointments_archive(user_id, date)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_archive_date ON appointments_archive(date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_archive_doctor ON appointments_archive(doctor_id)")
+    if "series_id" not in {row["name"] for row in cursor.execute("PRAGMA table_info(appointments_archive)")}:
+        cursor.execute("ALTER TABLE appointments_archive ADD COLUMN series_id INTEGER")
+
+    # Read-only view over hot + archived rows for pages that show history
+    if "series_id" not in {row["name"] for row in cursor.execute("PRAGMA table_info(appointment_history)")}:
+        cursor.execute("DROP VIEW IF EXISTS appointment_history")
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS appointment_history AS
+        SELECT id, user_id, doctor_id, date, time, status, series_id FROM appointments
+        UNION ALL
+        SELECT id, user_id, doctor_id, date, time, status, series_id FROM appointments_archive
+    """)
+
+    # One row per reminder sent; the primary key makes re-sends impossible
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS appointment_reminders(
+            appointment_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            sent_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(appointment_id, kind)
+        )
+    """)
+
+    # Appointment changes waiting for the patient's next digest email (see NotificationQueue).
+    # Rows still waiting are unique per (recipient, appointment), so later changes coalesce
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notification_queue(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            user_name TEXT NOT NULL,
+            appointment_id INTEGER NOT NULL,
+            doctor_name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            first_status TEXT,
+            status TEXT NOT NULL,
+            due_at REAL NOT NULL,
+            claimed_until REAL,
+            updates INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_queue_waiting
+        ON notification_queue(recipient, appointment_id) WHERE claimed_until IS NULL
+    """)
+
+    # Watermarks for background jobs: how far along (starts_at, id) each one has got
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_state(
+            name TEXT PRIMARY KEY,
+            starts_at TEXT NOT NULL,
+            appointment_id INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Whichever process holds a job's lease runs it; the others stand by until it lapses
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_leases(
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )
+    """)
+
+    # Waitlist: patients queue per doctor and date range; when a slot is freed the
+    # longest-waiting eligible patient gets a time-limited offer that holds it
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS waitlist(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            date_from TEXT NOT NULL,
+            date_to TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Waiting',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(doctor_id) REFERENCES doctors(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_waitlist_doctor_dates
+        ON waitlist(doctor_id, date_from, date_to) WHERE status = 'Waiting'
+    """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS unique_waitlist_entry
+        ON waitlist(user_id, doctor_id) WHERE status = 'Waiting'
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS waitlist_offers(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            waitlist_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Open',
+            expires_at TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(waitlist_id) REFERENCES waitlist(id)
+        )
+    """)
+    # At most one open offer holds a slot at a time
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS unique_open_offer
+        ON waitlist_offers(doctor_id, date, time) WHERE status = 'Open'
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_waitlist_offers_expiry
+        ON waitlist_offers(expires_at) WHERE status = 'Open'
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_offers_entry ON waitlist_offers(waitlist_id)")
+
+    # Background removal of a soft-deleted doctor's rows, with progress for the admin page
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deletion_jobs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            doctor_id INTEGER NOT NULL,
+            doctor_name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Queued',
+            total INTEGER,
+            processed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            heartbeat_at TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )
+    """)
+
+    # Outcomes of POSTs sent with an idempotency key, so retries replay instead of re-running
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys(
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            path TEXT NOT NULL,
+            status_code INTEGER,
+            location TEXT,
+            mimetype TEXT,
+            body TEXT,
+            flashes TEXT,
+            claimed_at REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(user_id, key)
+        ) WITHOUT ROWID
+    """)
+    # When the in-flight request took the key, so a claim left by a killed worker can be taken over
+    if "claimed_at" not in {row["name"] for row in cursor.execute("PRAGMA table_info(idempotency_keys)")}:
+        cursor.execute("ALTER TABLE idempotency_keys ADD COLUMN claimed_at REAL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys(created_at)")
+
+    # Create chat_logs table for AI chatbot
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            user_message TEXT,
+            ai_response TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    """)
+
+    # Create admin if not exists
+    cursor.execute("SELECT * FROM users WHERE email=?", ("admin@gmail.com",))
+    admin = cursor.fetchone()
+    if not admin:
+        cursor.execute("""
+            INSERT INTO users(name, email, password, role)
+            VALUES(?,?,?,?)
+        """, ("Admin", "admin@gmail.com", generate_password_hash("admin123", app.config['PASSWORD_HASH_METHOD']), "admin"))
+        print("✅ Admin user created")
+
+    # Add 7 sample doctors if table is empty
+    cursor.execute("SELECT COUNT(*) as count FROM doctors")
+    if cursor.fetchone()["count"] == 0:
+        sample_doctors = [
+            ("Dr. Sarah Wilson", "Cardiologist", "Mon, Wed, Fri", "9:00 AM - 12:00 PM, 2:00 PM - 5:00 PM"),
+            ("Dr. Michael Chen", "Dentist", "Tue, Thu, Sat", "10:00 AM - 1:00 PM, 3:00 PM - 6:00 PM"),
+            ("Dr. Emily Johnson", "Pediatrician", "Mon, Tue, Wed, Thu, Fri", "8:00 AM - 4:00 PM"),
+            ("Dr. Robert Brown", "Orthopedic Surgeon", "Mon, Wed, Fri", "10:00 AM - 2:00 PM, 4:00 PM - 7:00 PM"),
+            ("Dr. Priya Sharma", "Gynecologist", "Tue, Thu, Sat", "9:00 AM - 1:00 PM, 3:00 PM - 6:00 PM"),
+            ("Dr. David Lee", "Dermatologist", "Mon, Wed, Fri", "11:00 AM - 3:00 PM, 5:00 PM - 8:00 PM"),
+            ("Dr. James Miller", "General Physician", "Mon-Sat", "9:00 AM - 1:00 PM, 4:00 PM - 7:00 PM")
+        ]
+        for doctor in sample_doctors:
+            cursor.execute("""
+                INSERT INTO doctors(name, specialization, available_days, time_slots)
+                VALUES(?,?,?,?)
+            """, doctor)
+        print("✅ 7 sample doctors added to database!")
+
+    # Fill schedule summaries for doctors written before they existed (or by other tools)
+    stale = cursor.execute(
+        "SELECT id, available_days, time_slots FROM doctors WHERE weekday_mask IS NULL OR slots_per_day IS NULL"
+    ).fetchall()
+    if stale:
+        cursor.executemany("UPDATE doctors SET weekday_mask=?, slots_per_day=? WHERE id=?", [
+            (*doctor_schedule(row["available_days"], row["time_slots"]), row["id"]) for row in stale
+        ])
+
+    if not rollups_existed:
+        rebuild_rollups(conn)
+        print("✅ Analytics rollups built from existing appointments")
+
+    if cursor.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    conn.commit()
+    conn.close()
+
+# ========== IDEMPOTENCY KEYS ==========
+app.config['IDEMPOTENCY_TTL_HOURS'] = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+# A claim with no outcome after this long is presumed dead (its worker was killed) and a
+# retry takes it over. Far beyond any real request, so a slow one never runs twice
+app.config['IDEMPOTENCY_LEASE_SECONDS'] = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 300))
+# A retry that races the original gets 409 with this Retry-After instead of waiting
+app.config['IDEMPOTENCY_RETRY_AFTER_SECONDS'] = int(os.environ.get('IDEMPOTENCY_RETRY_AFTER_SECONDS', 2))
+
+_idempotency_pruned_at = 0
+
+# Forms render a fresh key each time: <input type="hidden" name="idempotency_key" value="{{ idempotency_key() }}">
+app.jinja_env.globals["idempotency_key"] = lambda: uuid.uuid4().hex
+
+def request_idempotency_key():
+    """The client's key from the Idempotency-Key header or the idempotency_key form field"""
+    key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key") or ""
+    return key.strip()[:128] or None
+
+def _replay_outcome(row):
+    for category, message in json.loads(row["flashes"] or "[]"):
+        flash(message, category)
+    response = Response(row["body"] or "", status=row["status_code"], mimetype=row["mimetype"])
+    if row["location"]:
+        response.headers["Location"] = row["location"]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def _claim_idempotency_key(user_id, key):
+    """None once this request owns the key; otherwise the response to send instead
+    (the stored outcome, or an error if the key is misused or still in flight)"""
+    global _idempotency_pruned_at
+    conn = get_db()
+    try:
+        if time_module.time() - _idempotency_pruned_at > 3600:
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)",
+                         (f"-{app.config['IDEMPOTENCY_TTL_HOURS']} hours",))
+            conn.commit()
+            _idempotency_pruned_at = time_module.time()
+
+        row = None
+        # Two tries: the original may let go of the key between our INSERT and SELECT
+        for _ in range(2):
+            claimed = conn.execute("""
+                INSERT INTO idempotency_keys(user_id, key, path, claimed_at) VALUES(?,?,?,?)
+                ON CONFLICT DO NOTHING RETURNING key
+            """, (user_id, key, request.path, time_module.time())).fetchone()
+            conn.commit()
+            if claimed:
+                return None
+            row = conn.execute("SELECT * FROM idempotency_keys WHERE user_id = ? AND key = ?", (user_id, key)).fetchone()
+            if row is not None:
+                break
+        if row is not None:
+            if row["path"] != request.path:
+                return jsonify({"error": "This idempotency key was already used for a different request"}), 422
+            if row["status_code"] is not None:
+                return _replay_outcome(row)
+            if time_module.time() - (row["claimed_at"] or 0) > app.config['IDEMPOTENCY_LEASE_SECONDS']:
+                # The original's worker died without recording an outcome; run the request here
+                taken = conn.execute("""
+                    UPDATE idempotency_keys SET claimed_at = ?
+                    WHERE user_id = ? AND key = ? AND status_code IS NULL AND claimed_at IS ?
+                    RETURNING key
+                """, (time_module.time(), user_id, key, row["claimed_at"])).fetchone()
+                conn.commit()
+                if taken:
+                    return None
+        # A double-submit racing the original: answer now rather than park this thread
+        if "Idempotency-Key" not in request.headers:
+            # A browser shows whichever response came last, so send the form back to its page
+            flash("⏳ Your previous request is still being processed. Refresh in a moment.", "danger")
+            return redirect(request.referrer or "/dashboard")
+        response = jsonify({"error": "The original request is still being processed"})
+        response.status_code = 409
+        response.headers["Retry-After"] = str(app.config['IDEMPOTENCY_RETRY_AFTER_SECONDS'])
+        return response
+    finally:
+        conn.close()
+
+def _finish_idempotency_key(user_id, key, response, flashes):
+    conn = get_db()
+    try:
+        if response is None or response.status_code >= 500:
+            # Nothing reliable to replay; let a retry run the request again
+            conn.execute("DELETE FROM idempotency_keys WHERE user_id = ? AND key = ?", (user_id, key))
+        else:
+            body = None if response.is_streamed or 300 <= response.status_code < 400 else response.get_data(as_text=True)
+            conn.execute("""
+                UPDATE idempotency_keys SET status_code = ?, location = ?, mimetype = ?, body = ?, flashes = ?
+                WHERE user_id = ? AND key = ?
+            """, (response.status_code, response.headers.get("Location"), response.mimetype, body,
+                  json.dumps(flashes), user_id, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+def idempotent(role=None):
+    """Run a POST at most once per (user, idempotency key). Retries and double-submits
+    get the first outcome back, flash messages included, from one primary-key lookup.
+    Requests the view would turn away (not logged in, or not `role`) never touch the
+    key table; the view answers them as usual."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            allowed = "user_id" in session and (role is None or session.get("role") == role)
+            key = request_idempotency_key() if request.method == "POST" and allowed else None
+            if key is None:
+                return view(*args, **kwargs)
+
+            user_id = session["user_id"]
+            replay = _claim_idempotency_key(user_id, key)
+            if replay is not None:
+                return replay
+
+            flashed_before = len(session.get("_flashes", []))
+            response = None
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                _finish_idempotency_key(user_id, key, response, session.get("_flashes", [])[flashed_before:])
+            return response
+        return wrapper
+    return decorator
+
+
+# ========== SLOT RULES ==========
+APPOINTMENT_STATUSES = ("Pending", "Approved", "Completed", "Cancelled")
+
+def normalize_slot_time(value):
+    """Turn user input like '2:30 pm' into the stored '02:30 PM' format (raises ValueError)"""
+    return datetime.strptime(value.strip().upper(), "%I:%M %p").strftime("%I:%M %p")
+
+def _parse_clock(value):
+    """Parse '9:00 AM', '9 AM' or '9AM' into minutes after midnight"""
+    value = value.strip().upper().replace(" ", "")
+    for fmt in ("%I:%M%p", "%I%p"):
+        try:
+            parsed = datetime.strptime(value, fmt)
+            return parsed.hour * 60 + parsed.minute
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time '{value}'")
+
+def expand_time_slots(time_ranges):
+    """Expand a doctor's '9:00 AM - 12:00 PM, 2:00 PM - 5:00 PM' into 30-minute slots.
+    Mirrors the slot generation in book_appointment.html."""
+    slots = []
+    for part in time_ranges.split(","):
+        bounds = part.split("-")
+        if len(bounds) != 2:
+            continue
+        try:
+            current, end = _parse_clock(bounds[0]), _parse_clock(bounds[1])
+        except ValueError:
+            continue
+        while current < end:
+            slots.append(datetime(2000, 1, 1, current // 60, current % 60).strftime("%I:%M %p"))
+            current += 30
+    return slots
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def parse_available_days(text):
+    """Turn 'Mon, Wed, Fri', 'Mon-Sat' or 'Monday - Friday' into weekday numbers (Mon=0)"""
+    days = set()
+    for part in text.lower().replace(" to ", "-").split(","):
+        bounds = [b.strip()[:3] for b in part.split("-")]
+        if any(b not in WEEKDAY_NAMES for b in bounds):
+            if part.strip() in ("daily", "everyday", "all days"):
+                return frozenset(range(7))
+            continue
+        first, last = WEEKDAY_NAMES.index(bounds[0]), WEEKDAY_NAMES.index(bounds[-1])
+        days.update(range(first, last + 1) if first <= last else [*range(first, 7), *range(0, last + 1)])
+    return frozenset(days)
+
+def doctor_schedule(available_days, time_slots):
+    """(weekday_mask, slots_per_day) stored alongside a doctor's free-text schedule"""
+    mask = sum(1 << day for day in parse_available_days(available_days))
+    return mask, len(expand_time_slots(time_slots))
+
+def find_slot_conflict(conn, user_id, doctor_id, date, time):
+    """Return 'user' if the patient is already booked at this time, 'doctor' if the
+    doctor's slot is taken, 'held' if it is offered to someone on the waitlist,
+    otherwise None. Cancelled appointments never conflict."""
+    if conn.execute("""
+        SELECT 1 FROM appointments
+        WHERE user_id = ? AND date = ? AND time = ?
+        AND status != 'Cancelled'
+    """, (user_id, date, time)).fetchone():
+        return "user"
+
+    if conn.execute("""
+        SELECT 1 FROM appointments
+        WHERE doctor_id = ? AND date = ? AND time = ?
+        AND status != 'Cancelled'
+    """, (doctor_id, date, time)).fetchone():
+        return "doctor"
+
+    if conn.execute("""
+        SELECT 1 FROM waitlist_offers
+        WHERE doctor_id = ? AND date = ? AND time = ? AND status = 'Open'
+        AND expires_at > ? AND user_id != ?
+    """, (doctor_id, date, time, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id)).fetchone():
+        return "held"
+    return None
+
+# Longest recurring series a patient can book in one go
+SERIES_MAX_OCCURRENCES = 52
+
+def series_dates(first_date, interval_weeks, occurrences, end_date=None):
+    """Visit dates for 'every N weeks, M times', stopping early at end_date (dates as 'YYYY-MM-DD')"""
+    first = datetime.strptime(first_date, "%Y-%m-%d").date()
+    last = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    dates = []
+    for k in range(min(occurrences, SERIES_MAX_OCCURRENCES)):
+        day = first + timedelta(weeks=interval_weeks * k)
+        if last and day > last:
+            break
+        dates.append(day.isoformat())
+    return dates
+
+def find_series_conflicts(conn, user_id, doctor_id, dates, time):
+    """find_slot_conflict for many dates at once: {date: 'user' | 'doctor' | 'held'} for every
+    date that cannot be booked, from a single query over a VALUES list of the dates"""
+    if not dates:
+        return {}
+    wanted = ",".join(["(?)"] * len(dates))
+    rows = conn.execute(f"""
+        WITH wanted(date) AS (VALUES {wanted})
+        SELECT w.date,
+            EXISTS (SELECT 1 FROM appointments a WHERE a.user_id = ? AND a.date = w.date AND a.time = ?
+                    AND a.status != 'Cancelled') AS user_busy,
+            EXISTS (SELECT 1 FROM appointments a WHERE a.doctor_id = ? AND a.date = w.date AND a.time = ?
+                    AND a.status != 'Cancelled') AS doctor_busy,
+            EXISTS (SELECT 1 FROM waitlist_offers o WHERE o.doctor_id = ? AND o.date = w.date AND o.time = ?
+                    AND o.status = 'Open' AND o.expires_at > ? AND o.user_id != ?) AS held
+        FROM wanted w
+    """, (*dates, user_id, time, doctor_id, time, doctor_id, time,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id))
+    conflicts = {}
+    for row in rows:
+        if row["user_busy"]:
+            conflicts[row["date"]] = "user"
+        elif row["doctor_busy"]:
+            conflicts[row["date"]] = "doctor"
+        elif row["held"]:
+            conflicts[row["date"]] = "held"
+    return conflicts
+
+
+# ========== APPOINTMENT EVENTS & LIVE STREAMS ==========
+app.config['EVENT_POLL_INTERVAL'] = float(os.environ.get('EVENT_POLL_INTERVAL', 1.0))
+app.config['EVENT_RETENTION_HOURS'] = int(os.environ.get('EVENT_RETENTION_HOURS', 24))
+app.config['SSE_HEARTBEAT_SECONDS'] = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+app.config['SSE_MAX_SECONDS'] = float(os.environ.get('SSE_MAX_SECONDS', 300))
+# Each open stream holds one of the worker's threads (GUNICORN_THREADS, see gunicorn.conf.py),
+# so only a quarter of them may stream; the rest stay free for ordinary requests
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', max(1, int(os.environ.get('GUNICORN_THREADS', 8)) // 4)))
+# Refused streams are told to come back after this long
+app.config['SSE_RETRY_SECONDS'] = int(os.environ.get('SSE_RETRY_SECONDS', 30))
+# Pages refused a stream poll /slots/changes this often meanwhile (no thread is held)
+app.config['SLOT_POLL_SECONDS'] = int(os.environ.get('SLOT_POLL_SECONDS', 10))
+
+def slot_change(old_status, new_status):
+    """'taken' or 'freed' when a transition changes whether the slot is occupied"""
+    was_active = old_status not in (None, "Cancelled")
+    is_active = new_status not in (None, "Cancelled")
+    if is_active and not was_active:
+        return "taken"
+    if was_active and not is_active:
+        return "freed"
+    return None
+
+def record_appointment_event(conn, appointment_id, user_id, doctor_id, date, time, old_status, new_status):
+    """Log a status transition inside the caller's transaction (new_status None = deleted)"""
+    conn.execute("""
+        INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+        VALUES(?,?,?,?,?,?,?)
+    """, (appointment_id, user_id, doctor_id, date, time, old_status, new_status))
+
+def latest_event_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) AS last FROM appointment_events").fetchone()["last"]
+
+class Subscription:
+    def __init__(self, matches):
+        self.matches = matches
+        self.queue = queue.Queue(maxsize=500)
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client; end its stream so it reconnects and replays from its cursor
+            self.overflowed = True
+
+class EventHub:
+    """One poller per worker process reads new appointment_events and fans them
+    out to every open stream, so N open pages cost one query per interval."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.has_subscribers = threading.Condition(self.lock)
+        self.subscribers = set()
+        self.pid = None
+        self.streams = 0
+        self.stats = Counter()
+
+    def open_stream(self):
+        """Reserve one of this worker's SSE_MAX_STREAMS thread-holding slots; False when all are taken"""
+        with self.lock:
+            if self.streams >= app.config['SSE_MAX_STREAMS']:
+                self.stats["refused"] += 1
+                return False
+            self.streams += 1
+            self.stats["opened"] += 1
+            return True
+
+    def close_stream(self):
+        with self.lock:
+            self.streams -= 1
+
+    def metrics(self):
+        with self.lock:
+            return {**self.stats, "open": self.streams, "limit": app.config['SSE_MAX_STREAMS'],
+                    "subscribers": len(self.subscribers)}
+
+    def subscribe(self, matches):
+        subscription = Subscription(matches)
+        with self.lock:
+            if self.pid != os.getpid():
+                # First stream in this worker (or we were forked): start the poller
+                self.pid = os.getpid()
+                self.subscribers = set()
+                threading.Thread(target=self._run, daemon=True).start()
+            self.subscribers.add(subscription)
+            self.has_subscribers.notify()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def _run(self):
+        conn = get_db()
+        last_id = None
+        last_prune = 0
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    last_id = None
+                    while not self.subscribers:
+                        self.has_subscribers.wait()
+                subscribers = list(self.subscribers)
+            try:
+                if last_id is None:
+                    # Streams replay their own backlog; the poller only needs what's new
+                    last_id = latest_event_id(conn)
+                for row in conn.execute("""
+                    SELECT * FROM appointment_events WHERE id > ? ORDER BY id LIMIT 500
+                """, (last_id,)).fetchall():
+                    event = dict(row)
+                    last_id = event["id"]
+                    for subscription in subscribers:
+                        if subscription.matches(event):
+                            subscription.push(event)
+
+                if time_module.time() - last_prune > 3600:
+                    conn.execute("DELETE FROM appointment_events WHERE created_at < datetime('now', ?)",
+                                 (f"-{app.config['EVENT_RETENTION_HOURS']} hours",))
+                    conn.commit()
+                    last_prune = time_module.time()
+            except Exception as e:
+                print(f"⚠️ Event poller error (retrying): {e}")
+            time_module.sleep(app.config['EVENT_POLL_INTERVAL'])
+
+event_hub = EventHub()
+
+def sse_message(event_id, event_name, payload):
+    return f"id: {event_id}\nevent: {event_name}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(matches, backlog, render):
+    """Stream `backlog` events, then live ones matching `matches`, as Server-Sent Events.
+    `render(event)` returns the SSE text for an event or None to skip it. When the
+    worker already has SSE_MAX_STREAMS open, answers 503 with Retry-After instead."""
+    if not event_hub.open_stream():
+        response = jsonify({"error": "Too many live updates open right now",
+                            "retry_after": app.config['SSE_RETRY_SECONDS']})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(app.config['SSE_RETRY_SECONDS'])
+        return response
+    subscription = event_hub.subscribe(matches)
+
+    def close():
+        event_hub.unsubscribe(subscription)
+        event_hub.close_stream()
+
+    def generate():
+        yield "retry: 3000\n\n"
+        seen = 0
+        for event in backlog:
+            seen = event["id"]
+            message = render(event)
+            if message:
+                yield message
+
+        # Streams end after a while so threads are recycled; EventSource reconnects with Last-Event-ID
+        deadline = time_module.monotonic() + app.config['SSE_MAX_SECONDS']
+        while time_module.monotonic() < deadline and not subscription.overflowed:
+            try:
+                event = subscription.queue.get(timeout=app.config['SSE_HEARTBEAT_SECONDS'])
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if event["id"] <= seen:
+                continue
+            message = render(event)
+            if message:
+                yield message
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs when the server closes the response, even if the body was never iterated
+    response.call_on_close(close)
+    return response
+
+def stream_cursor():
+    """Where a stream should resume: EventSource's Last-Event-ID, else ?since="""
+    value = request.headers.get("Last-Event-ID") or request.args.get("since") or ""
+    return int(value) if value.isdigit() else None
+
+
+# ========== SLOT OCCUPANCY CACHE ==========
+# Availability probes from the booking page are answered from memory. Each worker
+# checks the shared event log at most this often for changes made by other workers;
+# the booking itself still goes through find_slot_conflict and the unique index.
+app.config['OCCUPANCY_CHECK_SECONDS'] = float(os.environ.get('OCCUPANCY_CHECK_SECONDS', 0.5))
+app.config['OCCUPANCY_CACHE_KEYS'] = int(os.environ.get('OCCUPANCY_CACHE_KEYS', 20000))
+# Replaying more events than this is slower than starting over
+OCCUPANCY_REPLAY_LIMIT = 1000
+
+class OccupancyCache:
+    """
+    Booked times per (doctor_id, date) and per (user_id, date), each day loaded with
+    one query on first use. Doctor days also carry waitlist holds as time -> (holder,
+    expiry), so an offer stops blocking others the moment it lapses. Local writes
+    invalidate their keys directly; writes from other workers are picked up by
+    replaying appointment_events past the last id seen. A lapsed offer is passed on
+    without an event, so a cached day holding one is reloaded on its next probe.
+    Queries run outside the lock and their results are swapped in afterwards.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.pid = None
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.days = {"doctor_id": OrderedDict(), "user_id": OrderedDict()}
+        self.last_event_id = None
+        self.checked_at = 0
+        self.refreshing = False
+        # Bumped on every drop, so a day loaded across an invalidation is not stored
+        self.version = 0
+
+    def _refresh(self):
+        """Drop every key touched since the last check (throttled cross-worker event check)"""
+        with self.lock:
+            if self.refreshing or time_module.monotonic() - self.checked_at < app.config['OCCUPANCY_CHECK_SECONDS']:
+                return
+            self.refreshing = True
+            since = self.last_event_id
+            # Events older than the retention window may already be pruned
+            expired = time_module.monotonic() - self.checked_at > app.config['EVENT_RETENTION_HOURS'] * 1800
+        try:
+            conn = get_db()
+            try:
+                last = latest_event_id(conn)
+                reset = since is None or expired or not 0 <= last - since <= OCCUPANCY_REPLAY_LIMIT
+                events = [] if reset or last == since else conn.execute("""
+                    SELECT user_id, doctor_id, date, old_status, new_status FROM appointment_events
+                    WHERE id > ? AND id <= ?
+                """, (since, last)).fetchall()
+            finally:
+                conn.close()
+            with self.lock:
+                if reset:
+                    # First use or too far behind: start over
+                    self.days["doctor_id"].clear()
+                    self.days["user_id"].clear()
+                    self.version += 1
+                    self.stats["resets"] += 1
+                for event in events:
+                    if slot_change(event["old_status"], event["new_status"]):
+                        self._drop(event["doctor_id"], event["user_id"], event["date"])
+                self.last_event_id = last
+                self.checked_at = time_module.monotonic()
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def _drop(self, doctor_id, user_id, date):
+        self.days["doctor_id"].pop((doctor_id, date), None)
+        self.days["user_id"].pop((user_id, date), None)
+        self.version += 1
+
+    def _cached(self, column, key_id, date, now):
+        """A cached day, or None when it has to be (re)loaded. Caller holds the lock."""
+        days = self.days[column]
+        times = days.get((key_id, date))
+        if times is not None and any(held is not None and held[1] <= now for held in times.values()):
+            # A lapsed hold may have been passed to the next patient on the waitlist
+            del days[(key_id, date)]
+            times = None
+        if times is None:
+            self.stats["misses"] += 1
+            return None
+        days.move_to_end((key_id, date))
+        self.stats["hits"] += 1
+        return times
+
+    def _load(self, conn, column, key_id, date):
+        """Taken times for one doctor or patient on one day: time -> None when booked,
+        or (user_id, expires_at) when held by a waitlist offer"""
+        query = f"""
+            SELECT time, NULL AS user_id, NULL AS expires_at FROM appointments
+            WHERE {column} = ? AND date = ? AND status != 'Cancelled'
+        """
+        params = (key_id, date)
+        if column == "doctor_id":
+            query += """
+                UNION ALL
+                SELECT time, user_id, expires_at FROM waitlist_offers
+                WHERE doctor_id = ? AND date = ? AND status = 'Open'
+            """
+            params += (key_id, date)
+        times = {}
+        for row in conn.execute(query, params):
+            # A booking outranks a hold on the same time
+            if times.get(row["time"], ()) is not None:
+                times[row["time"]] = (row["user_id"], row["expires_at"]) if row["user_id"] else None
+        return times
+
+    def conflict(self, user_id, doctor_id, date, time):
+        """Same answer as find_slot_conflict, usually without touching the database"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self._reset()
+        self._refresh()
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        keys = (("user_id", user_id), ("doctor_id", doctor_id))
+        with self.lock:
+            found = {column: self._cached(column, key_id, date, now) for column, key_id in keys}
+            version = self.version
+        missing = [(column, key_id) for column, key_id in keys if found[column] is None]
+        if missing:
+            conn = get_db()
+            try:
+                for column, key_id in missing:
+                    found[column] = self._load(conn, column, key_id, date)
+            finally:
+                conn.close()
+            with self.lock:
+                # Skip storing if a write invalidated keys while we were reading
+                if self.pid == os.getpid() and self.version == version:
+                    for column, key_id in missing:
+                        days = self.days[column]
+                        days[(key_id, date)] = found[column]
+                        if len(days) > app.config['OCCUPANCY_CACHE_KEYS']:
+                            days.popitem(last=False)
+
+        if time in found["user_id"]:
+            return "user"
+        taken = found["doctor_id"]
+        if time not in taken:
+            return None
+        if taken[time] is None:
+            return "doctor"
+        holder, expires_at = taken[time]
+        if holder != user_id and expires_at > now:
+            return "held"
+        return None
+
+    def invalidate(self, doctor_id, user_id, date):
+        """Forget a day this worker just wrote to, so its own next probe reloads it"""
+        with self.lock:
+            if self.pid == os.getpid():
+                self._drop(doctor_id, user_id, date)
+
+    def clear(self):
+        with self.lock:
+            self.pid = None
+
+    def metrics(self):
+        with self.lock:
+            keys = sum(len(days) for days in self.days.values()) if self.pid == os.getpid() else 0
+            return {**self.stats, "keys": keys}
+
+occupancy_cache = OccupancyCache()
+
+
+# ========== WAITLIST ==========
+app.config['WAITLIST_OFFER_MINUTES'] = int(os.environ.get('WAITLIST_OFFER_MINUTES', 15))
+# Pages that read slots or offers pass lapsed offers on at most this often per worker
+app.config['WAITLIST_SWEEP_SECONDS'] = float(os.environ.get('WAITLIST_SWEEP_SECONDS', 15))
+# Longest date range a patient can wait on
+WAITLIST_MAX_DAYS = 60
+
+def offer_freed_slot(conn, doctor_id, date, time, now=None):
+    """
+    Inside the caller's write transaction: hold a just-freed slot for the patient who
+    has waited longest on this doctor and date, skipping anyone already offered it or
+    busy at that time. Returns the offer (with email details) or None.
+    """
+    now = now or datetime.now()
+    try:
+        if datetime.strptime(f"{date} {time}", "%Y-%m-%d %I:%M %p") <= now:
+            return None
+    except ValueError:
+        return None
+    # A lapsed offer nobody has swept yet must not block the next one
+    conn.execute("""
+        UPDATE waitlist_offers SET status = 'Expired'
+        WHERE doctor_id = ? AND date = ? AND time = ? AND status = 'Open' AND expires_at <= ?
+    """, (doctor_id, date, time, now.strftime("%Y-%m-%d %H:%M:%S")))
+    expires_at = (now + timedelta(minutes=app.config['WAITLIST_OFFER_MINUTES'])).strftime("%Y-%m-%d %H:%M:%S")
+    offer = conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        SELECT w.id, w.user_id, w.doctor_id, ?, ?, ?
+        FROM waitlist w
+        WHERE w.doctor_id = ? AND w.status = 'Waiting' AND w.date_from <= ? AND w.date_to >= ?
+          AND NOT EXISTS (SELECT 1 FROM waitlist_offers o WHERE o.waitlist_id = w.id AND o.date = ? AND o.time = ?)
+          AND NOT EXISTS (SELECT 1 FROM appointments a
+                          WHERE a.user_id = w.user_id AND a.date = ? AND a.time = ? AND a.status != 'Cancelled')
+          AND NOT EXISTS (SELECT 1 FROM appointments a
+                          WHERE a.doctor_id = w.doctor_id AND a.date = ? AND a.time = ? AND a.status != 'Cancelled')
+        ORDER BY w.id
+        LIMIT 1
+        ON CONFLICT DO NOTHING
+        RETURNING id, user_id, doctor_id, date, time, expires_at
+    """, (date, time, expires_at, doctor_id, date, date, date, time, date, time, date, time)).fetchone()
+    if not offer:
+        return None
+    names = conn.execute("""
+        SELECT users.email, users.name AS user_name, doctors.name AS doctor_name
+        FROM users, doctors WHERE users.id = ? AND doctors.id = ?
+    """, (offer["user_id"], offer["doctor_id"])).fetchone()
+    return {**dict(offer), **dict(names)} if names else None
+
+def notify_waitlist_offers(offers):
+    """Email each new offer right away; they expire too soon to wait for a digest"""
+    offers = [offer for offer in offers if offer]
+    if not offers:
+        return
+    template = email_template("email_waitlist_offer.html")
+    with app.app_context():
+        send_email_batch([
+            ("A slot just opened up for you! ⏱️", offer["email"],
+             template.render(minutes=app.config['WAITLIST_OFFER_MINUTES'], **offer))
+            for offer in offers
+        ])
+
+def expire_waitlist_offers(now=None):
+    """
+    Expire lapsed offers and pass each slot on to the next patient in line. Safe to run
+    from every worker: UPDATE ... RETURNING hands each lapsed offer to exactly one caller.
+    Returns how many offers lapsed.
+    """
+    now = now or datetime.now()
+    clock = now.strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    offers = []
+    try:
+        # Cheap indexed probe first so the common case never takes the write lock
+        if not conn.execute("SELECT 1 FROM waitlist_offers WHERE status = 'Open' AND expires_at <= ? LIMIT 1",
+                            (clock,)).fetchone():
+            return 0
+        conn.execute("BEGIN IMMEDIATE")
+        lapsed = conn.execute("""
+            UPDATE waitlist_offers SET status = 'Expired'
+            WHERE status = 'Open' AND expires_at <= ?
+            RETURNING doctor_id, date, time
+        """, (clock,)).fetchall()
+        for row in lapsed:
+            offers.append(offer_freed_slot(conn, row["doctor_id"], row["date"], row["time"], now))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    notify_waitlist_offers(offers)
+    return len(lapsed)
+
+_offers_swept_at = 0
+
+def sweep_lapsed_offers(force=False):
+    """expire_waitlist_offers() from the request path, so lapsed offers move on even when
+    no background sweeper runs. Throttled per worker to WAITLIST_SWEEP_SECONDS; the
+    common case is one indexed probe that finds nothing. Never fails the request."""
+    global _offers_swept_at
+    if not force and time_module.monotonic() - _offers_swept_at < app.config['WAITLIST_SWEEP_SECONDS']:
+        return 0
+    _offers_swept_at = time_module.monotonic()
+    try:
+        return expire_waitlist_offers()
+    except sqlite3.Error as e:
+        print(f"⚠️ Waitlist sweep skipped: {e}")
+        return 0
+
+@app.cli.command("expire-waitlist-offers")
+def expire_waitlist_offers_command():
+    """Pass lapsed waitlist offers on to the next patient (pages also do this as they are served)."""
+    init_db()
+    print(f"⏱️ Passed on {expire_waitlist_offers()} lapsed waitlist offer(s)")
+
+
+# ========== DOCTOR SEARCH ==========
+# Whether doctors_fts can be queried: None until the first search looks (and again
+# after init_db), since a process may be searching a database it never migrated
+DOCTOR_FTS = None
+
+def doctor_fts_available(conn):
+    """True when the database has the doctors_fts index and this SQLite can read it"""
+    global DOCTOR_FTS
+    if DOCTOR_FTS is None:
+        try:
+            DOCTOR_FTS = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='doctors_fts'").fetchone() is not None
+            if DOCTOR_FTS:
+                conn.execute("SELECT 1 FROM doctors_fts LIMIT 0").fetchall()
+        except sqlite3.OperationalError:
+            DOCTOR_FTS = False  # FTS5 missing from this SQLite build
+    return DOCTOR_FTS
+
+def _search_terms(query):
+    """Split free text into lowercase word tokens (punctuation and FTS syntax are dropped)"""
+    return "".join(c if c.isalnum() else " " for c in query.lower()).split()[:8]
+
+def doctor_match_sql(conn, terms):
+    """
+    SQL pieces (join, where, params, order) restricting `doctors` to rows matching
+    every term as a prefix, best matches first. Specialization hits outrank name
+    hits, which outrank schedule text.
+    """
+    if doctor_fts_available(conn):
+        match = " ".join(f'"{term}"*' for term in terms)
+        return ("JOIN doctors_fts ON doctors_fts.rowid = doctors.id", "doctors_fts MATCH ?", [match],
+                "bm25(doctors_fts, 5.0, 10.0, 1.0, 1.0)")
+    clauses = " AND ".join("(doctors.name LIKE ? OR doctors.specialization LIKE ?)" for _ in terms)
+    params = [value for term in terms for value in (f"%{term}%", f"%{term}%")]
+    return "", clauses, params, "doctors.id DESC"
+
+def search_doctors(conn, query, limit=20):
+    """Doctors matching every word of `query` as a prefix, best matches first"""
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    join, where, params, order = doctor_match_sql(conn, terms)
+    return conn.execute(f"""
+        SELECT doctors.* FROM doctors {join} WHERE {where} AND doctors.deleted_at IS NULL ORDER BY {order} LIMIT ?
+    """, (*params, limit)).fetchall()
+
+# ========== EARLIEST SLOT SEARCH ==========
+app.config['EARLIEST_SLOT_HORIZON_DAYS'] = int(os.environ.get('EARLIEST_SLOT_HORIZON_DAYS', 30))
+
+def specialty_stem(word):
+    """'dermatology' and 'Dermatologist' both become 'dermat', 'pediatrics' -> 'pediatr'"""
+    word = word.lower()
+    for suffix in ("ologist", "ology", "ician", "ists", "ist", "ics", "ic", "al", "y", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+class SlotBoard:
+    """
+    Per-worker occupancy bitmaps: for every doctor and working day in the horizon,
+    an int whose bit i is set when the doctor's i-th slot is taken. Built with one
+    indexed range scan, then kept current by replaying appointment_events, so it
+    follows bookings made in any worker. Any write to doctors bumps doctor_revision,
+    which triggers a rebuild. Open waitlist offers hold their slots too; they expire
+    on their own, so they are re-read on every sync instead.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.built_for = None
+
+    def _build(self, conn, today):
+        horizon = today + timedelta(days=app.config['EARLIEST_SLOT_HORIZON_DAYS'])
+        self.today, self.horizon = today, horizon
+        self.last_event_id = latest_event_id(conn)
+        self.doctors, self.by_stem, self.slot_index, self.taken = {}, {}, {}, {}
+        for row in conn.execute("""
+            SELECT id, name, specialization, time_slots, weekday_mask FROM doctors WHERE deleted_at IS NULL
+        """):
+            slots = sorted(set(expand_time_slots(row["time_slots"])), key=_parse_clock)
+            self.doctors[row["id"]] = {
+                "name": row["name"], "specialization": row["specialization"], "slots": slots,
+                "minutes": [_parse_clock(t) for t in slots], "all": (1 << len(slots)) - 1,
+                "weekday_mask": row["weekday_mask"] or 0,
+            }
+            self.slot_index[row["id"]] = {t: i for i, t in enumerate(slots)}
+            self.taken[row["id"]] = {}
+            for word in row["specialization"].split():
+                self.by_stem.setdefault(specialty_stem(word), set()).add(row["id"])
+        self.doctor_signature = self._doctor_signature(conn)
+
+        for row in conn.execute("""
+            SELECT doctor_id, date, time FROM appointments
+            WHERE starts_at >= ? AND starts_at < ? AND status != 'Cancelled'
+        """, (today.isoformat(), (horizon + timedelta(days=1)).isoformat())):
+            self._mark(row["doctor_id"], row["date"], row["time"], True)
+        self.built_for = today
+        self.synced_at = time_module.time()
+
+    def _doctor_signature(self, conn):
+        """Changes whenever a doctor is added, edited or removed (see trg_doctors_revision_*)"""
+        return conn.execute("SELECT revision FROM doctor_revision WHERE id = 1").fetchone()["revision"]
+
+    def _mark(self, doctor_id, date, time, taken):
+        index = self.slot_index.get(doctor_id, {}).get(time)
+        if index is None:
+            return  # unknown doctor, or a time outside the doctor's published slots
+        days = self.taken[doctor_id]
+        bits = days.get(date, 0)
+        days[date] = bits | (1 << index) if taken else bits & ~(1 << index)
+
+    def sync(self, conn):
+        """Bring the bitmaps up to date; rebuilds on a new day, fork, doctor edit or stale log"""
+        today = datetime.now().date()
+        fresh = self.pid == os.getpid() and self.built_for == today and \
+            time_module.time() - self.synced_at < app.config['EVENT_RETENTION_HOURS'] * 1800
+        if not fresh or self._doctor_signature(conn) != self.doctor_signature:
+            self.pid = os.getpid()
+            self._build(conn, today)
+        else:
+            for event in conn.execute("""
+                SELECT id, doctor_id, date, time, old_status, new_status FROM appointment_events WHERE id > ? ORDER BY id
+            """, (self.last_event_id,)).fetchall():
+                change = slot_change(event["old_status"], event["new_status"])
+                if change:
+                    self._mark(event["doctor_id"], event["date"], event["time"], change == "taken")
+                self.last_event_id = event["id"]
+            self.synced_at = time_module.time()
+        self.held = {}
+        for row in conn.execute("""
+            SELECT doctor_id, date, time FROM waitlist_offers WHERE status = 'Open' AND expires_at > ?
+        """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),)):
+            index = self.slot_index.get(row["doctor_id"], {}).get(row["time"])
+            if index is not None:
+                days = self.held.setdefault(row["doctor_id"], {})
+                days[row["date"]] = days.get(row["date"], 0) | (1 << index)
+
+    def _busy(self, doctor_id, date_str):
+        """Bits of the doctor's slots on `date_str` that are booked or held for an offer"""
+        return self.taken[doctor_id].get(date_str, 0) | self.held.get(doctor_id, {}).get(date_str, 0)
+
+    def doctors_for(self, specialization):
+        """Doctor ids whose specialization matches every word of the query by stem"""
+        matches = None
+        for word in specialization.split():
+            stem = specialty_stem(word)
+            ids = set().union(*(ids for key, ids in self.by_stem.items() if key.startswith(stem)))
+            matches = ids if matches is None else matches & ids
+        return matches or set()
+
+    def _next_free(self, doctor_id, day, first_index, now):
+        """(date, minutes, doctor_id, slot index, day) of the doctor's first free slot at or
+        after slot `first_index` on `day`, or None within the horizon. One bit trick per day."""
+        doctor = self.doctors[doctor_id]
+        while day <= self.horizon:
+            if doctor["weekday_mask"] & (1 << day.weekday()):
+                if day == now.date():
+                    # Slots that have already started today are not bookable
+                    first_index = max(first_index, bisect_right(doctor["minutes"], now.hour * 60 + now.minute))
+                date_str = day.isoformat()
+                free = doctor["all"] & ~self._busy(doctor_id, date_str) & ~((1 << first_index) - 1)
+                if free:
+                    index = (free & -free).bit_length() - 1
+                    return date_str, doctor["minutes"][index], doctor_id, index, day
+            day += timedelta(days=1)
+            first_index = 0
+        return None
+
+    def earliest(self, conn, specialization, limit=5, now=None):
+        """The `limit` earliest free slots across every doctor matching `specialization`:
+        a heap holding each doctor's next free slot, advanced only for the doctor popped"""
+        now = now or datetime.now()
+        with self.lock:
+            self.sync(conn)
+            heap = [slot for slot in (self._next_free(doctor_id, self.today, 0, now)
+                                      for doctor_id in self.doctors_for(specialization)) if slot]
+            heapq.heapify(heap)
+            results = []
+            while heap and len(results) < limit:
+                date, _, doctor_id, index, day = heapq.heappop(heap)
+                doctor = self.doctors[doctor_id]
+                results.append({"doctor_id": doctor_id, "doctor_name": doctor["name"],
+                                "specialization": doctor["specialization"], "date": date,
+                                "time": doctor["slots"][index]})
+                following = self._next_free(doctor_id, day, index + 1, now)
+                if following:
+                    heapq.heappush(heap, following)
+            return results
+
+    def open_today(self, conn, now=None):
+        """Ids of doctors with a slot left today that hasn't started yet, by the same
+        rule the doctor cards use for their "slots left today" line"""
+        now = now or datetime.now()
+        today, clock = now.date(), now.hour * 60 + now.minute
+        with self.lock:
+            self.sync(conn)
+            open_ids = set()
+            for doctor_id, doctor in self.doctors.items():
+                if not doctor["weekday_mask"] & (1 << today.weekday()):
+                    continue
+                started = (1 << bisect_right(doctor["minutes"], clock)) - 1
+                if doctor["all"] & ~self._busy(doctor_id, today.isoformat()) & ~started:
+                    open_ids.add(doctor_id)
+            return open_ids
+
+slot_board = SlotBoard()
+
+def find_specialty_in_message(conn, message):
+    """The first word of `message` that names a specialization on staff ('dermatology'), or None"""
+    with slot_board.lock:
+        slot_board.sync(conn)
+        stems = set(slot_board.by_stem)
+    for word in _search_terms(message):
+        if len(word) >= 3 and any(stem.startswith(specialty_stem(word)) for stem in stems):
+            return word
+    return None
+
+# ========== ANALYTICS ROLLUPS ==========
+# Lead times above this many days share one bucket
+LEAD_DAYS_CAP = 60
+
+def rebuild_rollups(conn):
+    """
+    Recompute the count rollups from hot and archived appointments, inside the
+    caller's transaction. Lead times cannot be recovered after the fact (bookings
+    don't store when they were made), so that table is left as is.
+    """
+    conn.execute("DELETE FROM doctor_daily_stats")
+    conn.execute("""
+        INSERT INTO doctor_daily_stats(doctor_id, date, requested, active, cancelled, completed)
+        SELECT doctor_id, date, COUNT(*),
+               SUM(status != 'Cancelled'), SUM(status = 'Cancelled'), SUM(status = 'Completed')
+        FROM appointment_history
+        GROUP BY doctor_id, date
+    """)
+    conn.execute("DELETE FROM demand_heatmap")
+    conn.execute("""
+        INSERT INTO demand_heatmap(doctor_id, weekday, hour, requested)
+        SELECT doctor_id, CAST(strftime('%w', date) AS INTEGER),
+               substr(time, 1, 2) % 12 + CASE WHEN substr(time, 7, 2) = 'PM' THEN 12 ELSE 0 END,
+               COUNT(*)
+        FROM appointment_history
+        GROUP BY 1, 2, 3
+    """)
+
+def _working_days(weekdays, start, end):
+    """Count dates in [start, end] that fall on one of the weekdays, grouped by ISO week"""
+    weeks = Counter()
+    day = start
+    while day <= end:
+        if day.weekday() in weekdays:
+            weeks[day.strftime("%G-W%V")] += 1
+        day += timedelta(days=1)
+    return weeks
+
+def analytics_report(conn, start, end, doctor_id=None):
+    """
+    Utilization and cancellations for [start, end] (date objects), plus demand and
+    lead times over all time: those rollups aren't kept per date, so they can't be
+    cut to the range and are marked "all_time". Reads only the rollup tables and the
+    doctors list.
+    """
+    doctor_filter, params = ("AND id = ?", (doctor_id,)) if doctor_id else ("", ())
+    doctors = {row["id"]: row for row in conn.execute(
+        f"SELECT id, name, specialization, available_days, time_slots FROM doctors WHERE deleted_at IS NULL {doctor_filter}",
+        params)}
+
+    per_doctor, weekly = {}, {}
+    for doctor in doctors.values():
+        slots_per_day = len(expand_time_slots(doctor["time_slots"]))
+        capacity_by_week = _working_days(parse_available_days(doctor["available_days"]), start, end)
+        per_doctor[doctor["id"]] = {
+            "doctor_id": doctor["id"], "name": doctor["name"], "specialization": doctor["specialization"],
+            "requested": 0, "active": 0, "cancelled": 0, "completed": 0,
+            "capacity": slots_per_day * sum(capacity_by_week.values()),
+        }
+        for week, days in capacity_by_week.items():
+            weekly[(doctor["id"], week)] = {"doctor_id": doctor["id"], "week": week, "active": 0,
+                                            "capacity": slots_per_day * days}
+
+    daily = {}
+    rows = conn.execute(f"""
+        SELECT doctor_id, date, requested, active, cancelled, completed
+        FROM doctor_daily_stats
+        WHERE date BETWEEN ? AND ? {"AND doctor_id = ?" if doctor_id else ""}
+    """, (start.isoformat(), end.isoformat(), *params))
+    for row in rows:
+        stats = per_doctor.get(row["doctor_id"])
+        if stats is None:
+            continue  # doctor has since been removed
+        for key in ("requested", "active", "cancelled", "completed"):
+            stats[key] += row[key]
+        day = daily.setdefault(row["date"], {"date": row["date"], "requested": 0, "active": 0, "cancelled": 0})
+        for key in ("requested", "active", "cancelled"):
+            day[key] += row[key]
+        week = weekly.get((row["doctor_id"], datetime.strptime(row["date"], "%Y-%m-%d").strftime("%G-W%V")))
+        if week:
+            week["active"] += row["active"]
+
+    def rates(item):
+        item["utilization"] = round(item["active"] / item["capacity"], 4) if item["capacity"] else None
+        if "requested" in item:
+            item["cancellation_rate"] = round(item["cancelled"] / item["requested"], 4) if item["requested"] else None
+        return item
+
+    heat_filter = "WHERE doctor_id = ?" if doctor_id else ""
+    heatmap = [[0] * 24 for _ in range(7)]
+    for row in conn.execute(f"""
+        SELECT weekday, hour, SUM(requested) AS requested FROM demand_heatmap {heat_filter} GROUP BY weekday, hour
+    """, params):
+        # strftime('%w') is Sunday=0; report Monday first like the rest of the app
+        heatmap[(row["weekday"] - 1) % 7][row["hour"]] = row["requested"]
+
+    lead_times = {row["lead_days"]: row["bookings"] for row in conn.execute(f"""
+        SELECT lead_days, SUM(bookings) AS bookings FROM booking_lead_times {heat_filter}
+        GROUP BY lead_days ORDER BY lead_days
+    """, params)}
+    lead_total = sum(lead_times.values())
+
+    totals = rates({key: sum(d[key] for d in per_doctor.values())
+                    for key in ("requested", "active", "cancelled", "completed", "capacity")})
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "totals": totals,
+        "doctors": sorted((rates(d) for d in per_doctor.values()),
+                          key=lambda d: d["utilization"] or 0, reverse=True),
+        "daily": [daily[key] for key in sorted(daily)],
+        "weekly": sorted((rates(w) for w in weekly.values()), key=lambda w: (w["week"], w["doctor_id"])),
+        "heatmap": {"period": "all_time", "weekdays": [d.title() for d in WEEKDAY_NAMES],
+                    "hours": list(range(24)), "requested": heatmap},
+        "lead_times": {
+            "period": "all_time",
+            "buckets": lead_times,
+            "average_days": round(sum(k * v for k, v in lead_times.items()) / lead_total, 2) if lead_total else None,
+            "cap_days": LEAD_DAYS_CAP,
+        },
+    }
+
+# ========== FAQ KNOWLEDGE BASE ==========
+# Messages the keyword rules don't recognise are matched against faq.json by
+# character n-gram TF-IDF, which tolerates typos ("migrane", "toothake")
+app.config['FAQ_PATH'] = os.environ.get('FAQ_PATH') or os.path.join(BASE_DIR, "faq.json")
+app.config['FAQ_MIN_SCORE'] = float(os.environ.get('FAQ_MIN_SCORE', 0.25))
+
+def char_ngrams(text, sizes=(3, 4)):
+    """Character n-grams of each word, padded so word starts and ends count"""
+    words = "".join(c if c.isalnum() else " " for c in text.lower()).split()
+    grams = []
+    for word in words:
+        padded = f" {word} "
+        for n in sizes:
+            grams.extend(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+    return grams
+
+# The chat window drops answers straight into innerHTML, so faq.json may only use
+# the markup the built-in replies use: bold, line breaks and links into the site
+FAQ_ALLOWED_MARKUP = {"b": set(), "br": set(), "a": {"href", "class", "style"}}
+FAQ_ALLOWED_LINKS = ("/", "tel:")
+
+class _FaqMarkupCheck(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.problems = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in FAQ_ALLOWED_MARKUP:
+            self.problems.append(f"<{tag}> is not allowed")
+            return
+        for name, value in attrs:
+            if name not in FAQ_ALLOWED_MARKUP[tag]:
+                self.problems.append(f"{name}= is not allowed on <{tag}>")
+            elif name == "href" and (not value or not value.startswith(FAQ_ALLOWED_LINKS) or value.startswith("//")):
+                self.problems.append(f"link to {value!r} leaves the site")
 
-    # Create chat_logs table for AI chatbot
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS chat_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            user_message TEXT,
-            ai_response TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    """)
+def faq_markup_problems(answer):
+    """Why `answer` can't be shown in the chat window as is (empty when it can)"""
+    check = _FaqMarkupCheck()
+    check.feed(answer)
+    check.close()
+    return check.problems
 
-    # Create admin if not exists
-    cursor.execute("SELECT * FROM users WHERE email=?", ("admin@gmail.com",))
-    admin = cursor.fetchone()
-    if not admin:
-        cursor.execute("""
-            INSERT INTO users(name, email, password, role)
-            VALUES(?,?,?,?)
-        """, ("Admin", "admin@gmail.com", generate_password_hash("admin123"), "admin"))
-        print("✅ Admin user created")
+class FaqIndex:
+    """
+    TF-IDF over every question and alternative phrasing, stored column-major (CSC):
+    for each n-gram, the rows containing it and their normalised weights. A query
+    only touches the columns of its own n-grams, and with NumPy the whole score
+    vector comes from one gather plus one bincount.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        row_entry, row_grams = [], []
+        for index, entry in enumerate(entries):
+            for phrasing in [entry["question"], *entry.get("alternatives", [])]:
+                grams = Counter(char_ngrams(phrasing))
+                if grams:
+                    row_entry.append(index)
+                    row_grams.append(grams)
 
-    # Add 7 sample doctors if table is empty
-    cursor.execute("SELECT COUNT(*) as count FROM doctors")
-    if cursor.fetchone()["count"] == 0:
-        sample_doctors = [
-            ("Dr. Sarah Wilson", "Cardiologist", "Mon, Wed, Fri", "9:00 AM - 12:00 PM, 2:00 PM - 5:00 PM"),
-            ("Dr. Michael Chen", "Dentist", "Tue, Thu, Sat", "10:00 AM - 1:00 PM, 3:00 PM - 6:00 PM"),
-            ("Dr. Emily Johnson", "Pediatrician", "Mon, Tue, Wed, Thu, Fri", "8:00 AM - 4:00 PM"),
-            ("Dr. Robert Brown", "Orthopedic Surgeon", "Mon, Wed, Fri", "10:00 AM - 2:00 PM, 4:00 PM - 7:00 PM"),
-            ("Dr. Priya Sharma", "Gynecologist", "Tue, Thu, Sat", "9:00 AM - 1:00 PM, 3:00 PM - 6:00 PM"),
-            ("Dr. David Lee", "Dermatologist", "Mon, Wed, Fri", "11:00 AM - 3:00 PM, 5:00 PM - 8:00 PM"),
-            ("Dr. James Miller", "General Physician", "Mon-Sat", "9:00 AM - 1:00 PM, 4:00 PM - 7:00 PM")
-        ]
-        for doctor in sample_doctors:
-            cursor.execute("""
-                INSERT INTO doctors(name, specialization, available_days, time_slots)
-                VALUES(?,?,?,?)
-            """, doctor)
-        print("✅ 7 sample doctors added to database!")
+        self.vocab = {}
+        rows, cols, tfs = [], [], []
+        for row, grams in enumerate(row_grams):
+            for gram, count in grams.items():
+                rows.append(row)
+                cols.append(self.vocab.setdefault(gram, len(self.vocab)))
+                tfs.append(1 + log(count))
 
-    conn.commit()
-    conn.close()
+        n_rows = len(row_grams)
+        df = Counter(cols)
+        self.idf = [log((1 + n_rows) / (1 + df[col])) + 1 for col in range(len(self.vocab))]
+        # Unseen n-grams still count towards the query's length, like any rare term
+        self.unseen_idf = log(1 + n_rows) + 1
+        self.n_rows = n_rows
+        self.row_entry = row_entry
+
+        values = [tf * self.idf[col] for tf, col in zip(tfs, cols)]
+        norms = [0.0] * n_rows
+        for row, value in zip(rows, values):
+            norms[row] += value * value
+        values = [value / sqrt(norms[row]) for row, value in zip(rows, values)]
+
+        self.vectorized = np is not None
+        if self.vectorized:
+            rows, cols, values = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(values)
+            order = np.argsort(cols, kind="stable")
+            self.indices, self.data = rows[order], values[order]
+            self.indptr = np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=len(self.vocab)))))
+            self.row_entry = np.array(row_entry, dtype=np.int64)
+        else:
+            self.postings = [[] for _ in self.vocab]
+            for row, col, value in zip(rows, cols, values):
+                self.postings[col].append((row, value))
+
+    def _query_vector(self, text):
+        grams = Counter(char_ngrams(text))
+        cols, weights, norm = [], [], 0.0
+        for gram, count in grams.items():
+            col = self.vocab.get(gram)
+            weight = (1 + log(count)) * (self.idf[col] if col is not None else self.unseen_idf)
+            norm += weight * weight
+            if col is not None:
+                cols.append(col)
+                weights.append(weight)
+        return cols, [w / sqrt(norm) for w in weights] if norm else weights
+
+    def search(self, text, limit=3):
+        """[(entry, cosine score)] for the best-matching entries, highest first"""
+        cols, weights = self._query_vector(text)
+        if not cols:
+            return []
+
+        if self.vectorized:
+            cols = np.array(cols, dtype=np.int64)
+            starts = self.indptr[cols]
+            lengths = self.indptr[cols + 1] - starts
+            # Positions of every posting of every query column, without a Python loop
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            scores = np.bincount(self.indices[offsets], minlength=self.n_rows,
+                                 weights=self.data[offsets] * np.repeat(weights, lengths))
+            candidates = min(self.n_rows, limit * 8)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            ranked = [(int(self.row_entry[row]), float(scores[row])) for row in top[np.argsort(-scores[top])]]
+        else:
+            scores = {}
+            for col, weight in zip(cols, weights):
+                for row, value in self.postings[col]:
+                    scores[row] = scores.get(row, 0.0) + weight * value
+            ranked = [(self.row_entry[row], score) for row, score in
+                      sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit * 8]]
 
+        # Several phrasings of one entry may match; keep each entry's best
+        results, seen = [], set()
+        for entry, score in ranked:
+            if entry not in seen and score > 0:
+                seen.add(entry)
+                results.append((self.entries[entry], score))
+                if len(results) == limit:
+                    break
+        return results
+
+_faq_index = None
+_faq_lock = threading.Lock()
+
+def load_faq_index(path=None):
+    """Build the FAQ index from the data file (once per process unless reloaded)"""
+    global _faq_index
+    path = path or app.config['FAQ_PATH']
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ FAQ knowledge base not loaded ({e})")
+        entries = []
+    usable = []
+    for entry in entries:
+        problems = faq_markup_problems(entry.get("answer", ""))
+        if problems:
+            print(f"⚠️ FAQ entry skipped ({entry.get('question')!r}): {'; '.join(problems)}")
+        else:
+            usable.append(entry)
+    index = FaqIndex(usable)
+    with _faq_lock:
+        _faq_index = index
+    return index
+
+def faq_answer(message):
+    """The best FAQ answer for `message`, or None below the confidence threshold"""
+    index = _faq_index or load_faq_index()
+    matches = index.search(message, limit=1)
+    if matches and matches[0][1] >= app.config['FAQ_MIN_SCORE']:
+        return matches[0][0]["answer"]
+    return None
 
 # -------------------- AI CHATBOT FUNCTIONS (YOUR ORIGINAL BUT ENHANCED) --------------------
 def ai_response(user_message, user_id=None):
@@ -203,6 +2686,39 @@ def ai_response(user_message, user_id=None):
     if any(k in message_lower for k in ["thank", "thanks", "helpful"]):
         return "You're very welcome! I'm glad I could help. Is there anything else you need assistance with? 😊"
 
+    specialties_list = {
+        "heart": "Cardiologist", "chest": "Cardiologist",
+        "tooth": "Dentist", "teeth": "Dentist", "dental": "Dentist",
+        "child": "Pediatrician", "kid": "Pediatrician",
+        "bone": "Orthopedic", "joint": "Orthopedic",
+        "skin": "Dermatologist", "rash": "Dermatologist",
+        "eye": "Ophthalmologist", "vision": "Ophthalmologist",
+        "ear": "ENT Specialist", "nose": "ENT Specialist", "throat": "ENT Specialist",
+        "stomach": "Gastroenterologist", "digestion": "Gastroenterologist"
+    }
+
+    # ========== EARLIEST AVAILABLE SLOTS ==========
+    if any(k in message_lower for k in ["soonest", "earliest", "first available", "next available", "asap", "as soon as"]):
+        try:
+            conn = get_db()
+            words = set(_search_terms(message_lower))
+            specialty = find_specialty_in_message(conn, message_lower) or next(
+                (spec for key, spec in specialties_list.items() if key in words), None)
+            openings = slot_board.earliest(conn, specialty, limit=3) if specialty else []
+            conn.close()
+        except Exception as e:
+            print(f"⚠️ Earliest slot lookup failed: {e}")
+            specialty, openings = None, []
+
+        if not specialty:
+            return "⏱️ <b>Looking for the soonest appointment?</b><br>Tell me the specialty, e.g. <i>\"earliest dermatologist\"</i> or <i>\"soonest dentist\"</i>."
+        if not openings:
+            return f"😔 No free <b>{specialty}</b> slots in the next {app.config['EARLIEST_SLOT_HORIZON_DAYS']} days.<br><br><a href='/doctors?q={specialty}' class='btn btn-primary' style='width:100%; text-align:center; padding:8px; display:inline-block;'>🔍 Browse Doctors</a>"
+        resp = f"⏱️ <b>Soonest openings for {openings[0]['specialization']}:</b><br>"
+        for slot in openings:
+            resp += f"<div style='background:rgba(255,255,255,0.05); padding:10px; border-radius:12px; margin:10px 0; border:1px solid var(--card-border);'><b>{slot['date']}</b> at {slot['time']}<br>{slot['doctor_name']}<br><a href='/book/{slot['doctor_id']}' style='color:var(--primary); font-size:0.85rem; font-weight:600; text-decoration:none;'>📅 Book this slot →</a></div>"
+        return resp
+
     # ========== APPOINTMENT BOOKING ==========
     if any(k in message_lower for k in ["how to book", "book an appointment", "booking", "schedule"]):
         return "📅 <b>To book an appointment:</b><br>1. Go to the <b>'Doctors'</b> page.<br>2. Choose your preferred specialist.<br>3. Select an available date and time slot.<br>4. Click 'Confirm Booking'.<br><br><a href='/doctors' class='btn btn-primary' style='width:100%; text-align:center; padding:10px; display:inline-block;'>🔍 Browse Doctors & Book</a>"
@@ -213,29 +2729,18 @@ def ai_response(user_message, user_id=None):
     if any(k in message_lower for k in ["book", "appointment", "schedule"]):
         try:
             conn = get_db()
-            count = conn.execute("SELECT COUNT(*) as count FROM doctors").fetchone()["count"]
+            count = conn.execute("SELECT COUNT(*) as count FROM doctors WHERE deleted_at IS NULL").fetchone()["count"]
             conn.close()
         except:
             count = "several"
         return f"📅 <b>Ready to book?</b><br>We have {count} specialists available for you.<br><br><a href='/doctors' class='btn btn-primary' style='width:100%; text-align:center; padding:10px; border-radius:12px; display:inline-block;'>🔍 Browse Doctors & Book</a>"
 
     # ========== DOCTOR SEARCH & SPECIALTIES ==========
-    specialties_list = {
-        "heart": "Cardiologist", "chest": "Cardiologist",
-        "tooth": "Dentist", "teeth": "Dentist", "dental": "Dentist",
-        "child": "Pediatrician", "kid": "Pediatrician",
-        "bone": "Orthopedic", "joint": "Orthopedic",
-        "skin": "Dermatologist", "rash": "Dermatologist",
-        "eye": "Ophthalmologist", "vision": "Ophthalmologist",
-        "ear": "ENT Specialist", "nose": "ENT Specialist", "throat": "ENT Specialist",
-        "stomach": "Gastroenterologist", "digestion": "Gastroenterologist"
-    }
-
     for key, spec in specialties_list.items():
         if key in message_lower:
             try:
                 conn = get_db()
-                docs = conn.execute("SELECT id, name FROM doctors WHERE specialization LIKE ? LIMIT 2", (f"%{spec.split()[0]}%",)).fetchall()
+                docs = search_doctors(conn, spec.split()[0], limit=2)
                 conn.close()
             except:
                 docs = []
@@ -255,7 +2760,7 @@ def ai_response(user_message, user_id=None):
         
         try:
             conn = get_db()
-            apps = conn.execute("SELECT a.date, a.time, a.status, d.name FROM appointments a JOIN doctors d ON a.doctor_id = d.id WHERE a.user_id = ? ORDER BY a.date DESC LIMIT 3", (user_id,)).fetchall()
+            apps = conn.execute("SELECT a.date, a.time, a.status, d.name FROM appointment_history a JOIN doctors d ON a.doctor_id = d.id WHERE a.user_id = ? ORDER BY a.date DESC LIMIT 3", (user_id,)).fetchall()
             conn.close()
             
             if apps:
@@ -291,6 +2796,11 @@ def ai_response(user_message, user_id=None):
     if any(k in message_lower for k in ["fever", "cough", "flu", "cold"]):
         return "🤒 <b>Fever & Cough Advice:</b><br>Monitor your temperature and get plenty of rest. If your fever exceeds 102°F (39°C), or you have difficulty breathing, please consult a doctor.<br><br><a href='/doctors' class='btn btn-primary' style='width:100%; text-align:center; display:inline-block;'>Book a Consultation</a>"
 
+    # ========== KNOWLEDGE BASE ==========
+    answer = faq_answer(user_message)
+    if answer:
+        return answer
+
     # ========== DEFAULT ==========
     return """
     <b>What can I help with?</b><br>
@@ -320,11 +2830,11 @@ def index():
     
     # Get stats for dashboard
     users_count = conn.execute("SELECT COUNT(*) as total FROM users WHERE role='user'").fetchone()["total"]
-    doctors_count = conn.execute("SELECT COUNT(*) as total FROM doctors").fetchone()["total"]
+    doctors_count = conn.execute("SELECT COUNT(*) as total FROM doctors WHERE deleted_at IS NULL").fetchone()["total"]
     appointments_count = conn.execute("SELECT COUNT(*) as total FROM appointments WHERE status!='Cancelled'").fetchone()["total"]
     
     # Get some doctors for display
-    doctors = conn.execute("SELECT * FROM doctors ORDER BY id DESC LIMIT 3").fetchall()
+    doctors = conn.execute("SELECT * FROM doctors WHERE deleted_at IS NULL ORDER BY id DESC LIMIT 3").fetchall()
     
     # Get today's booked slots count
     today = datetime.now().strftime("%Y-%m-%d")
@@ -399,7 +2909,11 @@ def register():
             flash("❌ Password must be at least 8 characters long!", "danger")
             return redirect("/register")
 
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = hash_password(password)
+        except RuntimeError:
+            flash("⏳ We're handling a lot of sign-ups right now. Please try again in a moment.", "danger")
+            return redirect("/register")
 
         try:
             conn = get_db()
@@ -439,9 +2953,20 @@ def login():
 
         conn = get_db()
         user = conn.execute("SELECT * FROM users WHERE email=?", (email,)).fetchone()
+
+        try:
+            valid = bool(user) and verify_password(user["password"], password)
+            # Upgrade hashes made with older parameters while we still have the plain password
+            if valid and password_needs_rehash(user["password"]):
+                conn.execute("UPDATE users SET password=? WHERE id=?", (hash_password(password), user["id"]))
+                conn.commit()
+        except RuntimeError:
+            conn.close()
+            flash("⏳ We're handling a lot of sign-ins right now. Please try again in a moment.", "danger")
+            return redirect("/login")
         conn.close()
 
-        if user and check_password_hash(user["password"], password):
+        if valid:
             session["user_id"] = user["id"]
             session["role"] = user["role"]
             session["name"] = user["name"]
@@ -470,21 +2995,22 @@ def dashboard():
     if "user_id" not in session:
         return redirect("/login")
 
+    sweep_lapsed_offers()
     conn = get_db()
     
-    # Get all appointments for the user
+    # Get all appointments for the user, including archived history
     appointments = conn.execute("""
-        SELECT appointments.*, doctors.name as doctor_name, doctors.specialization as doctor_specialization
-        FROM appointments
-        JOIN doctors ON doctors.id = appointments.doctor_id
-        WHERE appointments.user_id = ?
-        ORDER BY appointments.id DESC
+        SELECT a.*, doctors.name as doctor_name, doctors.specialization as doctor_specialization
+        FROM appointment_history a
+        JOIN doctors ON doctors.id = a.doctor_id
+        WHERE a.user_id = ?
+        ORDER BY a.id DESC
     """, (session["user_id"],)).fetchall()
     
     # Calculate specific stats
     today_str = datetime.now().strftime("%Y-%m-%d")
     today_count = conn.execute("SELECT COUNT(*) as count FROM appointments WHERE user_id=? AND date=? AND status!='Cancelled'", (session["user_id"], today_str)).fetchone()["count"]
-    completed_count = conn.execute("SELECT COUNT(*) as count FROM appointments WHERE user_id=? AND status='Completed'", (session["user_id"],)).fetchone()["count"]
+    completed_count = conn.execute("SELECT COUNT(*) as count FROM appointment_history WHERE user_id=? AND status='Completed'", (session["user_id"],)).fetchone()["count"]
     pending_count = conn.execute("SELECT COUNT(*) as count FROM appointments WHERE user_id=? AND status='Pending'", (session["user_id"],)).fetchone()["count"]
     
     # Get the "Next" upcoming appointment
@@ -498,49 +3024,178 @@ def dashboard():
         LIMIT 1
     """, (session["user_id"],)).fetchone()
     
+    waitlist_offers = conn.execute("""
+        SELECT o.id, o.date, o.time, o.expires_at, d.name AS doctor_name
+        FROM waitlist_offers o JOIN doctors d ON d.id = o.doctor_id
+        WHERE o.user_id = ? AND o.status = 'Open' AND o.expires_at > ?
+        ORDER BY o.expires_at
+    """, (session["user_id"], datetime.now().strftime("%Y-%m-%d %H:%M:%S"))).fetchall()
+    waitlist = conn.execute("""
+        SELECT w.id, w.doctor_id, w.date_from, w.date_to, d.name AS doctor_name
+        FROM waitlist w JOIN doctors d ON d.id = w.doctor_id
+        WHERE w.user_id = ? AND w.status = 'Waiting' AND w.date_to >= ?
+        ORDER BY w.date_from
+    """, (session["user_id"], today_str)).fetchall()
+
     conn.close()
 
     return render_template("user_dashboard.html", 
                           appointments=appointments,
+                          waitlist_offers=waitlist_offers,
+                          waitlist=waitlist,
                           today_count=today_count,
                           completed_count=completed_count,
                           pending_count=pending_count,
                           next_appt=next_appt)
 
 
+DOCTORS_PER_PAGE = 24
+# How far ahead the "next free slot" on each card looks
+NEXT_SLOT_LOOKAHEAD_DAYS = 14
+
+def doctor_availability(conn, doctors, now=None):
+    """
+    Next free slot and today's remaining capacity for just the given doctors, from
+    one indexed range query over their bookings in the lookahead window.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    horizon = today + timedelta(days=NEXT_SLOT_LOOKAHEAD_DAYS)
+    if not doctors:
+        return {}
+
+    booked = {}
+    marks = ",".join("?" * len(doctors))
+    for row in conn.execute(f"""
+        SELECT doctor_id, date, time FROM appointments
+        WHERE doctor_id IN ({marks}) AND date BETWEEN ? AND ? AND status != 'Cancelled'
+    """, (*[d["id"] for d in doctors], today.isoformat(), horizon.isoformat())):
+        booked.setdefault(row["doctor_id"], set()).add((row["date"], row["time"]))
+
+    clock = now.strftime("%H:%M")
+    summary = {}
+    for doctor in doctors:
+        taken = booked.get(doctor["id"], set())
+        slots = expand_time_slots(doctor["time_slots"])
+        mask = doctor["weekday_mask"] or 0
+        next_free, free_today = None, None
+        day = today
+        while day <= horizon and next_free is None:
+            if mask & (1 << day.weekday()):
+                date_str = day.isoformat()
+                open_slots = [t for t in slots if (date_str, t) not in taken
+                              and (day != today or datetime.strptime(t, "%I:%M %p").strftime("%H:%M") > clock)]
+                if day == today:
+                    free_today = len(open_slots)
+                if open_slots:
+                    next_free = {"date": date_str, "time": open_slots[0]}
+            day += timedelta(days=1)
+        summary[doctor["id"]] = {
+            "next_free": next_free,
+            "free_today": free_today or 0,
+            "works_today": bool(mask & (1 << today.weekday())),
+            "has_schedule": bool(mask and slots),
+            "slots_per_day": doctor["slots_per_day"] or 0,
+        }
+    return summary
+
 @app.route("/doctors")
 def doctors():
     conn = get_db()
-    doctors = conn.execute("SELECT * FROM doctors ORDER BY id DESC").fetchall()
-    
-    # Get today's booked slots count for each doctor
-    today = datetime.now().strftime("%Y-%m-%d")
-    booked_counts = {}
-    booked_slots_data = conn.execute("""
-        SELECT doctor_id, COUNT(*) as count 
-        FROM appointments 
-        WHERE date = ? AND status != 'Cancelled'
-        GROUP BY doctor_id
-    """, (today,)).fetchall()
-    
-    for row in booked_slots_data:
-        booked_counts[row["doctor_id"]] = row["count"]
-    
+    q = request.args.get("q", "").strip()
+    specialization = request.args.get("specialization", "").strip()
+    weekday = request.args.get("weekday", type=int)
+    free_today = request.args.get("free_today") == "1"
+    page = max(1, request.args.get("page", 1, type=int))
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+
+    join, where, params, order = "", ["doctors.deleted_at IS NULL"], [], "doctors.id DESC"
+    terms = _search_terms(q)
+    if terms:
+        join, match_where, params, order = doctor_match_sql(conn, terms)
+        where.append(match_where)
+    if specialization:
+        where.append("doctors.specialization = ?")
+        params.append(specialization)
+    if weekday is not None and 0 <= weekday <= 6:
+        where.append("doctors.weekday_mask & ? != 0")
+        params.append(1 << weekday)
+    if free_today:
+        # Slots that have already started today don't count, the same as on the cards
+        where.append("doctors.id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(sorted(slot_board.open_today(conn, now))))
+    filters = f"FROM doctors {join} WHERE {' AND '.join(where)}"
+
+    total = conn.execute(f"SELECT COUNT(*) as count {filters}", params).fetchone()["count"]
+    pages = max(1, -(-total // DOCTORS_PER_PAGE))
+    page = min(page, pages)
+    doctors = conn.execute(f"SELECT doctors.* {filters} ORDER BY {order} LIMIT ? OFFSET ?",
+                           (*params, DOCTORS_PER_PAGE, (page - 1) * DOCTORS_PER_PAGE)).fetchall()
+
+    availability = doctor_availability(conn, doctors, now)
+    earliest = slot_board.earliest(conn, specialization, limit=3, now=now) if specialization else []
+    specializations = [row["specialization"] for row in
+                       conn.execute("SELECT DISTINCT specialization FROM doctors WHERE deleted_at IS NULL ORDER BY specialization")]
     conn.close()
-    
-    return render_template("doctors.html", 
-                          doctors=doctors, 
-                          booked_counts=booked_counts,
-                          today=today)
+
+    # Keep the active filters on pagination links
+    query_args = {key: value for key, value in request.args.items() if key != "page" and value}
+    return render_template("doctors.html",
+                          doctors=doctors,
+                          availability=availability,
+                          earliest=earliest,
+                          specializations=specializations,
+                          weekdays=[d.title() for d in WEEKDAY_NAMES],
+                          filters={"q": q, "specialization": specialization, "weekday": weekday,
+                                   "free_today": free_today},
+                          query_args=query_args,
+                          page=page,
+                          pages=pages,
+                          total=total,
+                          today=today,
+                          q=q)
+
+
+@app.route("/api/earliest-slots")
+def earliest_slots():
+    """N earliest free slots across all doctors of a specialization, e.g. ?specialization=dermatology&limit=5"""
+    specialization = request.args.get("specialization", "").strip()
+    if not specialization:
+        return jsonify({"error": "specialization is required"}), 400
+    limit = max(1, min(request.args.get("limit", 5, type=int), 50))
+
+    conn = get_db()
+    slots = slot_board.earliest(conn, specialization, limit)
+    conn.close()
+    return jsonify({"specialization": specialization, "slots": slots})
+
+
+@app.route("/doctors/search")
+def doctors_search():
+    """JSON doctor search with prefix matching, e.g. /doctors/search?q=card"""
+    q = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    conn = get_db()
+    results = search_doctors(conn, q, limit)
+    conn.close()
+    return jsonify({
+        "query": q,
+        "results": [
+            {key: row[key] for key in ("id", "name", "specialization", "available_days", "time_slots")}
+            for row in results
+        ],
+    })
 
 
 @app.route("/book/<int:doctor_id>", methods=["GET", "POST"])
+@idempotent()
 def book_appointment(doctor_id):
     if "user_id" not in session:
         return redirect("/login")
 
     conn = get_db()
-    doctor = conn.execute("SELECT * FROM doctors WHERE id=?", (doctor_id,)).fetchone()
+    doctor = conn.execute("SELECT * FROM doctors WHERE id=? AND deleted_at IS NULL", (doctor_id,)).fetchone()
 
     if not doctor:
         flash("❌ Doctor not found!", "danger")
@@ -553,36 +3208,32 @@ def book_appointment(doctor_id):
         
         # Validate time format
         try:
-            time_obj = datetime.strptime(time.strip().upper(), "%I:%M %p")
-            time = time_obj.strftime("%I:%M %p")
+            time = normalize_slot_time(time)
         except ValueError:
             flash("❌ Please enter time in format like '10:00 AM' or '2:30 PM'", "danger")
             conn.close()
             return redirect(f"/book/{doctor_id}")
         
-        # Check if the user already has an appointment at this time (any doctor)
-        existing_user_appointment = conn.execute("""
-            SELECT * FROM appointments 
-            WHERE user_id = ? AND date = ? AND time = ? 
-            AND status != 'Cancelled'
-        """, (session["user_id"], date, time)).fetchone()
+        if request.form.get("repeat_weeks"):
+            return book_series(conn, doctor, date, time)
+
+        # Check the patient's own bookings (any doctor) and then this doctor's slot
+        conflict = find_slot_conflict(conn, session["user_id"], doctor_id, date, time)
         
-        if existing_user_appointment:
+        if conflict == "user":
             flash("❌ You already have an appointment booked at this time! Please choose another slot.", "danger")
             conn.close()
             return redirect(f"/book/{doctor_id}")
         
-        # Check if the slot is already booked with this doctor
-        existing_doctor_appointment = conn.execute("""
-            SELECT * FROM appointments 
-            WHERE doctor_id = ? AND date = ? AND time = ? 
-            AND status != 'Cancelled'
-        """, (doctor_id, date, time)).fetchone()
-        
-        if existing_doctor_appointment:
+        if conflict == "doctor":
             flash("❌ This time slot is already booked! Please choose another time.", "danger")
             conn.close()
             return redirect(f"/book/{doctor_id}")
+
+        if conflict == "held":
+            flash("❌ This time slot is being offered to a patient on the waitlist. Please choose another time.", "danger")
+            conn.close()
+            return redirect(f"/book/{doctor_id}")
         
         try:
             # Try to insert the appointment
@@ -591,7 +3242,17 @@ def book_appointment(doctor_id):
                 INSERT INTO appointments(user_id, doctor_id, date, time, status)
                 VALUES(?,?,?,?,?)
             """, (session["user_id"], doctor_id, date, time, "Pending"))
+            appointment_id = cursor.lastrowid
+            record_appointment_event(conn, appointment_id, session["user_id"], doctor_id, date, time, None, "Pending")
+            # Booking a slot you were offered counts as accepting the offer
+            for offer in conn.execute("""
+                UPDATE waitlist_offers SET status = 'Accepted'
+                WHERE doctor_id = ? AND date = ? AND time = ? AND user_id = ? AND status = 'Open'
+                RETURNING waitlist_id
+            """, (doctor_id, date, time, session["user_id"])).fetchall():
+                conn.execute("UPDATE waitlist SET status = 'Booked' WHERE id = ?", (offer["waitlist_id"],))
             conn.commit()
+            occupancy_cache.invalidate(doctor_id, session["user_id"], date)
             
             # Fetch user email for notification
             user_data = conn.execute("SELECT email, name FROM users WHERE id=?", (session["user_id"],)).fetchone()
@@ -599,23 +3260,8 @@ def book_appointment(doctor_id):
             if user_data:
                 # Wrap email in a try/except so email issues NEVER crash the booking
                 try:
-                    send_email(
-                        "Appointment Requested! 📅",
-                        user_data["email"],
-                        f"""
-                        <div style="font-family: sans-serif; color: #333; max-width: 600px; margin: auto; border: 1px solid #eee; padding: 20px; border-radius: 12px;">
-                            <h2 style="color: #4f46e5;">Booking Request Received</h2>
-                            <p>Hello {user_data['name']},</p>
-                            <p>Your appointment request has been successfully submitted. Here are the details:</p>
-                            <div style="background: #f9fafb; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                                <p style="margin: 5px 0;"><b>Doctor:</b> {doctor['name']}</p>
-                                <p style="margin: 5px 0;"><b>Date:</b> {date}</p>
-                                <p style="margin: 5px 0;"><b>Time:</b> {time}</p>
-                                <p style="margin: 5px 0;"><b>Status:</b> <span style="color: #eab308; font-weight: bold;">PENDING</span></p>
-                            </div>
-                        </div>
-                        """
-                    )
+                    queue_notification(user_data["email"], user_data["name"], appointment_id,
+                                       doctor["name"], date, time, None, "Pending")
                 except Exception as email_err:
                     print(f"⚠️ Email could not be initiated: {email_err}")
 
@@ -635,14 +3281,25 @@ def book_appointment(doctor_id):
         return redirect("/dashboard")
 
     # GET request - show booking form
-    # Get all booked slots for this doctor
+    sweep_lapsed_offers()
+    # The live slot stream resumes from this point, so nothing between render and connect is missed
+    last_event_id = latest_event_id(conn)
+
+    # Get all booked slots for this doctor, plus slots held for someone else's waitlist offer
     booked_slots_data = conn.execute("""
         SELECT date, time FROM appointments 
         WHERE doctor_id = ? AND status != 'Cancelled'
         AND date >= date('now')
+        UNION
+        SELECT date, time FROM waitlist_offers
+        WHERE doctor_id = ? AND status = 'Open' AND expires_at > ? AND user_id != ?
         ORDER BY date, time
-    """, (doctor_id,)).fetchall()
+    """, (doctor_id, doctor_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session["user_id"])).fetchall()
     
+    waitlist_entry = conn.execute("""
+        SELECT * FROM waitlist WHERE user_id = ? AND doctor_id = ? AND status = 'Waiting'
+    """, (session["user_id"], doctor_id)).fetchone()
+
     # Get user's own appointments to highlight conflicts
     user_upcoming_data = conn.execute("""
         SELECT date, time FROM appointments 
@@ -663,7 +3320,121 @@ def book_appointment(doctor_id):
                          doctor=doctor, 
                          booked_slots=booked_slots_list,
                          user_upcoming=user_upcoming_list,
-                         today=today)
+                         today=today,
+                         last_event_id=last_event_id,
+                         slot_poll_seconds=app.config['SLOT_POLL_SECONDS'],
+                         waitlist_entry=waitlist_entry,
+                         waitlist_max_days=WAITLIST_MAX_DAYS,
+                         series_max=SERIES_MAX_OCCURRENCES)
+
+
+def book_series(conn, doctor, first_date, time):
+    """POST /book with a repeat: check every visit in one query, then book the free
+    ones in one transaction and report the rest. Takes ownership of `conn`."""
+    user_id, doctor_id = session["user_id"], doctor["id"]
+    try:
+        interval_weeks = int(request.form.get("repeat_weeks", ""))
+        occurrences = int(request.form.get("occurrences") or SERIES_MAX_OCCURRENCES)
+        end_date = request.form.get("end_date") or None
+        dates = series_dates(first_date, interval_weeks, occurrences, end_date)
+    except ValueError:
+        dates = []
+    if len(dates) < 2 or not 1 <= interval_weeks <= 12:
+        flash("❌ A repeating booking needs at least 2 visits, every 1-12 weeks.", "danger")
+        conn.close()
+        return redirect(f"/book/{doctor_id}")
+    if doctor["weekday_mask"] and not doctor["weekday_mask"] & (1 << datetime.strptime(first_date, "%Y-%m-%d").weekday()):
+        flash(f"❌ {doctor['name']} does not work on that weekday ({doctor['available_days']}).", "danger")
+        conn.close()
+        return redirect(f"/book/{doctor_id}")
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conflicts = find_series_conflicts(conn, user_id, doctor_id, dates, time)
+        free = [date for date in dates if date not in conflicts]
+        if not free:
+            conn.rollback()
+            flash("❌ None of those dates are available at this time. Please choose another time.", "danger")
+            return redirect(f"/book/{doctor_id}")
+
+        series_id = conn.execute("""
+            INSERT INTO appointment_series(user_id, doctor_id, first_date, time, interval_weeks, occurrences, end_date)
+            VALUES(?,?,?,?,?,?,?)
+        """, (user_id, doctor_id, first_date, time, interval_weeks, len(dates), end_date)).lastrowid
+        values = ",".join(["(?)"] * len(free))
+        booked = conn.execute(f"""
+            INSERT INTO appointments(user_id, doctor_id, date, time, status, series_id)
+            SELECT ?, ?, column1, ?, 'Pending', ? FROM (VALUES {values})
+            RETURNING id, date
+        """, (user_id, doctor_id, time, series_id, *free)).fetchall()
+        conn.executemany("""
+            INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+            VALUES(?,?,?,?,?,NULL,'Pending')
+        """, [(row["id"], user_id, doctor_id, row["date"], time) for row in booked])
+        user_data = conn.execute("SELECT email, name FROM users WHERE id=?", (user_id,)).fetchone()
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        flash("❌ One of those slots was just booked by someone else. Please try again.", "danger")
+        return redirect(f"/book/{doctor_id}")
+    finally:
+        conn.close()
+
+    for row in booked:
+        occupancy_cache.invalidate(doctor_id, user_id, row["date"])
+    if user_data:
+        # The digest window folds these into a single email
+        queue_notifications([(user_data["email"], user_data["name"], row["id"], doctor["name"],
+                              row["date"], time, None, "Pending") for row in booked])
+
+    flash(f"✅ Booked {len(booked)} of {len(dates)} visits every {interval_weeks} week(s) at {time}!", "success")
+    if conflicts:
+        reasons = {"user": "you're busy", "doctor": "already booked", "held": "on hold for the waitlist"}
+        skipped = ", ".join(f"{date} ({reasons[why]})" for date, why in sorted(conflicts.items()))
+        flash(f"⚠️ Skipped {len(conflicts)} date(s): {skipped}", "danger")
+    return redirect("/dashboard")
+
+
+@app.route("/cancel-series/<int:series_id>")
+def cancel_series(series_id):
+    """Cancel every upcoming visit in a recurring series at once"""
+    if "user_id" not in session:
+        return redirect("/login")
+
+    user_id = session["user_id"]
+    today = datetime.now().strftime("%Y-%m-%d")
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    upcoming = conn.execute("""
+        SELECT appointments.id, appointments.doctor_id, appointments.date, appointments.time, appointments.status,
+               users.email, users.name AS user_name, doctors.name AS doctor_name
+        FROM appointments
+        JOIN users ON users.id = appointments.user_id
+        JOIN doctors ON doctors.id = appointments.doctor_id
+        WHERE appointments.series_id = ? AND appointments.user_id = ?
+        AND appointments.status IN ('Pending', 'Approved') AND appointments.date >= ?
+    """, (series_id, user_id, today)).fetchall()
+    conn.execute("""
+        UPDATE appointments SET status = 'Cancelled'
+        WHERE series_id = ? AND user_id = ? AND status IN ('Pending', 'Approved') AND date >= ?
+    """, (series_id, user_id, today))
+    conn.executemany("""
+        INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+        VALUES(?,?,?,?,?,?,'Cancelled')
+    """, [(r["id"], user_id, r["doctor_id"], r["date"], r["time"], r["status"]) for r in upcoming])
+    offers = [offer_freed_slot(conn, r["doctor_id"], r["date"], r["time"]) for r in upcoming]
+    conn.execute("UPDATE appointment_series SET status = 'Cancelled' WHERE id = ? AND user_id = ?", (series_id, user_id))
+    conn.commit()
+    conn.close()
+
+    for r in upcoming:
+        occupancy_cache.invalidate(r["doctor_id"], user_id, r["date"])
+    queue_notifications([(r["email"], r["user_name"], r["id"], r["doctor_name"], r["date"], r["time"],
+                          r["status"], "Cancelled") for r in upcoming])
+    notify_waitlist_offers(offers)
+
+    flash(f"✅ Cancelled {len(upcoming)} upcoming visit(s) in the series!", "success")
+    return redirect("/dashboard")
 
 
 @app.route("/check-slot-availability/<int:doctor_id>", methods=["POST"])
@@ -681,41 +3452,31 @@ def check_slot_availability(doctor_id):
     
     # Validate time format
     try:
-        time_obj = datetime.strptime(time.strip().upper(), "%I:%M %p")
-        time = time_obj.strftime("%I:%M %p")
+        time = normalize_slot_time(time)
     except ValueError:
         return jsonify({"available": False, "message": "Invalid time format. Use '10:00 AM' format"})
     
-    conn = get_db()
-    
-    # Check user's own appointments
-    user_conflict = conn.execute("""
-        SELECT * FROM appointments 
-        WHERE user_id = ? AND date = ? AND time = ? 
-        AND status != 'Cancelled'
-    """, (session["user_id"], date, time)).fetchone()
+    sweep_lapsed_offers()
+    # Served from the per-worker cache; booking re-checks against the database
+    conflict = occupancy_cache.conflict(session["user_id"], doctor_id, date, time)
     
-    if user_conflict:
-        conn.close()
+    if conflict == "user":
         return jsonify({
             "available": False, 
             "message": "You already have an appointment at this time!"
         })
     
-    # Check doctor's availability
-    doctor_conflict = conn.execute("""
-        SELECT * FROM appointments 
-        WHERE doctor_id = ? AND date = ? AND time = ? 
-        AND status != 'Cancelled'
-    """, (doctor_id, date, time)).fetchone()
-    
-    conn.close()
-    
-    if doctor_conflict:
+    if conflict == "doctor":
         return jsonify({
             "available": False, 
             "message": "This time slot is already booked!"
         })
+
+    if conflict == "held":
+        return jsonify({
+            "available": False,
+            "message": "This time slot is on hold for a patient on the waitlist."
+        })
     
     return jsonify({
         "available": True, 
@@ -723,46 +3484,243 @@ def check_slot_availability(doctor_id):
     })
 
 
-@app.route("/cancel/<int:appointment_id>")
-def cancel_appointment(appointment_id):
+@app.route("/slots/stream/<int:doctor_id>")
+def slot_stream(doctor_id):
+    """Server-Sent Events: slots taken or freed for one doctor within a date window"""
+    if "user_id" not in session:
+        return jsonify({"error": "Please login first"}), 401
+
+    date_from = request.args.get("from") or datetime.now().strftime("%Y-%m-%d")
+    date_to = request.args.get("to") or "9999-12-31"
+    try:
+        for value in (date_from, date_to):
+            datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Dates must look like 2024-05-31"}), 400
+
+    def matches(event):
+        return (event["doctor_id"] == doctor_id and date_from <= event["date"] <= date_to
+                and slot_change(event["old_status"], event["new_status"]) is not None)
+
+    def render(event):
+        return sse_message(event["id"], "slot", {
+            "date": event["date"],
+            "time": event["time"],
+            "state": slot_change(event["old_status"], event["new_status"]),
+        })
+
+    backlog = []
+    cursor = stream_cursor()
+    if cursor is not None:
+        conn = get_db()
+        backlog = [dict(row) for row in conn.execute("""
+            SELECT * FROM appointment_events
+            WHERE id > ? AND doctor_id = ? AND date BETWEEN ? AND ?
+            ORDER BY id LIMIT 1000
+        """, (cursor, doctor_id, date_from, date_to))]
+        conn.close()
+        backlog = [event for event in backlog if matches(event)]
+
+    return sse_response(matches, backlog, render)
+
+
+@app.route("/slots/changes/<int:doctor_id>")
+def slot_changes(doctor_id):
+    """Polling fallback for pages the stream turned away: the same slot changes as
+    /slots/stream, past ?since= (an event id), answered at once from one range scan"""
+    if "user_id" not in session:
+        return jsonify({"error": "Please login first"}), 401
+
+    date_from = request.args.get("from") or datetime.now().strftime("%Y-%m-%d")
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return jsonify({"error": "since must be an event id"}), 400
+
+    conn = get_db()
+    head = latest_event_id(conn)
+    rows = conn.execute("""
+        SELECT id, date, time, old_status, new_status FROM appointment_events
+        WHERE id > ? AND id <= ? AND doctor_id = ? AND date >= ?
+        ORDER BY id LIMIT 500
+    """, (int(since), head, doctor_id, date_from)).fetchall()
+    conn.close()
+    # Unless the page was cut short, the cursor moves to the head of the log even when
+    # nothing here concerned this doctor
+    last_id = rows[-1]["id"] if len(rows) == 500 else max(int(since), head)
+
+    changes = [{"id": row["id"], "date": row["date"], "time": row["time"],
+                "state": slot_change(row["old_status"], row["new_status"])}
+               for row in rows if slot_change(row["old_status"], row["new_status"])]
+    return jsonify({"changes": changes, "last_event_id": last_id,
+                    "poll_seconds": app.config['SLOT_POLL_SECONDS']})
+
+
+@app.route("/cancel/<int:appointment_id>")
+def cancel_appointment(appointment_id):
+    if "user_id" not in session:
+        return redirect("/login")
+
+    conn = get_db()
+    # Get appointment info for the email
+    appointment_data = conn.execute("""
+        SELECT users.email, users.name as user_name, doctors.name as doctor_name, appointments.date, appointments.time,
+               appointments.doctor_id, appointments.status
+        FROM appointments 
+        JOIN users ON users.id = appointments.user_id 
+        JOIN doctors ON doctors.id = appointments.doctor_id 
+        WHERE appointments.id = ? AND appointments.user_id = ?
+    """, (appointment_id, session["user_id"])).fetchone()
+
+    conn.execute("UPDATE appointments SET status='Cancelled' WHERE id=? AND user_id=?",
+                 (appointment_id, session["user_id"]))
+    offer = None
+    if appointment_data and appointment_data["status"] != "Cancelled":
+        record_appointment_event(conn, appointment_id, session["user_id"], appointment_data["doctor_id"],
+                                 appointment_data["date"], appointment_data["time"],
+                                 appointment_data["status"], "Cancelled")
+        offer = offer_freed_slot(conn, appointment_data["doctor_id"], appointment_data["date"], appointment_data["time"])
+    conn.commit()
+    conn.close()
+    if appointment_data:
+        occupancy_cache.invalidate(appointment_data["doctor_id"], session["user_id"], appointment_data["date"])
+    notify_waitlist_offers([offer])
+
+    if appointment_data and appointment_data["status"] != "Cancelled":
+        queue_notification(appointment_data["email"], appointment_data["user_name"], appointment_id,
+                           appointment_data["doctor_name"], appointment_data["date"], appointment_data["time"],
+                           appointment_data["status"], "Cancelled")
+
+    flash("✅ Appointment cancelled!", "success")
+    return redirect("/dashboard")
+
+
+# -------------------- WAITLIST ROUTES --------------------
+@app.route("/waitlist/<int:doctor_id>", methods=["POST"])
+def join_waitlist(doctor_id):
+    if "user_id" not in session:
+        return redirect("/login")
+
+    date_from, date_to = request.form.get("date_from", ""), request.form.get("date_to", "")
+    try:
+        first = datetime.strptime(date_from, "%Y-%m-%d").date()
+        last = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except ValueError:
+        flash("❌ Please choose the dates you could make.", "danger")
+        return redirect(f"/book/{doctor_id}")
+    if first < datetime.now().date() or last < first or (last - first).days >= WAITLIST_MAX_DAYS:
+        flash(f"❌ Choose a range of up to {WAITLIST_MAX_DAYS} days, starting today or later.", "danger")
+        return redirect(f"/book/{doctor_id}")
+
+    conn = get_db()
+    if not conn.execute("SELECT 1 FROM doctors WHERE id=? AND deleted_at IS NULL", (doctor_id,)).fetchone():
+        conn.close()
+        flash("❌ Doctor not found!", "danger")
+        return redirect("/doctors")
+    # Re-joining keeps your place in line and just moves the dates
+    conn.execute("""
+        INSERT INTO waitlist(user_id, doctor_id, date_from, date_to) VALUES(?,?,?,?)
+        ON CONFLICT(user_id, doctor_id) WHERE status = 'Waiting'
+        DO UPDATE SET date_from = excluded.date_from, date_to = excluded.date_to
+    """, (session["user_id"], doctor_id, date_from, date_to))
+    conn.commit()
+    conn.close()
+
+    flash("✅ You're on the waitlist! We'll email you the moment a slot opens up.", "success")
+    return redirect(f"/book/{doctor_id}")
+
+@app.route("/waitlist/leave/<int:waitlist_id>", methods=["POST"])
+def leave_waitlist(waitlist_id):
+    if "user_id" not in session:
+        return redirect("/login")
+
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("UPDATE waitlist SET status = 'Left' WHERE id = ? AND user_id = ? AND status = 'Waiting'",
+                 (waitlist_id, session["user_id"]))
+    # Anything still on hold for you goes to the next patient
+    offers = [offer_freed_slot(conn, row["doctor_id"], row["date"], row["time"]) for row in conn.execute("""
+        UPDATE waitlist_offers SET status = 'Declined'
+        WHERE waitlist_id = ? AND user_id = ? AND status = 'Open'
+        RETURNING doctor_id, date, time
+    """, (waitlist_id, session["user_id"])).fetchall()]
+    conn.commit()
+    conn.close()
+    notify_waitlist_offers(offers)
+
+    flash("✅ You've left the waitlist.", "success")
+    return redirect("/dashboard")
+
+@app.route("/waitlist/offers/<int:offer_id>/accept", methods=["POST"])
+@idempotent()
+def accept_waitlist_offer(offer_id):
+    if "user_id" not in session:
+        return redirect("/login")
+
+    user_id = session["user_id"]
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        offer = conn.execute("""
+            SELECT waitlist_offers.*, doctors.name AS doctor_name FROM waitlist_offers
+            JOIN doctors ON doctors.id = waitlist_offers.doctor_id
+            WHERE waitlist_offers.id = ? AND waitlist_offers.user_id = ?
+        """, (offer_id, user_id)).fetchone()
+        if not offer or offer["status"] != "Open" or offer["expires_at"] <= now:
+            conn.rollback()
+            if offer and offer["status"] == "Open":
+                # Lapsed but not swept yet: hand it on now, as the message says
+                sweep_lapsed_offers(force=True)
+            flash("❌ Sorry, this offer has expired and the slot went to the next patient.", "danger")
+            return redirect("/dashboard")
+        if find_slot_conflict(conn, user_id, offer["doctor_id"], offer["date"], offer["time"]) == "user":
+            conn.rollback()
+            flash("❌ You already have an appointment booked at this time!", "danger")
+            return redirect("/dashboard")
+
+        appointment_id = conn.execute("""
+            INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES(?,?,?,?,?)
+        """, (user_id, offer["doctor_id"], offer["date"], offer["time"], "Pending")).lastrowid
+        record_appointment_event(conn, appointment_id, user_id, offer["doctor_id"], offer["date"], offer["time"],
+                                 None, "Pending")
+        conn.execute("UPDATE waitlist_offers SET status = 'Accepted' WHERE id = ?", (offer_id,))
+        conn.execute("UPDATE waitlist SET status = 'Booked' WHERE id = ?", (offer["waitlist_id"],))
+        user_data = conn.execute("SELECT email, name FROM users WHERE id=?", (user_id,)).fetchone()
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        flash("❌ This time slot was just booked by someone else.", "danger")
+        return redirect("/dashboard")
+    finally:
+        conn.close()
+
+    occupancy_cache.invalidate(offer["doctor_id"], user_id, offer["date"])
+    if user_data:
+        queue_notification(user_data["email"], user_data["name"], appointment_id, offer["doctor_name"],
+                           offer["date"], offer["time"], None, "Pending")
+    flash("✅ Appointment booked from the waitlist!", "success")
+    return redirect("/dashboard")
+
+@app.route("/waitlist/offers/<int:offer_id>/decline", methods=["POST"])
+def decline_waitlist_offer(offer_id):
     if "user_id" not in session:
         return redirect("/login")
 
     conn = get_db()
-    # Get appointment info for the email
-    appointment_data = conn.execute("""
-        SELECT users.email, users.name as user_name, doctors.name as doctor_name, appointments.date, appointments.time 
-        FROM appointments 
-        JOIN users ON users.id = appointments.user_id 
-        JOIN doctors ON doctors.id = appointments.doctor_id 
-        WHERE appointments.id = ? AND appointments.user_id = ?
-    """, (appointment_id, session["user_id"])).fetchone()
-
-    conn.execute("UPDATE appointments SET status='Cancelled' WHERE id=? AND user_id=?",
-                 (appointment_id, session["user_id"]))
+    conn.execute("BEGIN IMMEDIATE")
+    declined = conn.execute("""
+        UPDATE waitlist_offers SET status = 'Declined'
+        WHERE id = ? AND user_id = ? AND status = 'Open'
+        RETURNING doctor_id, date, time
+    """, (offer_id, session["user_id"])).fetchone()
+    offer = offer_freed_slot(conn, declined["doctor_id"], declined["date"], declined["time"]) if declined else None
     conn.commit()
     conn.close()
+    if declined:
+        occupancy_cache.invalidate(declined["doctor_id"], session["user_id"], declined["date"])
+    notify_waitlist_offers([offer])
 
-    if appointment_data:
-        send_email(
-            "Appointment Cancelled ❌",
-            appointment_data["email"],
-            f"""
-            <div style="font-family: sans-serif; color: #333; max-width: 600px; margin: auto; border: 1px solid #eee; padding: 20px; border-radius: 12px;">
-                <h2 style="color: #ef4444;">Appointment Cancelled</h2>
-                <p>Hello {appointment_data['user_name']},</p>
-                <p>Your appointment has been successfully cancelled as requested.</p>
-                <div style="background: #f9fafb; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <p style="margin: 5px 0;"><b>Doctor:</b> Dr. {appointment_data['doctor_name']}</p>
-                    <p style="margin: 5px 0;"><b>Date:</b> {appointment_data['date']}</p>
-                    <p style="margin: 5px 0;"><b>Time:</b> {appointment_data['time']}</p>
-                </div>
-                <p>If you wish to book a new appointment, please visit our website.</p>
-            </div>
-            """
-        )
-
-    flash("✅ Appointment cancelled!", "success")
+    flash("✅ Offer declined. You're still on the waitlist for other slots.", "success")
     return redirect("/dashboard")
 
 
@@ -821,10 +3779,13 @@ def admin_dashboard():
         return redirect("/login")
 
     conn = get_db()
+    # One read transaction: the counters, the table and the feed cursor all describe the same moment
+    conn.execute("BEGIN")
+    last_event_id = latest_event_id(conn)
 
     users_count = conn.execute("SELECT COUNT(*) as total FROM users WHERE role='user'").fetchone()["total"]
-    doctors_count = conn.execute("SELECT COUNT(*) as total FROM doctors").fetchone()["total"]
-    appointments_count = conn.execute("SELECT COUNT(*) as total FROM appointments").fetchone()["total"]
+    doctors_count = conn.execute("SELECT COUNT(*) as total FROM doctors WHERE deleted_at IS NULL").fetchone()["total"]
+    appointments_count = conn.execute("SELECT COUNT(*) as total FROM appointment_history").fetchone()["total"]
 
     appointments = conn.execute("""
         SELECT appointments.*, users.name as user_name, doctors.name as doctor_name
@@ -839,13 +3800,21 @@ def admin_dashboard():
     today_str = datetime.now().strftime("%Y-%m-%d")
     today_appts = conn.execute("SELECT COUNT(*) as total FROM appointments WHERE date = ? AND status != 'Cancelled'", (today_str,)).fetchone()["total"]
     pending_appts = conn.execute("SELECT COUNT(*) as total FROM appointments WHERE status = 'Pending'").fetchone()["total"]
-    completed_appts = conn.execute("SELECT COUNT(*) as total FROM appointments WHERE status = 'Completed'").fetchone()["total"]
+    completed_appts = conn.execute("SELECT COUNT(*) as total FROM appointment_history WHERE status = 'Completed'").fetchone()["total"]
     
     # Get all doctors for display
-    doctors = conn.execute("SELECT * FROM doctors ORDER BY id DESC").fetchall()
+    doctors = conn.execute("SELECT * FROM doctors WHERE deleted_at IS NULL ORDER BY id DESC").fetchall()
+    deletion_jobs = conn.execute("""
+        SELECT * FROM deletion_jobs WHERE status != 'Done' OR finished_at > datetime('now', 'localtime', '-1 day')
+        ORDER BY id DESC LIMIT 10
+    """).fetchall()
 
     conn.close()
 
+    # A removal whose worker died carries on once an admin is looking at it
+    if any(deletion_job_stalled(job) for job in deletion_jobs):
+        threading.Thread(target=resume_deletion_jobs, daemon=True).start()
+
     return render_template("admin_dashboard.html",
                            users_count=users_count,
                            doctors_count=doctors_count,
@@ -853,7 +3822,270 @@ def admin_dashboard():
                            pending_appts=pending_appts,
                            completed_appts=completed_appts,
                            appointments=appointments,
-                           doctors=doctors)
+                           doctors=doctors,
+                           deletion_jobs=deletion_jobs,
+                           last_event_id=last_event_id)
+
+
+def _admin_feed_item(conn, event, names):
+    """Describe one appointment change for the admin dashboard, including counter deltas"""
+    def name_of(table, row_id):
+        key = (table, row_id)
+        if key not in names:
+            row = conn.execute(f"SELECT name FROM {table} WHERE id=?", (row_id,)).fetchone()
+            names[key] = row["name"] if row else "Unknown"
+        return names[key]
+
+    old_status, new_status = event["old_status"], event["new_status"]
+    change = slot_change(old_status, new_status)
+    today = datetime.now().strftime("%Y-%m-%d")
+    deltas = {
+        "today": (1 if change == "taken" else -1 if change == "freed" else 0) if event["date"] == today else 0,
+        "pending": (new_status == "Pending") - (old_status == "Pending"),
+        "completed": (new_status == "Completed") - (old_status == "Completed"),
+    }
+    return {
+        "event_id": event["id"],
+        "appointment_id": event["appointment_id"],
+        "kind": "created" if old_status is None else "deleted" if new_status is None else "updated",
+        "status": new_status,
+        "old_status": old_status,
+        "date": event["date"],
+        "time": event["time"],
+        "user_id": event["user_id"],
+        "user_name": name_of("users", event["user_id"]),
+        "doctor_name": name_of("doctors", event["doctor_id"]),
+        "deltas": deltas,
+    }
+
+@app.route("/admin/feed")
+def admin_feed():
+    """Long-poll: appointment changes after ?cursor=, waiting up to ?wait= seconds for new ones"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Admin access required"}), 401
+
+    cursor = request.args.get("cursor", "")
+    try:
+        wait = min(float(request.args.get("wait") or 0), 30.0)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    conn = get_db()
+    cursor = int(cursor) if cursor.isdigit() else latest_event_id(conn)
+    events = conn.execute("""
+        SELECT * FROM appointment_events WHERE id > ? ORDER BY id LIMIT 200
+    """, (cursor,)).fetchall()
+    conn.close()
+
+    # A parked request holds a thread like a stream does, so it takes a stream slot;
+    # with none free the client just gets an empty answer and polls again
+    if not events and wait > 0 and event_hub.open_stream():
+        # Park on the shared poller instead of re-querying in a loop
+        subscription = event_hub.subscribe(lambda event: event["id"] > cursor)
+        try:
+            subscription.queue.get(timeout=wait)
+        except queue.Empty:
+            pass
+        finally:
+            event_hub.unsubscribe(subscription)
+            event_hub.close_stream()
+        conn = get_db()
+        events = conn.execute("""
+            SELECT * FROM appointment_events WHERE id > ? ORDER BY id LIMIT 200
+        """, (cursor,)).fetchall()
+        conn.close()
+
+    names = {}
+    items = []
+    if events:
+        conn = get_db()
+        items = [_admin_feed_item(conn, dict(event), names) for event in events]
+        conn.close()
+    return jsonify({"cursor": items[-1]["event_id"] if items else cursor, "events": items})
+
+@app.route("/admin/feed/stream")
+def admin_feed_stream():
+    """Server-Sent Events version of /admin/feed for the live dashboard"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Admin access required"}), 401
+
+    names = {}
+    backlog = []
+    cursor = stream_cursor()
+    if cursor is not None:
+        conn = get_db()
+        backlog = [dict(row) for row in conn.execute("""
+            SELECT * FROM appointment_events WHERE id > ? ORDER BY id LIMIT 1000
+        """, (cursor,))]
+        conn.close()
+
+    def render(event):
+        # Streams stay open for minutes; only hold a connection while describing an event
+        conn = get_db()
+        try:
+            return sse_message(event["id"], "appointment", _admin_feed_item(conn, event, names))
+        finally:
+            conn.close()
+
+    return sse_response(lambda event: True, backlog, render)
+
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    """Runtime counters for this worker process"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect("/login")
+
+    return jsonify({
+        "pid": os.getpid(),
+        "password_hashing": password_hash_metrics(),
+        "notifications": notification_queue.metrics(),
+        "occupancy_cache": occupancy_cache.metrics(),
+        "compression": compression.metrics(),
+        "streams": event_hub.metrics(),
+    })
+
+
+# -------------------- HEALTH CHECKS --------------------
+app.config['READY_CACHE_SECONDS'] = float(os.environ.get('READY_CACHE_SECONDS', 2))
+app.config['READY_MAX_DB_MS'] = float(os.environ.get('READY_MAX_DB_MS', 250))
+app.config['READY_MAX_LOCK_WAIT_MS'] = float(os.environ.get('READY_MAX_LOCK_WAIT_MS', 1000))
+app.config['READY_MAX_EMAIL_QUEUE'] = int(os.environ.get('READY_MAX_EMAIL_QUEUE', 1000))
+app.config['READY_MAX_POOL_SATURATION'] = float(os.environ.get('READY_MAX_POOL_SATURATION', 0.9))
+
+_readiness_lock = threading.Lock()
+_readiness = {"at": 0.0, "result": None, "probing": False, "lock_busy_since": None}
+
+def readiness_report():
+    """Probe the things that make this worker unable to serve; cheap enough to run every few seconds"""
+    checks, failures = {}, []
+
+    started = time_module.perf_counter()
+    try:
+        conn = get_db()
+        try:
+            schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            checks["db_ms"] = round((time_module.perf_counter() - started) * 1000, 2)
+
+            # Is a writer holding the lock? busy_timeout 0 means the probe never queues
+            # behind (or ahead of) real writers; it only touches the lock when it's free
+            conn.execute("PRAGMA busy_timeout = 0")
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.rollback()
+                _readiness["lock_busy_since"] = None
+            except sqlite3.OperationalError:
+                if _readiness["lock_busy_since"] is None:
+                    _readiness["lock_busy_since"] = time_module.monotonic()
+            # Seen held on every probe since then: roughly how long writers have been waiting
+            busy_since = _readiness["lock_busy_since"]
+            checks["lock_wait_ms"] = 0.0 if busy_since is None else \
+                round((time_module.monotonic() - busy_since) * 1000, 2)
+        finally:
+            conn.close()
+        checks["schema_version"] = schema_version
+        if schema_version < SCHEMA_VERSION:
+            failures.append(f"database schema {schema_version} is behind {SCHEMA_VERSION}")
+    except sqlite3.Error as e:
+        checks["db_ms"] = None
+        failures.append(f"database unavailable: {e}")
+
+    if checks.get("db_ms") is not None and checks["db_ms"] > app.config['READY_MAX_DB_MS']:
+        failures.append("database round trip above READY_MAX_DB_MS")
+    if checks.get("lock_wait_ms") is not None and checks["lock_wait_ms"] > app.config['READY_MAX_LOCK_WAIT_MS']:
+        failures.append("write lock wait above READY_MAX_LOCK_WAIT_MS")
+
+    checks["email_queue"] = notification_queue.metrics()["pending_items"]
+    if checks["email_queue"] is not None and checks["email_queue"] > app.config['READY_MAX_EMAIL_QUEUE']:
+        failures.append("email queue above READY_MAX_EMAIL_QUEUE")
+
+    checks["hash_pool_saturation"] = round(_hash_stats["in_flight"] / max(1, app.config['PASSWORD_HASH_QUEUE_LIMIT']), 2)
+    if checks["hash_pool_saturation"] > app.config['READY_MAX_POOL_SATURATION']:
+        failures.append("password hashing pool above READY_MAX_POOL_SATURATION")
+
+    return {"status": "fail" if failures else "ok", "pid": os.getpid(), "checks": checks,
+            "failures": failures, "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests. No I/O."""
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 503 when the database, write lock, email queue or hashing pool is
+    past its threshold. Cached for READY_CACHE_SECONDS so probes stay cheap; one
+    request refreshes a stale result while the others answer from the cache."""
+    with _readiness_lock:
+        refresh = not _readiness["probing"] and \
+            time_module.monotonic() - _readiness["at"] >= app.config['READY_CACHE_SECONDS']
+        if refresh:
+            _readiness["probing"] = True
+        result = _readiness["result"]
+    if refresh or result is None:
+        try:
+            result = readiness_report()
+            with _readiness_lock:
+                _readiness["result"], _readiness["at"] = result, time_module.monotonic()
+        finally:
+            if refresh:
+                with _readiness_lock:
+                    _readiness["probing"] = False
+    response = jsonify(result)
+    response.status_code = 503 if result["failures"] else 200
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def _analytics_range():
+    """?from=&to= (YYYY-MM-DD) or ?days=N ending today; raises ValueError"""
+    today = datetime.now().date()
+    end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else today
+    if request.args.get("from"):
+        start = datetime.strptime(request.args["from"], "%Y-%m-%d").date()
+    else:
+        start = end - timedelta(days=max(1, min(int(request.args.get("days", 30)), 366)) - 1)
+    if start > end or (end - start).days > 366:
+        raise ValueError("Choose a range of at most one year")
+    return start, end
+
+@app.route("/admin/analytics")
+def admin_analytics():
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect("/login")
+
+    try:
+        start, end = _analytics_range()
+    except ValueError:
+        flash("❌ Invalid date range.", "danger")
+        return redirect("/admin/analytics")
+
+    conn, snapshot = get_report_db()
+    report = analytics_report(conn, start, end)
+    conn.close()
+    response = make_response(render_template("admin_analytics.html", report=report,
+                                             snapshot=os.path.basename(snapshot) if snapshot else None))
+    if snapshot:
+        response.headers["X-Report-Snapshot"] = os.path.basename(snapshot)
+    return response
+
+@app.route("/admin/analytics/data")
+def admin_analytics_data():
+    """JSON version of the analytics page; optional ?doctor_id="""
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Admin login required"}), 401
+
+    try:
+        start, end = _analytics_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn, snapshot = get_report_db()
+    report = analytics_report(conn, start, end, request.args.get("doctor_id", type=int))
+    conn.close()
+    response = jsonify(report)
+    if snapshot:
+        response.headers["X-Report-Snapshot"] = os.path.basename(snapshot)
+    return response
 
 
 @app.route("/admin/add-doctor", methods=["GET", "POST"])
@@ -869,9 +4101,9 @@ def add_doctor():
 
         conn = get_db()
         conn.execute("""
-            INSERT INTO doctors(name, specialization, available_days, time_slots)
-            VALUES(?,?,?,?)
-        """, (name, specialization, available_days, time_slots))
+            INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+            VALUES(?,?,?,?,?,?)
+        """, (name, specialization, available_days, time_slots, *doctor_schedule(available_days, time_slots)))
         conn.commit()
         conn.close()
 
@@ -882,6 +4114,7 @@ def add_doctor():
 
 
 @app.route("/admin/update-status/<int:appointment_id>", methods=["POST"])
+@idempotent(role="admin")
 def update_status(appointment_id):
     if "user_id" not in session or session.get("role") != "admin":
         return redirect("/login")
@@ -891,7 +4124,8 @@ def update_status(appointment_id):
     conn = get_db()
     # Get user email and appointment info before update
     appointment_data = conn.execute("""
-        SELECT users.email, users.name as user_name, doctors.name as doctor_name, appointments.date, appointments.time 
+        SELECT users.email, users.name as user_name, doctors.name as doctor_name, appointments.date, appointments.time,
+               appointments.user_id, appointments.doctor_id, appointments.status
         FROM appointments 
         JOIN users ON users.id = appointments.user_id 
         JOIN doctors ON doctors.id = appointments.doctor_id 
@@ -899,41 +4133,124 @@ def update_status(appointment_id):
     """, (appointment_id,)).fetchone()
     
     conn.execute("UPDATE appointments SET status=? WHERE id=?", (status, appointment_id))
+    offer = None
+    if appointment_data and appointment_data["status"] != status:
+        record_appointment_event(conn, appointment_id, appointment_data["user_id"], appointment_data["doctor_id"],
+                                 appointment_data["date"], appointment_data["time"],
+                                 appointment_data["status"], status)
+        if slot_change(appointment_data["status"], status) == "freed":
+            offer = offer_freed_slot(conn, appointment_data["doctor_id"], appointment_data["date"], appointment_data["time"])
     conn.commit()
     conn.close()
-    
     if appointment_data:
-        status_color = "#22c55e" if status == "Confirmed" else "#ef4444"
-        send_email(
-            f"Appointment {status}! 🩺",
-            appointment_data["email"],
-            f"""
-            <div style="font-family: sans-serif; color: #333; max-width: 600px; margin: auto; border: 1px solid #eee; padding: 20px; border-radius: 12px;">
-                <h2 style="color: {status_color};">Appointment {status}</h2>
-                <p>Hello {appointment_data['user_name']},</p>
-                <p>The status of your appointment with <b>Dr. {appointment_data['doctor_name']}</b> has been updated.</p>
-                <div style="background: #f9fafb; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                    <p style="margin: 5px 0;"><b>Date:</b> {appointment_data['date']}</p>
-                    <p style="margin: 5px 0;"><b>Time:</b> {appointment_data['time']}</p>
-                    <p style="margin: 5px 0;"><b>New Status:</b> <span style="color: {status_color}; text-transform: uppercase; font-weight: bold;">{status}</span></p>
-                </div>
-                {"<p>We look forward to seeing you!</p>" if status == "Confirmed" else "<p>If you have any questions, please contact our support team.</p>"}
-            </div>
-            """
-        )
+        occupancy_cache.invalidate(appointment_data["doctor_id"], appointment_data["user_id"], appointment_data["date"])
+    notify_waitlist_offers([offer])
+    
+    if appointment_data and appointment_data["status"] != status:
+        queue_notification(appointment_data["email"], appointment_data["user_name"], appointment_id,
+                           appointment_data["doctor_name"], appointment_data["date"], appointment_data["time"],
+                           appointment_data["status"], status)
     
     flash(f"✅ Appointment status updated to {status}!", "success")
     return redirect("/admin")
 
+BULK_STATUS_CHUNK = 500
+
+@app.route("/admin/update-status/bulk", methods=["POST"])
+@idempotent(role="admin")
+def bulk_update_status():
+    """Apply one status to many appointments in a single transaction and notify in one batch"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect("/login")
+
+    payload = request.get_json(silent=True) if request.is_json else None
+
+    def respond(message, category, code=200, **extra):
+        if payload is not None:
+            return jsonify({"message": message, **extra}), code
+        flash(message, category)
+        return redirect("/admin")
+
+    if payload is not None:
+        if not isinstance(payload, dict) or not isinstance(payload.get("appointment_ids", []), list):
+            return respond('❌ Send a JSON object like {"appointment_ids": [1, 2], "status": "Approved"}.',
+                           "danger", 400)
+        raw_ids, status = payload.get("appointment_ids", []), payload.get("status")
+    else:
+        raw_ids, status = request.form.getlist("appointment_ids"), request.form.get("status")
+    ids = sorted({int(i) for i in raw_ids if str(i).isdigit()})
+
+    if status not in APPOINTMENT_STATUSES:
+        return respond("❌ Please choose a valid status.", "danger", 400)
+    if not ids:
+        return respond("❌ Select at least one appointment.", "danger", 400)
+
+    changed, offers = [], []
+    conn = get_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for start in range(0, len(ids), BULK_STATUS_CHUNK):
+            chunk = ids[start:start + BULK_STATUS_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            # Previous status + notification details, read under the same write lock
+            before = {row["id"]: row for row in conn.execute(f"""
+                SELECT appointments.id, appointments.user_id, appointments.doctor_id, appointments.date,
+                       appointments.time, appointments.status, users.email, users.name as user_name,
+                       doctors.name as doctor_name
+                FROM appointments
+                JOIN users ON users.id = appointments.user_id
+                JOIN doctors ON doctors.id = appointments.doctor_id
+                WHERE appointments.id IN ({marks}) AND appointments.status != ?
+            """, (*chunk, status))}
+            updated = conn.execute(f"""
+                UPDATE appointments SET status = ?
+                WHERE id IN ({marks}) AND status != ?
+                RETURNING id
+            """, (status, *chunk, status)).fetchall()
+            rows = [before[row["id"]] for row in updated if row["id"] in before]
+            conn.executemany("""
+                INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+                VALUES(?,?,?,?,?,?,?)
+            """, [(r["id"], r["user_id"], r["doctor_id"], r["date"], r["time"], r["status"], status) for r in rows])
+            offers.extend(offer_freed_slot(conn, r["doctor_id"], r["date"], r["time"])
+                          for r in rows if slot_change(r["status"], status) == "freed")
+            changed.extend(rows)
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return respond("❌ Some of those appointments' slots have since been rebooked, so nothing was changed.",
+                       "danger", 409)
+    finally:
+        conn.close()
+
+    for r in changed:
+        occupancy_cache.invalidate(r["doctor_id"], r["user_id"], r["date"])
+    queue_notifications([(r["email"], r["user_name"], r["id"], r["doctor_name"], r["date"], r["time"],
+                          r["status"], status) for r in changed])
+    notify_waitlist_offers(offers)
+
+    return respond(f"✅ {len(changed)} appointment(s) updated to {status}!", "success",
+                   updated=[r["id"] for r in changed])
+
 @app.route("/admin/delete-appointment/<int:appointment_id>", methods=["POST"])
 def delete_appointment(appointment_id):
     if "user_id" not in session or session.get("role") != "admin":
         return redirect("/login")
     
     conn = get_db()
+    appointment = conn.execute("SELECT * FROM appointments WHERE id=?", (appointment_id,)).fetchone()
     conn.execute("DELETE FROM appointments WHERE id=?", (appointment_id,))
+    offer = None
+    if appointment:
+        record_appointment_event(conn, appointment_id, appointment["user_id"], appointment["doctor_id"],
+                                 appointment["date"], appointment["time"], appointment["status"], None)
+        if slot_change(appointment["status"], None) == "freed":
+            offer = offer_freed_slot(conn, appointment["doctor_id"], appointment["date"], appointment["time"])
     conn.commit()
     conn.close()
+    if appointment:
+        occupancy_cache.invalidate(appointment["doctor_id"], appointment["user_id"], appointment["date"])
+    notify_waitlist_offers([offer])
     
     flash("🗑️ Appointment permanently deleted!", "success")
     return redirect("/admin")
@@ -943,23 +4260,67 @@ def delete_doctor(doctor_id):
     if "user_id" not in session or session.get("role") != "admin":
         return redirect("/login")
     
+    # Hide the doctor now; their appointments are removed in small batches afterwards
+    # so a long history never holds the write lock in front of everyone's bookings
+    now = datetime.now()
     conn = get_db()
-    # Also delete appointments associated with this doctor to avoid foreign key/logic issues
-    conn.execute("DELETE FROM appointments WHERE doctor_id=?", (doctor_id,))
-    conn.execute("DELETE FROM doctors WHERE id=?", (doctor_id,))
+    conn.execute("BEGIN IMMEDIATE")
+    doctor = conn.execute("""
+        UPDATE doctors SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL RETURNING name
+    """, (now.strftime("%Y-%m-%d %H:%M:%S"), doctor_id)).fetchone()
+    job_id, cancelled = None, []
+    if doctor:
+        # Nobody can be offered or wait for a doctor who is leaving
+        conn.execute("DELETE FROM waitlist_offers WHERE doctor_id=? AND status='Open'", (doctor_id,))
+        conn.execute("UPDATE waitlist SET status='Left' WHERE doctor_id=? AND status='Waiting'", (doctor_id,))
+        # Upcoming visits are cancelled now, not whenever the cleanup job reaches them, so
+        # patients hear straight away and no reminder goes out for a doctor who has left
+        cancelled = conn.execute("""
+            SELECT appointments.id, appointments.user_id, appointments.date, appointments.time,
+                   appointments.status, users.email, users.name as user_name
+            FROM appointments JOIN users ON users.id = appointments.user_id
+            WHERE appointments.doctor_id = ? AND appointments.status IN ('Pending', 'Approved')
+            AND appointments.starts_at >= ?
+        """, (doctor_id, now.strftime("%Y-%m-%d %H:%M"))).fetchall()
+        conn.executemany("UPDATE appointments SET status='Cancelled' WHERE id=?", [(r["id"],) for r in cancelled])
+        conn.executemany("""
+            INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+            VALUES(?,?,?,?,?,?,?)
+        """, [(r["id"], r["user_id"], doctor_id, r["date"], r["time"], r["status"], "Cancelled") for r in cancelled])
+        job_id = conn.execute("INSERT INTO deletion_jobs(doctor_id, doctor_name) VALUES(?,?) RETURNING id",
+                              (doctor_id, doctor["name"])).fetchone()["id"]
     conn.commit()
     conn.close()
-    
-    flash("🗑️ Doctor and their associated appointments deleted!", "success")
+
+    if not doctor:
+        flash("❌ Doctor not found!", "danger")
+        return redirect("/admin")
+
+    occupancy_cache.clear()
+    queue_notifications([(r["email"], r["user_name"], r["id"], doctor["name"], r["date"], r["time"],
+                          r["status"], "Cancelled") for r in cancelled])
+    start_deletion_job(job_id)
+    flash(f"🗑️ {doctor['name']} removed! Their appointments are being cleared in the background.", "success")
     return redirect("/admin")
 
+@app.route("/admin/deletion-jobs")
+def deletion_jobs_status():
+    """Progress of doctor removals, for polling from the admin page"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect("/login")
+
+    conn = get_db()
+    jobs = [dict(row) for row in conn.execute("SELECT * FROM deletion_jobs ORDER BY id DESC LIMIT 20")]
+    conn.close()
+    return jsonify({"jobs": jobs})
+
 @app.route("/admin/export-appointments")
 def export_appointments():
     """Export appointments from the last 30 days as CSV"""
     if "user_id" not in session or session.get("role") != "admin":
         return redirect("/login")
 
-    conn = get_db()
+    conn, snapshot = get_report_db()
     # Fetch data for the last 30 days
     appointments = conn.execute("""
         SELECT 
@@ -970,7 +4331,7 @@ def export_appointments():
             a.date, 
             a.time, 
             a.status
-        FROM appointments a
+        FROM appointment_history a
         JOIN users u ON u.id = a.user_id
         JOIN doctors d ON d.id = a.doctor_id
         WHERE a.date >= date('now', '-30 days')
@@ -1001,16 +4362,595 @@ def export_appointments():
     
     # Return as downloadable file
     filename = f"medibook_report_{datetime.now().strftime('%Y%m%d')}.csv"
+    headers = {"Content-disposition": f"attachment; filename={filename}"}
+    if snapshot:
+        # Tell the reader how fresh the data is
+        headers["X-Report-Snapshot"] = os.path.basename(snapshot)
     return Response(
         output.getvalue(),
         mimetype="text/csv",
-        headers={"Content-disposition": f"attachment; filename={filename}"}
+        headers=headers
     )
 
 
-# Initialize files and DB on startup (required for Gunicorn/Production)
-setup_static_files()
-init_db()
+# -------------------- BULK IMPORT --------------------
+IMPORT_KINDS = ("doctors", "appointments")
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 500))
+IMPORT_MAX_REPORTED_ERRORS = 200
+# An appointment chunk is one INSERT with five parameters per row; SQLite allows 32766
+IMPORT_MAX_CHUNK_SIZE = 5000
+
+def import_format(filename, requested=None):
+    """Pick csv or ndjson from an explicit choice or the file extension"""
+    if requested in ("csv", "ndjson"):
+        return requested
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+def iter_import_rows(stream, fmt):
+    """Stream (line_number, row, error) tuples from CSV or NDJSON text without loading the file"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+def _import_field(row, name):
+    value = row.get(name)
+    return str(value).strip() if value is not None else ""
+
+def _reject_import_row(report, line, message):
+    report["rejected"] += 1
+    if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line, "error": message})
+
+def _validate_doctor_row(row, context):
+    values = [_import_field(row, f) for f in ("name", "specialization", "available_days", "time_slots")]
+    missing = [f for f, v in zip(("name", "specialization", "available_days", "time_slots"), values) if not v]
+    if missing:
+        raise ValueError(f"Missing {', '.join(missing)}")
+    if not expand_time_slots(values[3]):
+        raise ValueError("time_slots has no bookable range (expected e.g. '9:00 AM - 12:00 PM')")
+    return tuple(values)
+
+def _validate_appointment_row(row, context):
+    conn = context["conn"]
+
+    user_id = _import_field(row, "user_id")
+    email = _import_field(row, "user_email")
+    if user_id:
+        if not user_id.isdigit():
+            raise ValueError("user_id must be a number")
+        user_id = int(user_id)
+    elif email:
+        if email not in context["users_by_email"]:
+            found = conn.execute("SELECT id FROM users WHERE email=?", (email,)).fetchone()
+            context["users_by_email"][email] = found["id"] if found else None
+        user_id = context["users_by_email"][email]
+        if user_id is None:
+            raise ValueError(f"Unknown patient email '{email}'")
+    else:
+        raise ValueError("Missing user_id or user_email")
+
+    doctor_id = _import_field(row, "doctor_id")
+    if not doctor_id.isdigit() or int(doctor_id) not in context["doctor_ids"]:
+        raise ValueError(f"Unknown doctor_id '{doctor_id}'")
+
+    date = _import_field(row, "date")
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("date must look like 2024-05-31")
+
+    try:
+        time = normalize_slot_time(_import_field(row, "time"))
+    except ValueError:
+        raise ValueError("time must look like '10:00 AM'")
+
+    status = _import_field(row, "status") or "Pending"
+    if status not in APPOINTMENT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(APPOINTMENT_STATUSES)}")
+
+    return (user_id, int(doctor_id), date, time, status)
+
+def _flush_doctor_chunk(conn, chunk, report):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("""
+        INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+        VALUES(?,?,?,?,?,?)
+    """, [(*values, *doctor_schedule(values[2], values[3])) for _, values in chunk])
+    conn.commit()
+    report["inserted"] += len(chunk)
+
+# Same wording as the booking form's flash messages
+IMPORT_CONFLICT_ERRORS = {
+    "user": "Patient already has an appointment booked at this time",
+    "doctor": "This time slot is already booked for the doctor",
+    "held": "This time slot is being offered to a patient on the waitlist",
+}
+
+def _flush_appointment_chunk(conn, chunk, report):
+    """Check every row with book_appointment's find_slot_conflict, then insert the rest
+    and log their events from the inserted rows themselves"""
+    conn.execute("BEGIN IMMEDIATE")
+
+    accepted, taken_users, taken_doctors = [], set(), set()
+    for line, values in chunk:
+        user_id, doctor_id, date, time, status = values
+        # Cancelled history never occupies a slot, so only active rows are checked
+        if status != "Cancelled":
+            # Earlier rows of this chunk are not inserted yet but compete for the same slots
+            if (user_id, date, time) in taken_users:
+                conflict = "user"
+            elif (doctor_id, date, time) in taken_doctors:
+                conflict = "doctor"
+            else:
+                conflict = find_slot_conflict(conn, user_id, doctor_id, date, time)
+            if conflict:
+                _reject_import_row(report, line, IMPORT_CONFLICT_ERRORS[conflict])
+                continue
+            taken_users.add((user_id, date, time))
+            taken_doctors.add((doctor_id, date, time))
+        accepted.append(values)
+
+    if accepted:
+        inserted = conn.execute(f"""
+            INSERT INTO appointments(user_id, doctor_id, date, time, status)
+            VALUES {",".join(["(?,?,?,?,?)"] * len(accepted))}
+            RETURNING id, user_id, doctor_id, date, time, status
+        """, [v for values in accepted for v in values]).fetchall()
+        conn.executemany("""
+            INSERT INTO appointment_events(appointment_id, user_id, doctor_id, date, time, old_status, new_status)
+            VALUES(?,?,?,?,?,NULL,?)
+        """, [tuple(row) for row in inserted])
+    conn.commit()
+    report["inserted"] += len(accepted)
+
+IMPORTERS = {
+    "doctors": (_validate_doctor_row, _flush_doctor_chunk),
+    "appointments": (_validate_appointment_row, _flush_appointment_chunk),
+}
+
+def import_records(kind, rows, chunk_size=None):
+    """Validate rows in one streaming pass and insert them in chunked transactions.
+    Bad rows are reported with their line number and never abort the batch."""
+    validate, flush = IMPORTERS[kind]
+    chunk_size = min(chunk_size or IMPORT_CHUNK_SIZE, IMPORT_MAX_CHUNK_SIZE)
+    report = {"kind": kind, "inserted": 0, "rejected": 0, "errors": []}
+
+    conn = get_db()
+    context = {"conn": conn, "users_by_email": {}}
+    if kind == "appointments":
+        context["doctor_ids"] = {row["id"] for row in conn.execute("SELECT id FROM doctors WHERE deleted_at IS NULL")}
+
+    chunk = []
+    try:
+        for line, row, error in rows:
+            if error:
+                _reject_import_row(report, line, error)
+                continue
+            try:
+                chunk.append((line, validate(row, context)))
+            except ValueError as e:
+                _reject_import_row(report, line, str(e))
+                continue
+            if len(chunk) >= chunk_size:
+                flush(conn, chunk, report)
+                chunk = []
+        if chunk:
+            flush(conn, chunk, report)
+    except Exception as e:
+        conn.rollback()
+        report["errors"].append({"line": None, "error": f"Import stopped: {e}"})
+        print(f"❌ Bulk import of {kind} stopped: {e}")
+    finally:
+        conn.close()
+
+    report["errors"].sort(key=lambda e: (e["line"] is None, e["line"] or 0))
+    return report
+
+@app.route("/admin/import", methods=["GET", "POST"])
+def bulk_import():
+    """Upload CSV or NDJSON files of doctors or historical appointments"""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect("/login")
+
+    if request.method == "POST":
+        kind = request.form.get("kind", "doctors")
+        upload = request.files.get("file")
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash("❌ Please choose what to import and a CSV or NDJSON file.", "danger")
+            return redirect("/admin/import")
+
+        fmt = import_format(upload.filename, request.form.get("format"))
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        report = import_records(kind, iter_import_rows(stream, fmt))
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(report)
+
+        category = "success" if not report["rejected"] else "danger"
+        flash(f"📥 Imported {report['inserted']} {kind}, {report['rejected']} row(s) rejected.", category)
+        return render_template("admin_import.html", report=report)
+
+    return render_template("admin_import.html", report=None)
+
+@app.cli.command("import-data")
+@click.argument("kind", type=click.Choice(IMPORT_KINDS))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to the file extension")
+@click.option("--chunk-size", type=int, default=None, help="Rows per transaction")
+def import_data_command(kind, path, fmt, chunk_size):
+    """Bulk-import doctors or historical appointments from CSV or NDJSON."""
+    init_db()
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        report = import_records(kind, iter_import_rows(f, import_format(path, fmt)), chunk_size)
+
+    print(f"📥 Imported {report['inserted']} {kind}, {report['rejected']} row(s) rejected")
+    for error in report["errors"]:
+        print(f"   line {error['line']}: {error['error']}")
+
+
+# -------------------- APPOINTMENT REMINDERS --------------------
+# kind -> how long before the appointment the reminder goes out
+REMINDER_LEADS = {"24h": 24 * 60, "1h": 60}
+app.config['REMINDER_INTERVAL_SECONDS'] = float(os.environ.get('REMINDER_INTERVAL_SECONDS', 60))
+app.config['REMINDER_BATCH_SIZE'] = int(os.environ.get('REMINDER_BATCH_SIZE', 500))
+
+def _reminder_batch(conn, kind, now, horizon, batch_size):
+    """
+    Claim the next batch of appointments whose reminder time has passed. The scan
+    resumes from this kind's (starts_at, id) watermark on idx_appointments_starts_at,
+    so each tick only reads rows that became due since the last one.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        mark = conn.execute("SELECT starts_at, appointment_id FROM scheduler_state WHERE name=?",
+                            (f"reminders:{kind}",)).fetchone()
+        # First run starts from now rather than reminding about every past appointment
+        mark_at, mark_id = (mark["starts_at"], mark["appointment_id"]) if mark else (now, 0)
+
+        rows = conn.execute("""
+            SELECT id, starts_at, status FROM appointments
+            WHERE starts_at >= ? AND (starts_at > ? OR id > ?) AND starts_at <= ?
+            ORDER BY starts_at, id
+            LIMIT ?
+        """, (mark_at, mark_at, mark_id, horizon, batch_size)).fetchall()
+
+        due = [row["id"] for row in rows if row["status"] in ("Pending", "Approved") and row["starts_at"] > now]
+        claimed = []
+        if due:
+            # INSERT OR IGNORE + RETURNING hands back only reminders nobody has sent yet
+            marks = ",".join("(?, ?)" for _ in due)
+            claimed = [row["appointment_id"] for row in conn.execute(f"""
+                INSERT OR IGNORE INTO appointment_reminders(appointment_id, kind) VALUES {marks}
+                RETURNING appointment_id
+            """, [value for appointment_id in due for value in (appointment_id, kind)]).fetchall()]
+
+        if rows:
+            last = rows[-1]
+            conn.execute("""
+                INSERT INTO scheduler_state(name, starts_at, appointment_id) VALUES(?,?,?)
+                ON CONFLICT(name) DO UPDATE SET starts_at=excluded.starts_at, appointment_id=excluded.appointment_id
+            """, (f"reminders:{kind}", last["starts_at"], last["id"]))
+        elif not mark:
+            conn.execute("INSERT INTO scheduler_state(name, starts_at, appointment_id) VALUES(?,?,0)",
+                         (f"reminders:{kind}", now))
+
+        details = []
+        if claimed:
+            marks = ",".join("?" * len(claimed))
+            details = conn.execute(f"""
+                SELECT appointments.id, appointments.date, appointments.time, users.email,
+                       users.name as user_name, doctors.name as doctor_name
+                FROM appointments
+                JOIN users ON users.id = appointments.user_id
+                JOIN doctors ON doctors.id = appointments.doctor_id
+                WHERE appointments.id IN ({marks})
+            """, claimed).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return details, len(rows) == batch_size
+
+def send_due_reminders(now=None):
+    """One scheduler tick: send every reminder that has come due. Returns how many were sent."""
+    now = now or datetime.now()
+    batch_size = app.config['REMINDER_BATCH_SIZE']
+    template = email_template("email_reminder.html")
+    conn = get_db()
+    sent = 0
+    try:
+        for kind, lead_minutes in REMINDER_LEADS.items():
+            horizon = (now + timedelta(minutes=lead_minutes)).strftime("%Y-%m-%d %H:%M")
+            more = True
+            while more:
+                rows, more = _reminder_batch(conn, kind, now.strftime("%Y-%m-%d %H:%M"), horizon, batch_size)
+                with app.app_context():
+                    send_email_batch([
+                        (f"Reminder: your appointment {'tomorrow' if kind == '24h' else 'in 1 hour'} ⏰",
+                         row["email"],
+                         template.render(user_name=row["user_name"], doctor_name=row["doctor_name"],
+                                         date=row["date"], time=row["time"], kind=kind))
+                        for row in rows
+                    ], background=False)
+                sent += len(rows)
+    finally:
+        conn.close()
+    return sent
+
+# A sweeper that stops renewing its lease for this long is replaced by a standby one
+app.config['REMINDER_LEASE_SECONDS'] = int(os.environ.get('REMINDER_LEASE_SECONDS', 300))
+
+def claim_scheduler_lease(name, holder, seconds):
+    """Take or renew the lease on a background job. True while `holder` has it; the
+    lease only changes hands once the current holder has let it lapse."""
+    now = datetime.now()
+    conn = get_db()
+    try:
+        row = conn.execute("""
+            INSERT INTO scheduler_leases(name, holder, expires_at) VALUES(?,?,?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE scheduler_leases.holder = excluded.holder OR scheduler_leases.expires_at <= ?
+            RETURNING holder
+        """, (name, holder, (now + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S"),
+              now.strftime("%Y-%m-%d %H:%M:%S"))).fetchone()
+        conn.commit()
+        return row is not None
+    finally:
+        conn.close()
+
+@app.cli.command("run-reminders")
+@click.option("--once", is_flag=True, help="Run a single tick and exit")
+def run_reminders_command(once):
+    """Send 24h and 1h appointment reminders (run as its own process; extra copies stand by)."""
+    init_db()
+    # Started by gunicorn's master (RUN_SCHEDULER) or as the Procfile worker, so two
+    # may run at once; only the one holding the lease sends anything
+    holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    leading = None
+    while True:
+        try:
+            has_lease = claim_scheduler_lease("reminders", holder, app.config['REMINDER_LEASE_SECONDS'])
+            if has_lease != leading:
+                print("⏰ Sending reminders" if has_lease else "⏸️ Another sweeper is sending reminders; standing by")
+                leading = has_lease
+            if has_lease:
+                sent = send_due_reminders()
+                if sent or once:
+                    print(f"⏰ Sent {sent} appointment reminder(s)")
+        except Exception as e:
+            print(f"⚠️ Reminder tick failed (retrying): {e}")
+        if once:
+            return
+        time_module.sleep(app.config['REMINDER_INTERVAL_SECONDS'])
+
+
+# -------------------- DOCTOR REMOVAL --------------------
+app.config['DELETION_CHUNK_SIZE'] = int(os.environ.get('DELETION_CHUNK_SIZE', 500))
+# Pause between chunks so bookings get the write lock in between
+app.config['DELETION_CHUNK_PAUSE'] = float(os.environ.get('DELETION_CHUNK_PAUSE', 0.05))
+# A running job that hasn't reported progress for this long is picked up again
+app.config['DELETION_JOB_STALE_SECONDS'] = int(os.environ.get('DELETION_JOB_STALE_SECONDS', 300))
+
+def _delete_doctor_chunk(conn, job_id, doctor_id, table):
+    """Delete up to DELETION_CHUNK_SIZE of the doctor's rows from `table` in one short
+    transaction; returns how many went"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [row["id"] for row in conn.execute(f"SELECT id FROM {table} WHERE doctor_id = ? LIMIT ?",
+                                                 (doctor_id, app.config['DELETION_CHUNK_SIZE']))]
+        if not ids:
+            conn.rollback()
+            return 0
+        marks = ",".join("?" * len(ids))
+        if table == "appointments":
+            # Upcoming visits were cancelled (with events) at soft-delete time, so none of
+            # these rows holds a slot any more and there is nothing to tell live pages
+            conn.execute(f"DELETE FROM appointment_reminders WHERE appointment_id IN ({marks})", ids)
+        conn.execute(f"DELETE FROM {table} WHERE id IN ({marks})", ids)
+        conn.execute("UPDATE deletion_jobs SET processed = processed + ?, heartbeat_at = ? WHERE id = ?",
+                     (len(ids), datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id))
+        conn.commit()
+        return len(ids)
+    except Exception:
+        conn.rollback()
+        raise
+
+def run_deletion_job(job_id):
+    """
+    Clear a soft-deleted doctor's appointments, archive rows, waitlist, series and
+    rollups in chunks, then delete the doctor. Resumable: a job interrupted part-way
+    just carries on with whatever rows are left.
+    """
+    now = datetime.now()
+    stale = (now - timedelta(seconds=app.config['DELETION_JOB_STALE_SECONDS'])).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    try:
+        job = conn.execute("""
+            UPDATE deletion_jobs SET status = 'Running', heartbeat_at = ?, error = NULL
+            WHERE id = ? AND (status = 'Queued' OR (status IN ('Running', 'Failed') AND heartbeat_at < ?))
+            RETURNING doctor_id, doctor_name, total
+        """, (now.strftime("%Y-%m-%d %H:%M:%S"), job_id, stale)).fetchone()
+        conn.commit()
+        if not job:
+            return False  # finished, or another worker has it
+        doctor_id = job["doctor_id"]
+        if job["total"] is None:
+            total = sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE doctor_id = ?", (doctor_id,)).fetchone()[0]
+                        for table in ("appointments", "appointments_archive"))
+            conn.execute("UPDATE deletion_jobs SET total = ? WHERE id = ?", (total, job_id))
+            conn.commit()
+
+        for table in ("appointments", "appointments_archive"):
+            while _delete_doctor_chunk(conn, job_id, doctor_id, table):
+                time_module.sleep(app.config['DELETION_CHUNK_PAUSE'])
+
+        conn.execute("BEGIN IMMEDIATE")
+        for table in ("waitlist_offers", "waitlist", "appointment_series",
+                      "doctor_daily_stats", "demand_heatmap", "booking_lead_times"):
+            conn.execute(f"DELETE FROM {table} WHERE doctor_id = ?", (doctor_id,))
+        conn.execute("DELETE FROM doctors WHERE id = ? AND deleted_at IS NOT NULL", (doctor_id,))
+        conn.execute("UPDATE deletion_jobs SET status = 'Done', finished_at = ? WHERE id = ?",
+                     (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id))
+        conn.commit()
+        print(f"🗑️ Removed {job['doctor_name']} and their appointments (job #{job_id})")
+        return True
+    except Exception as e:
+        print(f"❌ Deletion job #{job_id} failed (will retry): {e}")
+        # The job's connection may be the thing that failed (lock timeout, closed), so the
+        # failure is recorded on a fresh one; if even that fails the stale timeout retries
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            pass
+        try:
+            failed = get_db()
+            try:
+                failed.execute("UPDATE deletion_jobs SET status = 'Failed', error = ? WHERE id = ?", (str(e), job_id))
+                failed.commit()
+            finally:
+                failed.close()
+        except sqlite3.Error as update_error:
+            print(f"⚠️ Could not record the failure of deletion job #{job_id}: {update_error}")
+        return False
+    finally:
+        conn.close()
+
+def start_deletion_job(job_id):
+    """Start the job in this worker straight away. If the worker dies part-way, the next
+    admin dashboard view (or `flask resume-deletions`) resumes it once its heartbeat is
+    DELETION_JOB_STALE_SECONDS old."""
+    threading.Thread(target=run_deletion_job, args=(job_id,), daemon=True).start()
+
+def resume_deletion_jobs():
+    """Run queued jobs and pick up ones whose worker died or that failed; returns how many finished"""
+    stale = (datetime.now() - timedelta(seconds=app.config['DELETION_JOB_STALE_SECONDS'])).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db()
+    job_ids = [row["id"] for row in conn.execute("""
+        SELECT id FROM deletion_jobs
+        WHERE status = 'Queued' OR (status IN ('Running', 'Failed') AND heartbeat_at < ?)
+        ORDER BY id
+    """, (stale,))]
+    conn.close()
+    return sum(1 for job_id in job_ids if run_deletion_job(job_id))
+
+def deletion_job_stalled(job):
+    """Whether resume_deletion_jobs() would pick this job up"""
+    stale = (datetime.now() - timedelta(seconds=app.config['DELETION_JOB_STALE_SECONDS'])).strftime("%Y-%m-%d %H:%M:%S")
+    return job["status"] == "Queued" or (job["status"] in ("Running", "Failed") and (job["heartbeat_at"] or "") < stale)
+
+@app.cli.command("resume-deletions")
+def resume_deletions_command():
+    """Finish doctor removals whose worker died or that failed."""
+    init_db()
+    print(f"🗑️ Finished {resume_deletion_jobs()} doctor removal(s)")
+
+
+# -------------------- APPOINTMENT ARCHIVE --------------------
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+app.config['ARCHIVE_CHUNK_SIZE'] = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 1000))
+
+def archive_appointments(days=None, chunk_size=None):
+    """
+    Move Completed/Cancelled appointments older than `days` into appointments_archive,
+    one short write transaction per chunk so bookings are never blocked for long.
+    Returns the number of rows moved. No events are recorded: finished appointments
+    in the past never affect slot availability.
+    """
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    chunk_size = chunk_size or app.config['ARCHIVE_CHUNK_SIZE']
+    # starts_at is 'YYYY-MM-DD HH:MM', so anything before the bare cutoff date is older
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    conn = get_db()
+    moved = 0
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [row["id"] for row in conn.execute("""
+                SELECT id FROM appointments
+                WHERE starts_at < ? AND status IN ('Completed', 'Cancelled')
+                ORDER BY starts_at
+                LIMIT ?
+            """, (cutoff, chunk_size)).fetchall()]
+            if not ids:
+                conn.rollback()
+                break
+
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"""
+                INSERT OR REPLACE INTO appointments_archive(id, user_id, doctor_id, date, time, status, series_id)
+                SELECT id, user_id, doctor_id, date, time, status, series_id FROM appointments WHERE id IN ({marks})
+            """, ids)
+            conn.execute(f"DELETE FROM appointment_reminders WHERE appointment_id IN ({marks})", ids)
+            conn.execute(f"DELETE FROM appointments WHERE id IN ({marks})", ids)
+            conn.commit()
+            moved += len(ids)
+    finally:
+        conn.close()
+    return moved
+
+@app.cli.command("archive-appointments")
+@click.option("--days", type=int, default=None, help="Archive finished appointments older than this (default ARCHIVE_AFTER_DAYS)")
+@click.option("--chunk-size", type=int, default=None, help="Rows moved per transaction")
+def archive_appointments_command(days, chunk_size):
+    """Move old Completed/Cancelled appointments into appointments_archive."""
+    init_db()
+    started = time_module.perf_counter()
+    moved = archive_appointments(days, chunk_size)
+    print(f"🗄️ Archived {moved} appointment(s) in {time_module.perf_counter() - started:.1f}s")
+
+
+@app.cli.command("backup-db")
+@click.option("--keep", type=int, default=None, help="Snapshots to retain (default SNAPSHOT_KEEP)")
+def backup_db_command(keep):
+    """Take an online backup of the database into the rotating snapshot folder."""
+    init_db()
+    started = time_module.perf_counter()
+    path = backup_database(keep)
+    print(f"💾 Snapshot {path} written in {time_module.perf_counter() - started:.1f}s")
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the analytics rollup tables from appointments and the archive."""
+    init_db()
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    rebuild_rollups(conn)
+    conn.commit()
+    conn.close()
+    print("📊 Analytics rollups rebuilt")
+
+
+@app.cli.command("precompile-templates")
+def precompile_templates_command():
+    """Compile every template into the Jinja bytecode cache (run at build time; doesn't touch the database)."""
+    started = time_module.perf_counter()
+    count, failed = precompile_templates()
+    where = app.config['JINJA_CACHE_DIR'] if app.jinja_env.bytecode_cache else "memory only"
+    print(f"🧩 Precompiled {count} templates into {where} in {time_module.perf_counter() - started:.2f}s")
+    if failed:
+        for failure in failed:
+            print(f"   ↳ broken: {failure}")
+        # build.sh and render.yaml's buildCommand stop the deploy on this
+        raise click.ClickException(f"{len(failed)} template(s) failed to compile")
+
 
 if __name__ == "__main__":
+    startup()
     app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Benchmark the chatbot's FAQ retrieval at knowledge-base sizes well beyond faq.json.
+
+A deterministic synthetic knowledge base (default 10,000 entries, three phrasings
+each) is indexed with the app's own FaqIndex, then queried with typo-laden
+messages. Reports index build time and per-message latency percentiles, for the
+NumPy path and (with --compare-python) the pure-Python fallback.
+
+    python benchmark_faq.py
+    python benchmark_faq.py --entries 50000 --queries 2000 --compare-python
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+SYMPTOMS = ["pain", "swelling", "itching", "burning", "numbness", "stiffness", "bleeding", "rash",
+            "cramps", "weakness", "tingling", "discharge", "fever", "cough", "dizziness", "nausea"]
+BODY_PARTS = ["knee", "back", "shoulder", "ankle", "wrist", "neck", "chest", "stomach", "throat", "ear",
+              "eye", "tooth", "gum", "skin", "scalp", "hip", "elbow", "foot", "hand", "jaw"]
+CONTEXTS = ["after exercise", "at night", "in the morning", "for two weeks", "after eating", "when walking",
+            "since yesterday", "during pregnancy", "in my child", "after a fall", "when lying down", "at work"]
+TEMPLATES = [
+    "I have {symptom} in my {part} {context}",
+    "{part} {symptom} {context}",
+    "what should I do about {symptom} of the {part} {context}",
+    "is {symptom} in the {part} {context} serious",
+]
+
+
+def synthetic_entries(count, rng):
+    entries = []
+    for n in range(count):
+        words = {"symptom": rng.choice(SYMPTOMS), "part": rng.choice(BODY_PARTS), "context": rng.choice(CONTEXTS)}
+        phrasings = [template.format(**words) for template in rng.sample(TEMPLATES, 3)]
+        entries.append({
+            "question": f"{phrasings[0]} (case {n})",
+            "alternatives": phrasings[1:],
+            "answer": f"Answer {n}",
+        })
+    return entries
+
+
+def with_typos(text, rng, rate=0.08):
+    """Drop, double or swap characters the way hurried typing does"""
+    chars = list(text)
+    out = []
+    i = 0
+    while i < len(chars):
+        roll = rng.random()
+        if chars[i].isalpha() and roll < rate / 3:
+            pass  # dropped
+        elif chars[i].isalpha() and roll < 2 * rate / 3:
+            out += [chars[i], chars[i]]
+        elif roll < rate and i + 1 < len(chars):
+            out += [chars[i + 1], chars[i]]
+            i += 1
+        else:
+            out.append(chars[i])
+        i += 1
+    return "".join(out)
+
+
+def run(index, queries):
+    timings = []
+    hits = 0
+    for text, expected in queries:
+        started = time.perf_counter()
+        results = index.search(text, limit=1)
+        timings.append((time.perf_counter() - started) * 1000)
+        hits += bool(results) and results[0][0]["answer"] == expected
+    timings.sort()
+    pct = lambda p: timings[min(len(timings) - 1, int(p / 100 * len(timings)))]
+    return {
+        "mean": statistics.fmean(timings), "p50": pct(50), "p95": pct(95), "p99": pct(99),
+        "hit_rate": hits / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAQ retrieval latency")
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--compare-python", action="store_true", help="Also time the pure-Python fallback")
+    args = parser.parse_args()
+
+    # Only FaqIndex is needed; importing the app doesn't touch the database
+    import app as medibook
+
+    rng = random.Random(args.seed)
+    entries = synthetic_entries(args.entries, rng)
+    queries = []
+    for _ in range(args.queries):
+        entry = rng.choice(entries)
+        phrasing = rng.choice([entry["question"].split(" (case")[0], *entry["alternatives"]])
+        queries.append((with_typos(phrasing, rng), entry["answer"]))
+
+    variants = [("numpy", medibook.np)] if medibook.np is not None else []
+    if args.compare_python or not variants:
+        variants.append(("python", None))
+    if medibook.np is None:
+        print("⚠️ NumPy is not installed; only the pure-Python fallback can be measured", file=sys.stderr)
+
+    numpy_module = medibook.np
+    for name, module in variants:
+        medibook.np = module
+        started = time.perf_counter()
+        index = medibook.FaqIndex(entries)
+        built = time.perf_counter() - started
+        stats = run(index, queries)
+        print(f"{name:>6}: {args.entries:,} entries / {index.n_rows:,} phrasings / {len(index.vocab):,} n-grams, "
+              f"built in {built:.2f}s")
+        print(f"        per message: mean {stats['mean']:.2f} ms, p50 {stats['p50']:.2f} ms, "
+              f"p95 {stats['p95']:.2f} ms, p99 {stats['p99']:.2f} ms")
+        # Synthetic entries share phrasings, so "hit" means the exact entry ranked first
+        print(f"        exact-entry hit rate {stats['hit_rate']:.0%}")
+    medibook.np = numpy_module
+
+
+if __name__ == "__main__":
+    main()
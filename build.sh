@@ -13,4 +13,7 @@ fi
 # Install dependencies
 pip install -r requirements.txt
 
+# Compile templates into the Jinja bytecode cache so workers start warm (a broken one fails the build)
+flask --app app precompile-templates || exit 1
+
 echo "✅ Build complete!"
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""
+Bulk-generate a large, realistic MediBook dataset for performance testing.
+
+The schema comes from the app itself: DATABASE_PATH is pointed at the output
+file and app.init_db() runs against it, so the copy always matches the live
+schema. Secondary indexes and triggers are dropped while the rows are loaded
+with executemany in batched transactions, then recreated at the end.
+
+Every value, timestamps and password salts included, comes from the seeded RNG
+and the --today date, so the same --seed and --today always produce the same
+rows and benchmark runs are comparable.
+
+    python generate_dataset.py --output perf.db
+    python generate_dataset.py --users 500000 --doctors 5000 --appointments 5000000 --seed 7
+    python generate_dataset.py --today 2025-01-06    # reproduce a dataset generated on that day
+"""
+import argparse
+import hashlib
+import os
+import random
+import string
+import sys
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import islice
+
+FIRST_NAMES = ["Aarav", "Olivia", "Liam", "Emma", "Noah", "Ava", "Mia", "Ethan", "Sofia", "Lucas",
+               "Isha", "Mateo", "Chloe", "Arjun", "Zara", "Leo", "Hana", "Omar", "Grace", "Ravi"]
+LAST_NAMES = ["Smith", "Patel", "Garcia", "Chen", "Johnson", "Kumar", "Brown", "Nguyen", "Lopez", "Khan",
+              "Wilson", "Sharma", "Miller", "Davis", "Lee", "Martin", "Singh", "Clark", "Lewis", "Walker"]
+
+# (specialization, relative weight)
+SPECIALIZATIONS = [
+    ("General Physician", 30), ("Pediatrician", 12), ("Dentist", 12), ("Dermatologist", 8),
+    ("Cardiologist", 8), ("Gynecologist", 8), ("Orthopedic Surgeon", 7), ("ENT Specialist", 5),
+    ("Ophthalmologist", 5), ("Gastroenterologist", 5),
+]
+
+# (available_days text, weekday numbers it covers)
+DAY_TEMPLATES = [
+    ("Mon, Wed, Fri", (0, 2, 4)),
+    ("Tue, Thu, Sat", (1, 3, 5)),
+    ("Mon, Tue, Wed, Thu, Fri", (0, 1, 2, 3, 4)),
+    ("Mon-Sat", (0, 1, 2, 3, 4, 5)),
+]
+
+TIME_TEMPLATES = [
+    "9:00 AM - 12:00 PM, 2:00 PM - 5:00 PM",
+    "10:00 AM - 1:00 PM, 3:00 PM - 6:00 PM",
+    "8:00 AM - 4:00 PM",
+    "11:00 AM - 3:00 PM, 5:00 PM - 8:00 PM",
+    "9:00 AM - 1:00 PM, 4:00 PM - 7:00 PM",
+]
+
+CHAT_SAMPLES = [
+    ("hello", "👋 <b>Hello! I'm MediBook AI.</b>"),
+    ("How do I book an appointment?", "📅 <b>To book an appointment:</b>"),
+    ("I have a toothache", "🏥 <b>Recommended Specialty: Dentist</b>"),
+    ("my appointment status", "📂 <b>Your Recent Bookings:</b>"),
+    ("What are the clinic working hours?", "🕒 <b>Clinic Hours:</b>"),
+    ("fever and cough", "🤒 <b>Fever & Cough Advice:</b>"),
+]
+
+
+def slots_for(time_ranges):
+    """Expand '9:00 AM - 12:00 PM, ...' into 30-minute slots, as the booking page does"""
+    slots = []
+    for part in time_ranges.split(","):
+        bounds = [b.strip() for b in part.split("-")]
+        if len(bounds) != 2:
+            continue
+        current = datetime.strptime(bounds[0], "%I:%M %p")
+        end = datetime.strptime(bounds[1], "%I:%M %p")
+        while current < end:
+            slots.append(current.strftime("%I:%M %p"))
+            current += timedelta(minutes=30)
+    return slots
+
+
+def seeded_password_hash(password, rng):
+    """A werkzeug-format scrypt hash (the app's default method) with a salt drawn from rng"""
+    n, r, p = 2 ** 15, 8, 1
+    salt = "".join(rng.choices(string.ascii_letters + string.digits, k=16))
+    digest = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p).hex()
+    return f"scrypt:{n}:{r}:{p}${salt}${digest}"
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(conn, sql, rows, batch_size):
+    """executemany in one transaction per batch; returns the number of rows written"""
+    total = 0
+    for batch in batched(rows, batch_size):
+        conn.execute("BEGIN")
+        conn.executemany(sql, batch)
+        conn.execute("COMMIT")
+        total += len(batch)
+    return total
+
+
+# Status mix for appointments that already happened vs. ones still ahead
+PAST_STATUSES = (["Completed", "Cancelled", "Approved", "Pending"], [72, 90, 96, 100])
+FUTURE_STATUSES = (["Pending", "Approved", "Cancelled"], [50, 88, 100])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MediBook dataset")
+    parser.add_argument("--output", default="medibook_perf.db")
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--doctors", type=int, default=2_000)
+    parser.add_argument("--appointments", type=int, default=2_000_000)
+    parser.add_argument("--chat-logs", type=int, default=100_000)
+    parser.add_argument("--history-days", type=int, default=365, help="How far back appointments go")
+    parser.add_argument("--future-days", type=int, default=60, help="How far ahead appointments go")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=lambda value: datetime.strptime(value, "%Y-%m-%d").date(),
+                        default=datetime.now().date(), help="Date the data treats as today (default: the real date)")
+    parser.add_argument("--force", action="store_true", help="Overwrite the output file if it exists")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    if os.path.exists(output):
+        if not args.force:
+            sys.exit(f"❌ {output} already exists (use --force to overwrite)")
+        os.remove(output)
+
+    started = time.perf_counter()
+
+    # Build the schema with the app's own init_db() so the copy never drifts
+    os.environ["DATABASE_PATH"] = output
+    os.environ["SQL_TRACE"] = "False"
+    import app as medibook
+    medibook.init_db()
+
+    conn = medibook.sqlite3.connect(output, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+
+    # Defer index and trigger maintenance until the data is in
+    deferred = conn.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+    """).fetchall()
+    for kind, name, _ in deferred:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+
+    rng = random.Random(args.seed)
+
+    # ---- Users: one shared hash keeps generation fast; every user logs in with "password123"
+    password_hash = seeded_password_hash("password123", rng)
+    first_user_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users").fetchone()[0]
+    user_rows = (
+        (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"patient{n}@example.com", password_hash, "user")
+        for n in range(args.users)
+    )
+    users = bulk_insert(conn, "INSERT INTO users(name, email, password, role) VALUES(?,?,?,?)",
+                        user_rows, args.batch_size)
+    user_ids = range(first_user_id, first_user_id + users)
+
+    # ---- Doctors
+    spec_names = [s for s, _ in SPECIALIZATIONS]
+    spec_weights = [w for _, w in SPECIALIZATIONS]
+    doctor_plans = []
+    first_doctor_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM doctors").fetchone()[0]
+    for n in range(args.doctors):
+        days_text, weekdays = rng.choice(DAY_TEMPLATES)
+        doctor_plans.append((
+            f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            rng.choices(spec_names, spec_weights)[0],
+            days_text,
+            rng.choice(TIME_TEMPLATES),
+            weekdays,
+        ))
+    bulk_insert(conn, """
+        INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+        VALUES(?,?,?,?,?,?)
+    """, ((*plan[:4], sum(1 << day for day in plan[4]), len(slots_for(plan[3]))) for plan in doctor_plans),
+        args.batch_size)
+
+    # ---- Appointments: sample distinct (day, slot) positions per doctor so the
+    # unique_doctor_time_slot rule holds once the index is rebuilt
+    today = args.today
+    calendar = [today + timedelta(days=d) for d in range(-args.history_days, args.future_days + 1)]
+    today_str = today.strftime("%Y-%m-%d")
+    day_index = {day.strftime("%Y-%m-%d"): n for n, day in enumerate(calendar)}
+    # (user, day, half-hour of the day) already booked, packed into one int: a patient
+    # can't be in two places at once, even with different doctors
+    user_slots = set()
+
+    def free_patient(date, slot):
+        """A random patient with nothing else at date+slot (None if several draws all clash)"""
+        moment = day_index[date] * 48 + int(slot[:2]) % 12 * 2 + (slot[3:5] == "30") + (slot[-2:] == "PM") * 24
+        for _ in range(8):
+            user_id = rng.choice(user_ids)
+            key = user_id * len(calendar) * 48 + moment
+            if key not in user_slots:
+                user_slots.add(key)
+                return user_id
+        return None
+    workdays_by_template = {
+        weekdays: [day.strftime("%Y-%m-%d") for day in calendar if day.weekday() in weekdays]
+        for _, weekdays in DAY_TEMPLATES
+    }
+    slots_by_template = {t: slots_for(t) for t in TIME_TEMPLATES}
+
+    def appointment_rows():
+        remaining = args.appointments
+        for index, (_, _, _, time_ranges, weekdays) in enumerate(doctor_plans):
+            doctors_left = len(doctor_plans) - index
+            share = remaining // doctors_left
+            # Some doctors are far busier than others
+            wanted = remaining if doctors_left == 1 else int(share * rng.uniform(0.5, 1.5))
+            days = workdays_by_template[weekdays]
+            slots = slots_by_template[time_ranges]
+            per_day = len(slots)
+            capacity = len(days) * per_day
+            wanted = min(wanted, capacity)
+            remaining -= wanted
+
+            # One jittered pick per stride: distinct, already sorted, one draw per row
+            stride = capacity / wanted if wanted else 0
+            bounds = [int(n * stride) for n in range(wanted + 1)]
+            positions = [lo + int(rng.random() * (hi - lo)) for lo, hi in zip(bounds, bounds[1:])]
+            # Positions are in date order, so the past ones form a prefix
+            past_count = bisect_left(positions, bisect_left(days, today_str) * per_day)
+            statuses = (rng.choices(PAST_STATUSES[0], cum_weights=PAST_STATUSES[1], k=past_count)
+                        + rng.choices(FUTURE_STATUSES[0], cum_weights=FUTURE_STATUSES[1], k=wanted - past_count))
+            doctor_id = first_doctor_id + index
+            for position, status in zip(positions, statuses):
+                date, slot = days[position // per_day], slots[position % per_day]
+                user_id = free_patient(date, slot)
+                if user_id is not None:
+                    yield (user_id, doctor_id, date, slot, status)
+
+    appointments = 0
+    if users and doctor_plans:
+        appointments = bulk_insert(conn, """
+            INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES(?,?,?,?,?)
+        """, appointment_rows(), args.batch_size)
+    user_slots.clear()
+
+    # ---- Chat logs, spread over the history window before midnight of --today
+    epoch = datetime.combine(today, datetime.min.time())
+
+    def chat_rows():
+        for _ in range(args.chat_logs):
+            message, reply = rng.choice(CHAT_SAMPLES)
+            user_id = rng.choice(user_ids) if users and rng.random() < 0.7 else None
+            stamp = epoch - timedelta(seconds=rng.randrange(args.history_days * 86400 or 1))
+            yield (user_id, message, reply, stamp.strftime("%Y-%m-%d %H:%M:%S"))
+
+    chats = bulk_insert(conn, "INSERT INTO chat_logs(user_id, user_message, ai_response, timestamp) VALUES(?,?,?,?)",
+                        chat_rows(), args.batch_size)
+
+    loaded = time.perf_counter()
+    for _, _, sql in deferred:
+        conn.execute(sql)
+    # Rollups and the doctor search index are normally kept current by triggers,
+    # which were off during the load
+    conn.execute("BEGIN")
+    medibook.rebuild_rollups(conn)
+    if medibook.DOCTOR_FTS:
+        conn.execute("INSERT INTO doctors_fts(doctors_fts) VALUES('rebuild')")
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+
+    finished = time.perf_counter()
+    print(f"✅ Generated {users:,} users, {len(doctor_plans):,} doctors, {appointments:,} appointments, "
+          f"{chats:,} chat logs into {output}")
+    print(f"⏱️ Load {loaded - started:.1f}s, indexes {finished - loaded:.1f}s (seed {args.seed}, today {today_str})")
+
+
+if __name__ == "__main__":
+    main()
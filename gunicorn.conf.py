@@ -0,0 +1,39 @@
+"""gunicorn settings for MediBook (`gunicorn app:app -c gunicorn.conf.py`)."""
+import os
+
+# Threaded workers; each open live-update stream holds a thread, and app.py caps
+# streams per worker at a quarter of GUNICORN_THREADS (SSE_MAX_STREAMS)
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def post_worker_init(worker):
+    # Create the schema, load the FAQ index and warm templates before this worker takes traffic
+    from app import startup
+    startup()
+
+
+# Render keeps the SQLite file on the web service's own disk, so a separate worker
+# service would never see it; with RUN_SCHEDULER=true the master runs the reminder
+# sweeper next to the web workers instead. If the Procfile worker runs as well, a
+# lease in the database keeps all but one of them standing by.
+_scheduler = None
+
+
+def on_starting(server):
+    global _scheduler
+    if os.environ.get("RUN_SCHEDULER", "false").lower() == "true":
+        import subprocess
+        import sys
+        _scheduler = subprocess.Popen([sys.executable, "-m", "flask", "--app", "app", "run-reminders"])
+        server.log.info("Started reminder sweeper (pid %s)", _scheduler.pid)
+
+
+def on_exit(server):
+    if _scheduler is not None and _scheduler.poll() is None:
+        _scheduler.terminate()
+        try:
+            _scheduler.wait(timeout=10)
+        except Exception:
+            _scheduler.kill()
@@ -0,0 +1,373 @@
+"""
+MediBook scenario-based HTTP load test.
+
+Starts `app:app` under gunicorn against a throwaway copy of the database,
+points Flask-Mail at a local stand-in SMTP sink, drives a set of realistic
+scenarios and reports throughput plus p50/p95/p99 latency per scenario.
+
+    python loadtest.py                      # run and compare against the baseline
+    python loadtest.py --save-baseline      # run and overwrite loadtest_baseline.json
+    python loadtest.py --scenarios chat,browse --requests 500
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "loadtest_baseline.json")
+
+CHAT_MESSAGES = [
+    "hello", "How do I book an appointment?", "I have a toothache", "my appointment status",
+    "What are the clinic working hours?", "I have a skin rash", "fever and cough", "contact support",
+]
+
+
+# ========== SMTP SINK ==========
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Flask-Mail: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, QUIT"""
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 loadtest-sink ESMTP")
+        in_data = False
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    in_data = False
+                    self.server.messages += 1
+                    self.reply("250 OK queued")
+                continue
+            verb = line.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-loadtest-sink")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "AUTH":
+                self.reply("235 Authentication successful")
+            elif verb == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    messages = 0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ========== HTTP CLIENT ==========
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Measure the request itself, not the page the app redirects to"""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Client:
+    """One virtual user with its own cookie jar (and therefore session)"""
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, method, path, form=None, json_body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+# ========== SCENARIOS ==========
+def next_bookable_date(days_ahead, weekday_mask):
+    """The first date from `days_ahead` on that falls on one of the storm doctor's working days"""
+    day = datetime.now() + timedelta(days=days_ahead)
+    while not weekday_mask >> day.weekday() & 1:
+        day += timedelta(days=1)
+    return day.strftime("%Y-%m-%d")
+
+
+STORM_SLOTS = [f"{h:02d}:{m:02d} {'AM' if h < 12 else 'PM'}" for h in (9, 10, 11) for m in (0, 30)]
+
+# Runs once before gunicorn starts: creates the schema (so the workers don't race on
+# init_db) and picks the seeded doctor who works every storm slot on the most weekdays
+SETUP_SCRIPT = """
+import json, sys
+import app
+app.init_db()
+storm_slots = set(json.loads(sys.argv[1]))
+conn = app.get_db()
+doctors = [row for row in conn.execute("SELECT id, weekday_mask, time_slots FROM doctors WHERE deleted_at IS NULL")
+           if row["weekday_mask"] and storm_slots <= set(app.expand_time_slots(row["time_slots"]))]
+best = max(doctors, key=lambda row: (bin(row["weekday_mask"]).count("1"), -row["id"]), default=None)
+print(json.dumps(best and {"id": best["id"], "weekday_mask": best["weekday_mask"]}))
+"""
+
+
+def scenario_booking_storm(ctx, i):
+    # Every wave of `concurrency` requests races for the same slot of one doctor
+    wave = i // ctx["concurrency"]
+    doctor = ctx["storm_doctor"]
+    date = next_bookable_date(7 + wave // len(STORM_SLOTS), doctor["weekday_mask"])
+    slot = STORM_SLOTS[wave % len(STORM_SLOTS)]
+    patient = ctx["patients"][i % len(ctx["patients"])]
+    return patient.post(f"/book/{doctor['id']}", form={"date": date, "time": slot})
+
+
+def scenario_browse(ctx, i):
+    patient = ctx["patients"][i % len(ctx["patients"])]
+    return patient.get("/doctors" if i % 2 == 0 else "/dashboard")
+
+
+def scenario_chat(ctx, i):
+    patient = ctx["patients"][i % len(ctx["patients"])]
+    return patient.post("/ai/chat", json_body={"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]})
+
+
+def scenario_admin_export(ctx, i):
+    return ctx["admin"].get("/admin/export-appointments")
+
+
+def scenario_login(ctx, i):
+    # Password checks are the CPU-heavy part; this shows login throughput under concurrency
+    email = ctx["emails"][i % len(ctx["emails"])]
+    return Client(ctx["base_url"]).post("/login", form={"email": email, "password": "loadtest123"})
+
+
+SCENARIOS = {
+    "booking_storm": scenario_booking_storm,
+    "browse": scenario_browse,
+    "chat": scenario_chat,
+    "admin_export": scenario_admin_export,
+    "login": scenario_login,
+}
+
+
+# ========== RUNNER ==========
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def run_scenario(ctx, name, requests, concurrency):
+    fn = SCENARIOS[name]
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        status = fn(ctx, i)
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def wait_for_server(base_url, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit("❌ gunicorn exited during startup")
+        try:
+            urllib.request.urlopen(base_url + "/about", timeout=2).read()
+            return
+        except Exception:
+            time.sleep(0.2)
+    sys.exit("❌ gunicorn did not become ready in time")
+
+
+def prepare_users(base_url, count):
+    """Register and log in `count` patients plus the seeded admin (not measured)"""
+    run_id = random.randrange(10**6)
+    patients, emails = [], []
+    for n in range(count):
+        client = Client(base_url)
+        email = f"loadtest{run_id}_{n}@example.com"
+        client.post("/register", form={"name": f"Load Tester {n}", "email": email, "password": "loadtest123"})
+        client.post("/login", form={"email": email, "password": "loadtest123"})
+        patients.append(client)
+        emails.append(email)
+
+    admin = Client(base_url)
+    admin.post("/login", form={"email": "admin@gmail.com", "password": "admin123"})
+    return patients, emails, admin
+
+
+def compare(results, baseline, tolerance):
+    """Print deltas against the baseline; return True if anything regressed"""
+    regressed = False
+    print("\n📈 Comparison with baseline (tolerance ±{:.0%}):".format(tolerance))
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            print(f"  {name:<15} (no baseline)")
+            continue
+        p95_delta = (current["p95_ms"] - previous["p95_ms"]) / max(previous["p95_ms"], 0.01)
+        rps_delta = (current["throughput_rps"] - previous["throughput_rps"]) / max(previous["throughput_rps"], 0.01)
+        flag = ""
+        if p95_delta > tolerance or rps_delta < -tolerance:
+            flag = "  ❌ REGRESSION"
+            regressed = True
+        print(f"  {name:<15} p95 {p95_delta:+.0%}  throughput {rps_delta:+.0%}{flag}")
+    return regressed
+
+
+def run(args, names, sink, workdir):
+    """Start gunicorn on a database inside `workdir`, run the scenarios and return their results"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(workdir, "loadtest.db"),
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=str(sink.server_address[1]),
+        MAIL_USE_TLS="False",
+        MAIL_USERNAME="loadtest",
+        MAIL_PASSWORD="loadtest",
+    )
+    env.pop("RENDER", None)
+
+    setup = subprocess.run([sys.executable, "-c", SETUP_SCRIPT, json.dumps(STORM_SLOTS)], cwd=BASE_DIR, env=env,
+                           check=True, capture_output=True, text=True)
+    storm_doctor = json.loads(setup.stdout.strip().splitlines()[-1])
+    if storm_doctor is None and "booking_storm" in names:
+        sys.exit("❌ No seeded doctor works every booking-storm slot")
+
+    cmd = [sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+           "-w", str(args.workers), "--chdir", BASE_DIR, "--log-level", "warning"] + args.gunicorn_args.split()
+    print(f"🚀 Starting gunicorn ({args.workers} workers) on {base_url}")
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+
+    try:
+        wait_for_server(base_url, proc)
+        patients, emails, admin = prepare_users(base_url, args.users)
+        ctx = {"patients": patients, "emails": emails, "admin": admin, "base_url": base_url,
+               "storm_doctor": storm_doctor, "concurrency": args.concurrency}
+
+        results = {}
+        print(f"\n{'scenario':<15} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name in names:
+            r = run_scenario(ctx, name, args.requests, args.concurrency)
+            results[name] = r
+            print(f"{name:<15} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>8} "
+                  f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+        print(f"\n📧 SMTP sink received {sink.messages} message(s)")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MediBook HTTP load test")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenario names")
+    parser.add_argument("--requests", type=int, default=300, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20, help="Patients registered before the run")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--gunicorn-args", default="", help="Extra arguments passed to gunicorn")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95/throughput drift")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        sys.exit(f"❌ Unknown scenario(s): {', '.join(unknown)}")
+
+    sink = SMTPSink(("127.0.0.1", 0), SMTPSinkHandler)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory(prefix="medibook-loadtest-") as workdir:
+        try:
+            results = run(args, names, sink, workdir)
+        finally:
+            sink.shutdown()
+
+    regressed = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+
+    if args.save_baseline:
+        baseline = {
+            "recorded_at": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "settings": {"requests": args.requests, "concurrency": args.concurrency,
+                         "users": args.users, "workers": args.workers},
+            "scenarios": results,
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+        print(f"💾 Baseline written to {args.baseline}")
+
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Shared fixtures: every test runs against its own freshly initialised SQLite file."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_scratch = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = os.path.join(_scratch.name, "import.db")
+os.environ["JINJA_CACHE_DIR"] = os.path.join(_scratch.name, "jinja")
+# Cheap hashes inline keep the suite fast; the pool itself isn't under test here
+os.environ.setdefault("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+import app as medibook  # noqa: E402
+
+medibook.ENABLE_REAL_EMAILS = False
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """The app module, pointed at a new database with the schema and sample doctors"""
+    monkeypatch.setattr(medibook, "DB_NAME", str(tmp_path / "medibook.db"))
+    medibook.init_db()
+    # The schema is all the tests need from startup(); skip static files and warm-up
+    monkeypatch.setattr(medibook, "_started_pid", os.getpid())
+    # Per-worker caches remember the previous test's database
+    medibook.occupancy_cache.clear()
+    medibook.slot_board.built_for = None
+    yield medibook
+    medibook.occupancy_cache.clear()
+
+
+def login(client, email, password="password123"):
+    client.post("/login", data={"email": email, "password": password})
+    return client
+
+
+@pytest.fixture
+def patient(db):
+    client = db.app.test_client()
+    client.post("/register", data={"name": "Pat", "email": "pat@example.com", "password": "password123"})
+    return login(client, "pat@example.com")
+
+
+@pytest.fixture
+def admin(db):
+    return login(db.app.test_client(), "admin@gmail.com", "admin123")
@@ -0,0 +1,21 @@
+def test_feed_rejects_a_non_numeric_wait(admin):
+    response = admin.get("/admin/feed?wait=abc")
+    assert response.status_code == 400
+    assert "wait" in response.get_json()["error"]
+
+
+def test_feed_returns_changes_after_the_cursor(db, admin, patient):
+    cursor = admin.get("/admin/feed").get_json()["cursor"]
+    patient.post("/book/7", data={"date": "2099-01-05", "time": "09:00 AM"})
+
+    feed = admin.get(f"/admin/feed?cursor={cursor}&wait=0").get_json()
+    assert [(e["kind"], e["status"], e["doctor_name"]) for e in feed["events"]] == \
+        [("created", "Pending", "Dr. James Miller")]
+    assert feed["cursor"] > cursor
+
+
+def test_long_poll_without_a_free_stream_slot_answers_at_once(db, admin, monkeypatch):
+    monkeypatch.setitem(db.app.config, "SSE_MAX_STREAMS", 0)
+    response = admin.get("/admin/feed?wait=30")
+    assert response.status_code == 200
+    assert response.get_json()["events"] == []
@@ -0,0 +1,71 @@
+"""Archived appointments leave the hot table but stay visible wherever history is shown."""
+from datetime import date, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def history(db, patient):
+    """Six finished visits last week, all at distinct times with Dr. James Miller"""
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors WHERE name = 'Dr. James Miller'").fetchone()["id"]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    day = (date.today() - timedelta(days=7)).isoformat()
+    ids = [conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, doctor_id, day, f"{hour:02d}:00 AM", "Completed" if hour % 2 else "Cancelled")).lastrowid
+           for hour in range(6, 12)]
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def counts(db):
+    conn = db.get_db()
+    result = tuple(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                   for table in ("appointments", "appointments_archive", "appointment_history"))
+    conn.close()
+    return result
+
+
+def test_archived_rows_stay_in_the_history_view(db, history):
+    assert db.archive_appointments(days=1) == 6
+
+    conn = db.get_db()
+    archived = sorted(row["id"] for row in conn.execute("SELECT id FROM appointment_history"))
+    conn.close()
+    assert counts(db) == (0, 6, 6)
+    assert archived == history
+
+
+def test_dashboard_and_export_include_archived_rows(db, history, patient, admin):
+    db.archive_appointments(days=1)
+
+    page = patient.get("/dashboard").get_data(as_text=True)
+    export = admin.get("/admin/export-appointments").get_data(as_text=True)
+
+    assert page.count("Dr. James Miller") >= len(history)
+    assert len(export.strip().splitlines()) == 1 + len(history)
+    assert all(f"\n{appointment_id}," in export for appointment_id in history)
+
+
+def test_interrupted_run_resumes_without_duplicates(db, history):
+    # Make the second chunk fail part-way, after the first one has committed
+    conn = db.get_db()
+    conn.execute(f"""
+        CREATE TRIGGER fail_second_chunk BEFORE DELETE ON appointments WHEN OLD.id = {history[2]}
+        BEGIN SELECT RAISE(ABORT, 'disk full'); END
+    """)
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(Exception, match="disk full"):
+        db.archive_appointments(days=1, chunk_size=2)
+    assert counts(db) == (4, 2, 6)
+
+    conn = db.get_db()
+    conn.execute("DROP TRIGGER fail_second_chunk")
+    conn.commit()
+    conn.close()
+
+    assert db.archive_appointments(days=1, chunk_size=2) == 4
+    assert counts(db) == (0, 6, 6)
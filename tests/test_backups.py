@@ -0,0 +1,63 @@
+import sqlite3
+import threading
+
+
+def test_database_runs_in_wal_mode(db):
+    conn = db.get_db()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_backup_completes_while_bookings_commit(db, tmp_path, monkeypatch):
+    monkeypatch.setitem(db.app.config, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setitem(db.app.config, "BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setitem(db.app.config, "BACKUP_STEP_SLEEP", 0.01)
+    done = threading.Event()
+
+    def keep_writing():
+        conn = db.get_db()
+        while not done.is_set():
+            conn.execute("INSERT INTO doctors (name, specialization, available_days, time_slots) "
+                         "VALUES ('Dr. Snap', 'GP', 'Mon', '09:00 AM')")
+            conn.commit()
+        conn.close()
+
+    writer = threading.Thread(target=keep_writing)
+    writer.start()
+    try:
+        target = db.backup_database(keep=1)
+    finally:
+        done.set()
+        writer.join()
+
+    snapshot = sqlite3.connect(target)
+    try:
+        assert snapshot.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert snapshot.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    finally:
+        snapshot.close()
+    assert db.list_snapshots() == [target]
+
+
+def test_backup_steps_through_pages_without_writers(db, tmp_path, monkeypatch):
+    monkeypatch.setitem(db.app.config, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setitem(db.app.config, "BACKUP_PAGES_PER_STEP", 2)
+    monkeypatch.setitem(db.app.config, "BACKUP_MAX_RESTARTS", 0)
+    pauses = []
+    monkeypatch.setattr(db.time_module, "sleep", pauses.append)
+
+    db.backup_database(keep=1)
+
+    # Every step but the last was followed by a pause, and none fell back to one big step
+    assert len(pauses) > 1
+
+
+def test_analytics_read_the_latest_snapshot(db, admin, tmp_path, monkeypatch):
+    monkeypatch.setitem(db.app.config, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setitem(db.app.config, "REPORTS_FROM_SNAPSHOT", True)
+    target = db.backup_database(keep=1)
+
+    for path in ("/admin/analytics", "/admin/analytics/data"):
+        response = admin.get(path)
+        assert response.status_code == 200
+        assert response.headers["X-Report-Snapshot"] == target.rsplit("/", 1)[1]
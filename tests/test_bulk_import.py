@@ -0,0 +1,95 @@
+"""Appointment imports follow the booking form's conflict rules and log an event per row."""
+from datetime import datetime, timedelta
+
+import pytest
+
+DAY = (datetime.now() + timedelta(days=4)).strftime("%Y-%m-%d")
+
+
+@pytest.fixture
+def ids(db, patient):
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors WHERE name = 'Dr. James Miller'").fetchone()["id"]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    conn.close()
+    return doctor_id, user_id
+
+
+def rows(*records):
+    return [(line, dict(record), None) for line, record in enumerate(records, 2)]
+
+
+def visit(user_id, doctor_id, time="09:00 AM", status="Approved"):
+    return {"user_id": user_id, "doctor_id": doctor_id, "date": DAY, "time": time, "status": status}
+
+
+def test_conflicting_rows_are_rejected_with_the_booking_rules(db, ids):
+    doctor_id, user_id = ids
+    conn = db.get_db()
+    other_id = conn.execute("INSERT INTO users(name, email, password) VALUES ('Olly', 'olly@example.com', 'x')").lastrowid
+    conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time) VALUES (?, ?, ?, '09:00 AM')",
+                 (other_id, doctor_id, DAY))
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (0, ?, ?, ?, '10:00 AM', '2999-01-01 00:00:00')
+    """, (other_id, doctor_id, DAY))
+    conn.commit()
+    conn.close()
+
+    report = db.import_records("appointments", rows(
+        visit(user_id, doctor_id, "09:00 AM"),                       # doctor already booked
+        visit(user_id, doctor_id, "10:00 AM"),                       # held for the waitlist
+        visit(user_id, doctor_id, "11:00 AM"),
+        visit(user_id, doctor_id, "11:00 AM"),                       # same patient, same time, same file
+        visit(other_id, doctor_id, "11:00 AM"),                      # doctor taken by the row above
+        visit(user_id, doctor_id, "09:00 AM", status="Cancelled"),   # history never conflicts
+    ))
+
+    assert report["inserted"] == 2
+    assert [(e["line"], e["error"]) for e in report["errors"]] == [
+        (2, "This time slot is already booked for the doctor"),
+        (3, "This time slot is being offered to a patient on the waitlist"),
+        (5, "Patient already has an appointment booked at this time"),
+        (6, "This time slot is already booked for the doctor"),
+    ]
+
+
+def test_chunks_commit_independently_of_rejected_rows(db, ids):
+    doctor_id, user_id = ids
+    times = ["09:00 AM", "09:30 AM", "10:00 AM", "10:30 AM", "11:00 AM"]
+    records = [visit(user_id, doctor_id, t) for t in times]
+    records[3]["doctor_id"] = 999999
+
+    report = db.import_records("appointments", rows(*records), chunk_size=2)
+
+    conn = db.get_db()
+    booked = [row["time"] for row in conn.execute(
+        "SELECT time FROM appointments WHERE user_id = ? ORDER BY id", (user_id,))]
+    conn.close()
+    assert (report["inserted"], report["rejected"]) == (4, 1)
+    assert report["errors"] == [{"line": 5, "error": "Unknown doctor_id '999999'"}]
+    assert booked == ["09:00 AM", "09:30 AM", "10:00 AM", "11:00 AM"]
+
+
+def test_every_inserted_row_gets_its_own_event(db, ids):
+    doctor_id, user_id = ids
+    conn = db.get_db()
+    before = db.latest_event_id(conn)
+    conn.close()
+
+    db.import_records("appointments", rows(
+        visit(user_id, doctor_id, "09:00 AM", status="Pending"),
+        visit(user_id, doctor_id, "09:00 AM"),
+        visit(user_id, doctor_id, "04:00 PM", status="Completed"),
+    ))
+
+    conn = db.get_db()
+    events = [tuple(row) for row in conn.execute("""
+        SELECT e.appointment_id, e.time, e.old_status, e.new_status FROM appointment_events e
+        JOIN appointments a ON a.id = e.appointment_id AND a.time = e.time AND a.status = e.new_status
+        WHERE e.id > ? ORDER BY e.appointment_id
+    """, (before,))]
+    total = conn.execute("SELECT COUNT(*) FROM appointment_events WHERE id > ?", (before,)).fetchone()[0]
+    conn.close()
+    assert [event[1:] for event in events] == [("09:00 AM", None, "Pending"), ("04:00 PM", None, "Completed")]
+    assert total == 2
@@ -0,0 +1,25 @@
+import pytest
+
+
+def _book(patient, date, time):
+    patient.post("/book/7", data={"date": date, "time": time})
+
+
+@pytest.mark.parametrize("body", [[1], "1", 5, {"appointment_ids": "12", "status": "Approved"}])
+def test_malformed_json_is_a_400_not_a_500(admin, body):
+    response = admin.post("/admin/update-status/bulk", json=body)
+    assert response.status_code == 400
+    assert "appointment_ids" in response.get_json()["message"]
+
+
+def test_bulk_update_changes_every_selected_appointment(db, admin, patient):
+    _book(patient, "2099-01-05", "09:00 AM")
+    _book(patient, "2099-01-06", "09:00 AM")
+    conn = db.get_db()
+    ids = [row["id"] for row in conn.execute("SELECT id FROM appointments ORDER BY id")]
+
+    response = admin.post("/admin/update-status/bulk", json={"appointment_ids": ids, "status": "Approved"})
+
+    assert response.status_code == 200
+    assert {row["status"] for row in conn.execute("SELECT status FROM appointments")} == {"Approved"}
+    conn.close()
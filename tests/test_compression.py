@@ -0,0 +1,49 @@
+import gzip
+import io
+
+from werkzeug.test import Client
+from werkzeug.wsgi import FileWrapper
+
+GZIP = {"Accept-Encoding": "gzip"}
+TEXT = b"appointment " * 200
+
+
+def wrapped(db, body):
+    def inner(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", str(len(TEXT)))])
+        return body()
+    return Client(db.CompressionMiddleware(inner))
+
+
+def test_text_is_gzipped_and_round_trips(db):
+    response = wrapped(db, lambda: [TEXT]).get("/", headers=GZIP)
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == TEXT
+
+
+def test_head_passes_through_untouched(db):
+    client = db.app.test_client()
+
+    head = client.head("/doctors", headers=GZIP)
+    get = client.get("/doctors", headers=GZIP)
+
+    assert "Content-Encoding" not in head.headers
+    assert get.headers["Content-Encoding"] == "gzip"
+
+
+def test_file_responses_are_left_for_the_server(db):
+    response = wrapped(db, lambda: FileWrapper(io.BytesIO(TEXT))).get("/", headers=GZIP)
+
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == TEXT
+
+
+def test_bodies_over_the_ceiling_are_not_buffered(db, monkeypatch):
+    monkeypatch.setitem(db.app.config, "COMPRESS_MAX_SIZE", len(TEXT) - 1)
+
+    response = wrapped(db, lambda: [TEXT]).get("/", headers=GZIP)
+
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data() == TEXT
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+
+def add_doctor(db, name, available_days, time_slots):
+    conn = db.get_db()
+    mask, per_day = db.doctor_schedule(available_days, time_slots)
+    doctor_id = conn.execute("""
+        INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+        VALUES (?, 'General Physician', ?, ?, ?, ?)
+    """, (name, available_days, time_slots, mask, per_day)).lastrowid
+    conn.commit()
+    conn.close()
+    return doctor_id
+
+
+def test_free_today_filter_agrees_with_the_card(db):
+    doctor_id = add_doctor(db, "Dr. Early", "Daily", "04:00 PM - 05:00 PM")
+    conn = db.get_db()
+    doctor = conn.execute("SELECT * FROM doctors WHERE id = ?", (doctor_id,)).fetchone()
+    try:
+        for hour, expected in ((12, 2), (18, 0)):
+            now = datetime.now().replace(hour=hour, minute=0)
+            card = db.doctor_availability(conn, [doctor], now)[doctor_id]
+            assert card["free_today"] == expected
+            assert (doctor_id in db.slot_board.open_today(conn, now)) == bool(expected)
+    finally:
+        conn.close()
+
+
+def test_doctor_without_a_parsable_schedule_says_so(db):
+    add_doctor(db, "Dr. Someday", "by appointment", "09:00 AM - 05:00 PM")
+
+    page = db.app.test_client().get("/doctors?q=Someday").get_data(as_text=True)
+
+    assert "Dr. Someday" in page
+    assert "Schedule unavailable" in page
+    assert "Fully booked" not in page
+
+
+def test_free_today_filter_only_lists_open_doctors(db, monkeypatch):
+    open_id = add_doctor(db, "Dr. Open", "Daily", "04:00 PM - 05:00 PM")
+    add_doctor(db, "Dr. Closed", "Daily", "04:00 PM - 05:00 PM")
+    monkeypatch.setattr(db.slot_board, "open_today", lambda conn, now=None: {open_id})
+
+    page = db.app.test_client().get("/doctors?free_today=1").get_data(as_text=True)
+
+    assert "Dr. Open" in page
+    assert "Dr. Closed" not in page
@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def leaving_doctor(db, patient):
+    """A doctor with one upcoming and one past visit for the patient"""
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors WHERE name = 'Dr. James Miller'").fetchone()["id"]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    for day, status in ((date.today() + timedelta(days=7), "Approved"), (date.today() - timedelta(days=7), "Completed")):
+        conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES (?, ?, ?, '09:00 AM', ?)",
+                     (user_id, doctor_id, day.isoformat(), status))
+    conn.commit()
+    conn.close()
+    return doctor_id
+
+
+@pytest.fixture
+def removal(db, admin, leaving_doctor, monkeypatch):
+    """Soft-delete the doctor without starting the background job; returns the job id"""
+    started, notified = [], []
+    monkeypatch.setattr(db, "start_deletion_job", started.append)
+    monkeypatch.setattr(db, "queue_notifications", notified.extend)
+    admin.post(f"/admin/delete-doctor/{leaving_doctor}")
+    return started[0], notified
+
+
+def test_soft_delete_cancels_upcoming_visits_and_tells_the_patient(db, leaving_doctor, removal):
+    _, notified = removal
+    conn = db.get_db()
+    statuses = sorted(row["status"] for row in conn.execute(
+        "SELECT status FROM appointments WHERE doctor_id = ?", (leaving_doctor,)))
+    event = conn.execute("SELECT old_status, new_status FROM appointment_events WHERE doctor_id = ?",
+                         (leaving_doctor,)).fetchone()
+    conn.close()
+
+    assert statuses == ["Cancelled", "Completed"]
+    assert (event["old_status"], event["new_status"]) == ("Approved", "Cancelled")
+    assert [(n[0], n[-2], n[-1]) for n in notified] == [("pat@example.com", "Approved", "Cancelled")]
+
+
+def test_job_clears_the_doctor_in_chunks(db, leaving_doctor, removal, monkeypatch):
+    monkeypatch.setitem(db.app.config, "DELETION_CHUNK_SIZE", 1)
+    monkeypatch.setitem(db.app.config, "DELETION_CHUNK_PAUSE", 0)
+    job_id, _ = removal
+
+    assert db.run_deletion_job(job_id) is True
+
+    conn = db.get_db()
+    job = conn.execute("SELECT status, processed, total FROM deletion_jobs WHERE id = ?", (job_id,)).fetchone()
+    left = conn.execute("SELECT COUNT(*) FROM appointments WHERE doctor_id = ?", (leaving_doctor,)).fetchone()[0]
+    doctor = conn.execute("SELECT 1 FROM doctors WHERE id = ?", (leaving_doctor,)).fetchone()
+    conn.close()
+    assert (job["status"], job["processed"], job["total"]) == ("Done", 2, 2)
+    assert left == 0 and doctor is None
+
+
+def test_interrupted_job_is_resumed_by_the_sweeper(db, leaving_doctor, removal, monkeypatch):
+    monkeypatch.setitem(db.app.config, "DELETION_CHUNK_PAUSE", 0)
+    job_id, _ = removal
+    conn = db.get_db()
+    conn.execute("UPDATE deletion_jobs SET status = 'Running', heartbeat_at = '2000-01-01 00:00:00' WHERE id = ?",
+                 (job_id,))
+    conn.commit()
+    conn.close()
+
+    assert db.resume_deletion_jobs() == 1
+
+
+def test_failure_is_recorded_even_when_the_job_connection_is_broken(db, leaving_doctor, removal, monkeypatch):
+    job_id, _ = removal
+
+    def broken_chunk(conn, *args):
+        conn.close()
+        raise db.sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(db, "_delete_doctor_chunk", broken_chunk)
+
+    assert db.run_deletion_job(job_id) is False
+
+    conn = db.get_db()
+    job = conn.execute("SELECT status, error FROM deletion_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    assert (job["status"], job["error"]) == ("Failed", "database is locked")
@@ -0,0 +1,91 @@
+"""Doctor search: the FTS5 index follows the doctors table, and is found without init_db."""
+import sqlite3
+
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    "ENABLE_FTS5" not in {row[0] for row in sqlite3.connect(":memory:").execute("PRAGMA compile_options")},
+    reason="this SQLite build has no FTS5")
+
+
+def names(db, query):
+    conn = db.get_db()
+    try:
+        return [row["name"] for row in db.search_doctors(conn, query)]
+    finally:
+        conn.close()
+
+
+def write(db, sql, params=()):
+    conn = db.get_db()
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def index_is_consistent(db):
+    conn = db.get_db()
+    try:
+        conn.execute("INSERT INTO doctors_fts(doctors_fts, rank) VALUES('integrity-check', 1)")
+        return True
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+
+def add_doctor(db):
+    write(db, """
+        INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+        VALUES ('Dr. Ada Stone', 'Podiatrist', 'Mon-Fri', '09:00 AM - 10:00 AM', 31, 2)
+    """)
+
+
+def test_new_doctor_is_searchable_by_prefix(db):
+    add_doctor(db)
+
+    assert names(db, "podia") == ["Dr. Ada Stone"]
+    assert db.DOCTOR_FTS is True
+    assert index_is_consistent(db)
+
+
+def test_edits_replace_the_indexed_text(db):
+    add_doctor(db)
+    write(db, "UPDATE doctors SET name = 'Dr. Ada Rivers', specialization = 'Orthopedist' WHERE name = 'Dr. Ada Stone'")
+
+    assert names(db, "podia") == []
+    assert names(db, "rivers ortho") == ["Dr. Ada Rivers"]
+    assert index_is_consistent(db)
+
+
+def test_removed_doctor_drops_out_of_results(db):
+    add_doctor(db)
+    write(db, "UPDATE doctors SET deleted_at = '2000-01-01 00:00:00' WHERE name = 'Dr. Ada Stone'")
+    assert names(db, "podia") == []
+
+    # The removal job deletes the row for good later
+    write(db, "DELETE FROM doctors WHERE name = 'Dr. Ada Stone'")
+    assert names(db, "podia") == []
+    assert index_is_consistent(db)
+
+
+def test_index_is_detected_on_first_search(db, monkeypatch):
+    add_doctor(db)
+    monkeypatch.setattr(db, "DOCTOR_FTS", None)
+
+    assert names(db, "podia") == ["Dr. Ada Stone"]
+    assert db.DOCTOR_FTS is True
+
+
+def test_database_without_the_index_falls_back_to_like(db, monkeypatch):
+    add_doctor(db)
+    conn = db.get_db()
+    for name in ("trg_doctors_fts_insert", "trg_doctors_fts_update", "trg_doctors_fts_delete"):
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TABLE doctors_fts")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "DOCTOR_FTS", None)
+
+    assert names(db, "podiatrist") == ["Dr. Ada Stone"]
+    assert db.DOCTOR_FTS is False
@@ -0,0 +1,77 @@
+"""The FAQ fallback: typo-tolerant matching on both index paths, and answers safe for the chat window."""
+import json
+
+import pytest
+
+ENTRIES = [
+    {"question": "I have a migraine that won't go away", "alternatives": ["throbbing headache"], "answer": "migraine"},
+    {"question": "I have a toothache", "alternatives": ["my tooth hurts"], "answer": "toothache"},
+    {"question": "Is there parking at the clinic?", "alternatives": ["where can I park"], "answer": "parking"},
+]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def index(request, monkeypatch):
+    import app as medibook
+    if request.param == "python":
+        monkeypatch.setattr(medibook, "np", None)
+    elif medibook.np is None:
+        pytest.skip("NumPy is not installed")
+    return medibook.FaqIndex(ENTRIES)
+
+
+def best(index, message):
+    matches = index.search(message, limit=1)
+    return matches[0][0]["answer"] if matches else None
+
+
+def test_questions_and_alternatives_match(index):
+    assert best(index, "I have a migraine that won't go away") == "migraine"
+    assert best(index, "where can I park my car") == "parking"
+
+
+def test_typos_still_match(index):
+    assert best(index, "migrane wont go away") == "migraine"
+    assert best(index, "toothake") == "toothache"
+    assert best(index, "parkign at the clinc") == "parking"
+
+
+def test_unrelated_text_scores_low(index):
+    matches = index.search("zzzz qqqq")
+    assert not matches or matches[0][1] < 0.25
+
+
+def test_fallback_scores_match_numpy(db, monkeypatch):
+    if db.np is None:
+        pytest.skip("NumPy is not installed")
+    messages = ("migrane", "tooth hurts", "park", "headache at the clinic")
+    vectorized = db.FaqIndex(ENTRIES)
+    expected = [[(entry["answer"], round(score, 9)) for entry, score in vectorized.search(m)] for m in messages]
+    monkeypatch.setattr(db, "np", None)
+    fallback = db.FaqIndex(ENTRIES)
+
+    assert [[(entry["answer"], round(score, 9)) for entry, score in fallback.search(m)] for m in messages] == expected
+
+
+def test_every_shipped_answer_uses_only_chat_markup(db):
+    with open(db.app.config['FAQ_PATH'], encoding="utf-8") as f:
+        entries = json.load(f)
+
+    assert entries
+    for entry in entries:
+        assert db.faq_markup_problems(entry["answer"]) == [], entry["question"]
+
+
+def test_entries_with_other_markup_are_skipped(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_faq_index", None)
+    path = tmp_path / "faq.json"
+    path.write_text(json.dumps([
+        {"question": "safe", "answer": "<b>ok</b><br><a href='/doctors?q=skin' class='btn'>Find</a>"},
+        {"question": "script", "answer": "<script>alert(1)</script>"},
+        {"question": "handler", "answer": "<b onclick='alert(1)'>hi</b>"},
+        {"question": "offsite", "answer": "<a href='javascript:alert(1)'>x</a>"},
+    ]))
+
+    index = db.load_faq_index(str(path))
+
+    assert [entry["question"] for entry in index.entries] == ["safe"]
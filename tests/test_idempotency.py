@@ -0,0 +1,94 @@
+import time
+
+
+def free_slot(db):
+    conn = db.get_db()
+    slot = db.slot_board.earliest(conn, "General Physician", limit=1)[0]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    conn.close()
+    return slot, user_id
+
+
+def count_bookings(db, slot):
+    conn = db.get_db()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM appointments WHERE doctor_id = ? AND date = ? AND time = ?",
+                            (slot["doctor_id"], slot["date"], slot["time"])).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def claim(db, user_id, key, path, claimed_at):
+    conn = db.get_db()
+    conn.execute("INSERT INTO idempotency_keys(user_id, key, path, claimed_at) VALUES (?, ?, ?, ?)",
+                 (user_id, key, path, claimed_at))
+    conn.commit()
+    conn.close()
+
+
+def test_retried_booking_replays_the_first_outcome(db, patient):
+    slot, _ = free_slot(db)
+    form = {"date": slot["date"], "time": slot["time"]}
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = patient.post(f"/book/{slot['doctor_id']}", data=form, headers=headers)
+    second = patient.post(f"/book/{slot['doctor_id']}", data=form, headers=headers)
+
+    assert second.status_code == first.status_code
+    assert second.headers["Location"] == first.headers["Location"]
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert count_bookings(db, slot) == 1
+
+
+def test_claim_left_by_a_dead_worker_is_taken_over(db, patient, monkeypatch):
+    slot, user_id = free_slot(db)
+    path = f"/book/{slot['doctor_id']}"
+    claim(db, user_id, "orphan", path, time.time() - db.app.config["IDEMPOTENCY_LEASE_SECONDS"] - 1)
+
+    response = patient.post(path, data={"date": slot["date"], "time": slot["time"]},
+                            headers={"Idempotency-Key": "orphan"})
+
+    assert response.status_code == 302
+    assert "Idempotent-Replayed" not in response.headers
+    assert count_bookings(db, slot) == 1
+
+
+def test_retry_racing_a_slow_original_gets_409_without_running(db, patient):
+    slot, user_id = free_slot(db)
+    path = f"/book/{slot['doctor_id']}"
+    # Well past any old wait window, but inside the lease: the original is slow, not dead
+    claim(db, user_id, "in-flight", path, time.time() - 60)
+
+    started = time.monotonic()
+    response = patient.post(path, data={"date": slot["date"], "time": slot["time"]},
+                            headers={"Idempotency-Key": "in-flight"})
+
+    assert time.monotonic() - started < 1
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == str(db.app.config["IDEMPOTENCY_RETRY_AFTER_SECONDS"])
+    assert count_bookings(db, slot) == 0
+
+
+def test_posts_the_view_would_refuse_never_claim_a_key(db, patient):
+    response = patient.post("/admin/update-status/1", data={"status": "Approved"},
+                            headers={"Idempotency-Key": "not-an-admin"})
+    anonymous = db.app.test_client().post("/book/1", data={"date": "2099-01-05", "time": "09:00 AM"},
+                                          headers={"Idempotency-Key": "anonymous"})
+
+    assert response.status_code == 302 and anonymous.status_code == 302
+    conn = db.get_db()
+    assert conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0] == 0
+    conn.close()
+
+
+def test_browser_double_submit_goes_back_to_the_page(db, patient):
+    slot, user_id = free_slot(db)
+    path = f"/book/{slot['doctor_id']}"
+    claim(db, user_id, "form-key", path, time.time())
+
+    response = patient.post(path, data={"date": slot["date"], "time": slot["time"], "idempotency_key": "form-key"},
+                            headers={"Referer": f"http://localhost{path}"})
+
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(path)
+    assert count_bookings(db, slot) == 0
@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.fixture
+def one_stream(db, monkeypatch):
+    monkeypatch.setitem(db.app.config, "SSE_MAX_STREAMS", 1)
+    return db
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip"])
+def test_streams_beyond_the_limit_are_refused_until_one_closes(one_stream, patient, encoding):
+    headers = {"Accept-Encoding": encoding}
+    first = patient.get("/slots/stream/1", headers=headers, buffered=False)
+    assert first.status_code == 200
+
+    refused = patient.get("/slots/stream/1", headers=headers, buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "30"
+    refused.close()
+
+    # Closing without reading the body still frees the slot (through the compression layer too)
+    first.close()
+    assert one_stream.event_hub.metrics()["open"] == 0
+    again = patient.get("/slots/stream/1", headers=headers, buffered=False)
+    assert again.status_code == 200
+    again.close()
+
+
+def test_refused_pages_can_poll_for_the_same_changes(db, patient):
+    conn = db.get_db()
+    since = db.latest_event_id(conn)
+    db.record_appointment_event(conn, 1, 1, 1, "2099-01-05", "09:00 AM", None, "Pending")
+    db.record_appointment_event(conn, 2, 1, 2, "2099-01-05", "09:00 AM", None, "Pending")   # other doctor
+    db.record_appointment_event(conn, 1, 1, 1, "2099-01-05", "09:00 AM", "Pending", "Approved")  # no slot change
+    db.record_appointment_event(conn, 1, 1, 1, "2099-01-05", "09:00 AM", "Approved", "Cancelled")
+    conn.commit()
+    head = db.latest_event_id(conn)
+    conn.close()
+
+    data = patient.get(f"/slots/changes/1?from=2099-01-01&since={since}").get_json()
+
+    assert [(c["time"], c["state"]) for c in data["changes"]] == [("09:00 AM", "taken"), ("09:00 AM", "freed")]
+    assert data["last_event_id"] == head
+    again = patient.get(f"/slots/changes/1?from=2099-01-01&since={head}").get_json()
+    assert again["changes"] == [] and again["last_event_id"] == head
+    assert patient.get("/slots/changes/1?since=abc").status_code == 400
@@ -0,0 +1,89 @@
+import pytest
+
+
+@pytest.fixture
+def outbox(db, monkeypatch):
+    sent = []
+    monkeypatch.setattr(db, "send_email_batch", lambda emails, background=True: sent.extend(emails))
+    db.flush_notifications(force=True)
+    sent.clear()
+    return sent
+
+
+def test_changes_within_the_window_go_out_as_one_digest(db, outbox):
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", "Pending", "Approved")
+    db.queue_notification("pat@example.com", "Pat", 2, "Dr. B", "2099-01-06", "10:00 AM", "Pending", "Cancelled")
+
+    assert db.flush_notifications(force=True, background=False) == 1
+    (subject, recipient, html), = outbox
+    assert recipient == "pat@example.com"
+    assert subject == "Your MediBook appointment updates (2) 🩺"
+    assert "Approved" in html and "Cancelled" in html
+
+
+def test_booking_cancelled_before_the_digest_sends_nothing(db, outbox):
+    collapsed = db.notification_queue.metrics().get("collapsed", 0)
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", "Pending", "Cancelled")
+
+    assert db.flush_notifications(force=True, background=False) == 0
+    assert outbox == []
+    assert db.notification_queue.metrics()["collapsed"] == collapsed + 1
+
+
+def pending(db):
+    conn = db.get_db()
+    rows = conn.execute("SELECT recipient, appointment_id, status, claimed_until FROM notification_queue").fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+
+def test_queued_changes_survive_the_worker(db, outbox, monkeypatch):
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")
+    assert db.notification_queue.metrics()["pending_items"] == 1
+
+    # The worker is killed; a new one starts with an empty process
+    monkeypatch.setattr(db, "notification_queue", db.NotificationQueue())
+    assert db.flush_notifications(force=True, background=False) == 1
+    assert [recipient for _, recipient, _ in outbox] == ["pat@example.com"]
+    assert pending(db) == []
+
+
+def test_workers_share_one_digest_per_patient(db, outbox, monkeypatch):
+    first, second = db.NotificationQueue(), db.NotificationQueue()
+    monkeypatch.setattr(db.NotificationQueue, "start", lambda self: None)
+    first.add([("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")])
+    second.add([("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", "Pending", "Approved"),
+                ("pat@example.com", "Pat", 2, "Dr. B", "2099-01-06", "10:00 AM", "Approved", "Completed")])
+
+    assert second.metrics()["coalesced"] == 1
+    assert db.flush_notifications(force=True, background=False) == 1
+    (subject, _, html), = outbox
+    assert subject == "Your MediBook appointment updates (2) 🩺"
+    assert "Approved" in html and "Completed" in html
+
+
+def test_digest_is_resent_when_its_sender_dies(db, outbox, monkeypatch):
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")
+    db.notification_queue.claim(force=True)  # and then the worker is killed mid-send
+
+    # A change arriving meanwhile waits in its own row instead of joining the lost claim
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", "Pending", "Approved")
+    assert [row[2] for row in pending(db)] == ["Pending", "Approved"]
+    assert db.flush_notifications(force=True, background=False) == 1
+    outbox.clear()
+
+    conn = db.get_db()
+    conn.execute("UPDATE notification_queue SET claimed_until = 0")
+    conn.commit()
+    conn.close()
+    assert db.flush_notifications(force=True, background=False) == 1
+    assert pending(db) == []
+
+
+def test_digest_waits_for_its_window(db, outbox):
+    db.queue_notification("pat@example.com", "Pat", 1, "Dr. A", "2099-01-05", "09:00 AM", None, "Pending")
+
+    assert db.flush_notifications(background=False) == 0
+    assert 0 < db.notification_queue.next_due() <= db.app.config['NOTIFY_WINDOW_SECONDS']
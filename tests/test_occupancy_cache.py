@@ -0,0 +1,110 @@
+"""The availability cache must notice writes made by other workers through the event log alone."""
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+DAY = (date.today() + timedelta(days=5)).isoformat()
+
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    monkeypatch.setitem(db.app.config, "OCCUPANCY_CHECK_SECONDS", 0)
+    return db.occupancy_cache
+
+
+@pytest.fixture
+def ids(db, patient):
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors WHERE name = 'Dr. James Miller'").fetchone()["id"]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    other_id = conn.execute("INSERT INTO users(name, email, password) VALUES ('Olly', 'olly@example.com', 'x')").lastrowid
+    conn.commit()
+    conn.close()
+    return doctor_id, user_id, other_id
+
+
+def book_elsewhere(db, user_id, doctor_id, time="09:00 AM"):
+    """What another worker's booking leaves behind: the row and its event"""
+    conn = db.get_db()
+    appointment_id = conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time) VALUES (?, ?, ?, ?)",
+                                  (user_id, doctor_id, DAY, time)).lastrowid
+    db.record_appointment_event(conn, appointment_id, user_id, doctor_id, DAY, time, None, "Pending")
+    conn.commit()
+    conn.close()
+    return appointment_id
+
+
+def test_booking_by_another_worker_is_picked_up(db, cache, ids):
+    doctor_id, user_id, other_id = ids
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") is None
+
+    book_elsewhere(db, other_id, doctor_id)
+
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") == "doctor"
+    assert cache.conflict(other_id, doctor_id, DAY, "09:00 AM") == "user"
+
+
+def test_cancellation_by_another_worker_frees_the_slot(db, cache, ids):
+    doctor_id, user_id, other_id = ids
+    appointment_id = book_elsewhere(db, other_id, doctor_id)
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") == "doctor"
+
+    conn = db.get_db()
+    conn.execute("UPDATE appointments SET status = 'Cancelled' WHERE id = ?", (appointment_id,))
+    db.record_appointment_event(conn, appointment_id, other_id, doctor_id, DAY, "09:00 AM", "Pending", "Cancelled")
+    conn.commit()
+    conn.close()
+
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") is None
+
+
+def test_doctor_removal_frees_the_slots_through_its_events(db, cache, ids, admin, monkeypatch):
+    doctor_id, user_id, other_id = ids
+    book_elsewhere(db, other_id, doctor_id)
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") == "doctor"
+    # As if another worker handled the removal: nothing here is told to forget
+    monkeypatch.setattr(cache, "clear", lambda: None)
+    monkeypatch.setattr(db, "start_deletion_job", lambda job_id: None)
+
+    admin.post(f"/admin/delete-doctor/{doctor_id}")
+
+    assert cache.conflict(other_id, doctor_id, DAY, "09:00 AM") is None
+
+
+def test_hold_passed_on_without_an_event_is_seen(db, cache, ids):
+    doctor_id, user_id, other_id = ids
+    conn = db.get_db()
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (0, ?, ?, ?, '09:00 AM', ?)
+    """, (other_id, doctor_id, DAY, (datetime.now() + timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+    assert cache.conflict(user_id, doctor_id, DAY, "09:00 AM") == "held"
+
+    # The first offer lapses and the slot is offered to the next patient in line
+    conn.execute("UPDATE waitlist_offers SET status = 'Expired', expires_at = '2000-01-01 00:00:00'")
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (0, ?, ?, ?, '09:00 AM', '2999-01-01 00:00:00')
+    """, (user_id, doctor_id, DAY))
+    conn.commit()
+    conn.close()
+    time.sleep(1.1)
+
+    assert cache.conflict(other_id, doctor_id, DAY, "09:00 AM") == "held"
+
+
+def test_day_loaded_across_an_invalidation_is_not_stored(db, cache, ids, monkeypatch):
+    doctor_id, user_id, other_id = ids
+    load = cache._load
+
+    def racing_load(conn, column, key_id, day):
+        times = load(conn, column, key_id, day)
+        cache.invalidate(doctor_id, user_id, day)
+        return times
+    monkeypatch.setattr(cache, "_load", racing_load)
+
+    cache.conflict(user_id, doctor_id, DAY, "09:00 AM")
+
+    assert (doctor_id, DAY) not in cache.days["doctor_id"]
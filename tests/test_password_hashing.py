@@ -0,0 +1,23 @@
+from concurrent.futures import Future
+
+
+class StalledPool:
+    """Accepts jobs and never runs them, like a pool swamped by a login spike"""
+    def submit(self, *args):
+        return Future()
+
+
+def test_hash_timeout_sends_the_patient_back_to_retry(db, monkeypatch):
+    monkeypatch.setattr(db, "_get_hash_pool", lambda: StalledPool())
+    monkeypatch.setitem(db.app.config, "PASSWORD_HASH_TIMEOUT", 0.01)
+    client = db.app.test_client()
+
+    response = client.post("/register", data={"name": "Sam", "email": "sam@example.com", "password": "password123"},
+                           follow_redirects=True)
+
+    assert response.status_code == 200
+    assert "handling a lot of sign-ups" in response.get_data(as_text=True)
+    assert db.password_hash_metrics()["timed_out"] >= 1
+    conn = db.get_db()
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE email='sam@example.com'").fetchone()[0] == 0
+    conn.close()
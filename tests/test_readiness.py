@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.fixture
+def probe(db, monkeypatch):
+    monkeypatch.setitem(db.app.config, "READY_CACHE_SECONDS", 0)
+    monkeypatch.setitem(db.app.config, "READY_MAX_LOCK_WAIT_MS", 50)
+    monkeypatch.setitem(db._readiness, "lock_busy_since", None)
+    return db.app.test_client()
+
+
+def test_probe_does_not_queue_behind_a_writer(db, probe):
+    writer = db.get_db()
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        first = probe.get("/readyz")
+        # The probe answers at once and one busy sighting isn't a failure yet
+        assert first.status_code == 200
+        assert first.get_json()["checks"]["lock_wait_ms"] < 50
+
+        db.time_module.sleep(0.1)
+        held = probe.get("/readyz")
+        assert held.status_code == 503
+        assert "write lock wait above READY_MAX_LOCK_WAIT_MS" in held.get_json()["failures"]
+    finally:
+        writer.rollback()
+        writer.close()
+
+    assert probe.get("/readyz").get_json()["checks"]["lock_wait_ms"] == 0.0
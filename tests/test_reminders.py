@@ -0,0 +1,90 @@
+"""Reminders walk a (starts_at, id) watermark: every due reminder goes out exactly once across ticks."""
+from datetime import datetime
+
+import pytest
+
+NOW = datetime(2030, 1, 1, 8, 0)
+
+
+@pytest.fixture
+def emails(db, monkeypatch):
+    sent = []
+    monkeypatch.setattr(db, "send_email_batch", lambda batch, background=True: sent.extend(batch))
+    return sent
+
+
+@pytest.fixture
+def book(db):
+    conn = db.get_db()
+    doctor_ids = [row["id"] for row in conn.execute("SELECT id FROM doctors ORDER BY id")]
+    user_id = conn.execute("INSERT INTO users(name, email, password) VALUES ('Pat', 'pat@example.com', 'x')").lastrowid
+    conn.commit()
+    conn.close()
+
+    def book(date, time, status="Approved", doctor=0):
+        conn = db.get_db()
+        appointment_id = conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES (?, ?, ?, ?, ?)",
+                                      (user_id, doctor_ids[doctor], date, time, status)).lastrowid
+        conn.commit()
+        conn.close()
+        return appointment_id
+    return book
+
+
+def reminded(db):
+    conn = db.get_db()
+    rows = {(row["appointment_id"], row["kind"]) for row in conn.execute("SELECT * FROM appointment_reminders")}
+    conn.close()
+    return rows
+
+
+def tick(db, hour, minute=0, day=1):
+    return db.send_due_reminders(now=NOW.replace(day=day, hour=hour, minute=minute))
+
+
+def test_each_reminder_goes_out_once_across_ticks(db, book, emails):
+    soon = book("2030-01-01", "08:30 AM")
+    evening = book("2030-01-01", "08:00 PM")
+    early_tomorrow = book("2030-01-02", "07:30 AM")
+    later_tomorrow = book("2030-01-02", "09:00 AM")
+
+    assert tick(db, 8) == 4
+    assert reminded(db) == {(soon, "1h"), (soon, "24h"), (evening, "24h"), (early_tomorrow, "24h")}
+    assert tick(db, 8) == 0
+
+    # Booked after the first tick, but ahead of the watermark
+    booked_late = book("2030-01-02", "09:30 AM")
+    assert tick(db, 9, 30) == 2
+    assert tick(db, 19, 30) == 1
+    assert tick(db, 7, day=2) == 1
+
+    assert reminded(db) == {
+        (soon, "1h"), (soon, "24h"), (evening, "24h"), (evening, "1h"), (early_tomorrow, "24h"),
+        (early_tomorrow, "1h"), (later_tomorrow, "24h"), (booked_late, "24h"),
+    }
+    assert len(emails) == len(reminded(db))
+
+
+def test_batches_sharing_a_start_time_are_not_skipped(db, book, emails, monkeypatch):
+    monkeypatch.setitem(db.app.config, "REMINDER_BATCH_SIZE", 2)
+    # Odd rows are active, each with its own doctor; the cancelled ones are skipped
+    ids = [book("2030-01-01", "08:30 AM", "Approved" if i % 2 else "Cancelled", doctor=i // 2) for i in range(7)]
+
+    assert tick(db, 8) == 6
+    assert tick(db, 8, 10) == 0
+
+    active = [appointment_id for i, appointment_id in enumerate(ids) if i % 2]
+    assert reminded(db) == {(appointment_id, kind) for appointment_id in active for kind in ("1h", "24h")}
+    assert len(emails) == 6
+
+
+def test_only_the_lease_holder_sends(db):
+    assert db.claim_scheduler_lease("reminders", "first", 60)
+    assert not db.claim_scheduler_lease("reminders", "second", 60)
+    assert db.claim_scheduler_lease("reminders", "first", 60)
+
+    conn = db.get_db()
+    conn.execute("UPDATE scheduler_leases SET expires_at = '2000-01-01 00:00:00'")
+    conn.commit()
+    conn.close()
+    assert db.claim_scheduler_lease("reminders", "second", 60)
@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta
+
+
+def setup_doctor(db):
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors WHERE name = 'Dr. James Miller'").fetchone()["id"]
+    other_id = conn.execute("SELECT id FROM doctors WHERE id != ? LIMIT 1", (doctor_id,)).fetchone()["id"]
+    user_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    conn.close()
+    return doctor_id, other_id, user_id
+
+
+def mondays(count):
+    today = date.today()
+    first = today + timedelta(days=7 - today.weekday())
+    return [(first + timedelta(weeks=k)).isoformat() for k in range(count)]
+
+
+def book(db, user_id, doctor_id, day, time="09:00 AM"):
+    conn = db.get_db()
+    conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time, status) VALUES (?, ?, ?, ?, 'Pending')",
+                 (user_id, doctor_id, day, time))
+    conn.commit()
+    conn.close()
+
+
+def test_series_conflicts_are_reported_per_date(db, patient):
+    doctor_id, other_id, user_id = setup_doctor(db)
+    days = mondays(4)
+    book(db, 999, doctor_id, days[1])        # someone else has the doctor
+    book(db, user_id, other_id, days[2])     # the patient is busy elsewhere
+    conn = db.get_db()
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (0, 999, ?, ?, '09:00 AM', ?)
+    """, (doctor_id, days[3], (datetime.now() + timedelta(minutes=15)).strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+
+    conflicts = db.find_series_conflicts(conn, user_id, doctor_id, days, "09:00 AM")
+    conn.close()
+
+    assert conflicts == {days[1]: "doctor", days[2]: "user", days[3]: "held"}
+
+
+def test_series_books_the_free_dates_and_skips_the_rest(db, patient):
+    doctor_id, _, user_id = setup_doctor(db)
+    days = mondays(3)
+    book(db, 999, doctor_id, days[1])
+
+    response = patient.post(f"/book/{doctor_id}", data={
+        "date": days[0], "time": "09:00 AM", "repeat_weeks": "1", "occurrences": "3"})
+
+    assert response.status_code == 302
+    conn = db.get_db()
+    booked = [row["date"] for row in conn.execute(
+        "SELECT date FROM appointments WHERE user_id = ? AND series_id IS NOT NULL ORDER BY date", (user_id,))]
+    conn.close()
+    assert booked == [days[0], days[2]]
@@ -0,0 +1,89 @@
+"""The earliest-slot bitmaps must follow bookings and doctor edits made by any worker."""
+from datetime import datetime
+
+import pytest
+
+# As of midnight every slot of every day in the horizon is still ahead
+NOW = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+TODAY = NOW.date().isoformat()
+
+
+@pytest.fixture
+def doctor_id(db):
+    """A doctor of a specialty no sample doctor has, working every day"""
+    conn = db.get_db()
+    days, slots = "Mon-Sun", "09:00 AM - 10:00 AM"
+    doctor_id = conn.execute("""
+        INSERT INTO doctors(name, specialization, available_days, time_slots, weekday_mask, slots_per_day)
+        VALUES ('Dr. Ada Stone', 'Podiatrist', ?, ?, ?, ?)
+    """, (days, slots, *db.doctor_schedule(days, slots))).lastrowid
+    conn.commit()
+    conn.close()
+    return doctor_id
+
+
+def earliest(db, limit=3):
+    conn = db.get_db()
+    try:
+        return [(slot["date"], slot["time"]) for slot in db.slot_board.earliest(conn, "Podiatrist", limit, now=NOW)]
+    finally:
+        conn.close()
+
+
+def write(db, sql, params=()):
+    conn = db.get_db()
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_booking_and_cancellation_events_are_replayed(db, doctor_id):
+    assert earliest(db, 1) == [(TODAY, "09:00 AM")]
+
+    conn = db.get_db()
+    appointment_id = conn.execute("INSERT INTO appointments(user_id, doctor_id, date, time) VALUES (1, ?, ?, '09:00 AM')",
+                                  (doctor_id, TODAY)).lastrowid
+    db.record_appointment_event(conn, appointment_id, 1, doctor_id, TODAY, "09:00 AM", None, "Pending")
+    conn.commit()
+    assert earliest(db, 1) == [(TODAY, "09:30 AM")]
+
+    conn.execute("UPDATE appointments SET status = 'Cancelled' WHERE id = ?", (appointment_id,))
+    db.record_appointment_event(conn, appointment_id, 1, doctor_id, TODAY, "09:00 AM", "Pending", "Cancelled")
+    conn.commit()
+    conn.close()
+    assert earliest(db, 1) == [(TODAY, "09:00 AM")]
+
+
+def test_time_slot_edit_rebuilds_the_board(db, doctor_id):
+    assert earliest(db, 1) == [(TODAY, "09:00 AM")]
+
+    write(db, "UPDATE doctors SET time_slots = '11:00 AM - 11:30 AM', slots_per_day = 1 WHERE id = ?", (doctor_id,))
+
+    assert earliest(db, 2)[0] == (TODAY, "11:00 AM")
+
+
+def test_working_day_edit_rebuilds_the_board(db, doctor_id):
+    assert earliest(db, 1) == [(TODAY, "09:00 AM")]
+    # Stop working today's weekday only
+    other_days = 0b1111111 & ~(1 << NOW.weekday())
+    write(db, "UPDATE doctors SET available_days = 'varies', weekday_mask = ? WHERE id = ?", (other_days, doctor_id))
+
+    assert all(date != TODAY for date, _ in earliest(db))
+
+
+def test_removed_doctor_leaves_the_board(db, doctor_id):
+    assert earliest(db, 1)
+    write(db, "UPDATE doctors SET deleted_at = '2000-01-01 00:00:00' WHERE id = ?", (doctor_id,))
+
+    assert earliest(db) == []
+
+
+def test_edits_bump_the_doctor_revision(db, doctor_id):
+    conn = db.get_db()
+    before = db.slot_board._doctor_signature(conn)
+    conn.execute("UPDATE doctors SET name = 'Dr. Ada Stone-Hill' WHERE id = ?", (doctor_id,))
+    after = db.slot_board._doctor_signature(conn)
+    conn.rollback()
+    conn.close()
+
+    assert after == before + 1
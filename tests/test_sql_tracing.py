@@ -0,0 +1,51 @@
+def _traced(db, monkeypatch, slow_ms=10_000):
+    monkeypatch.setitem(db.app.config, "SQL_TRACE", True)
+    monkeypatch.setitem(db.app.config, "SLOW_QUERY_MS", slow_ms)
+    return db.get_db()
+
+
+def test_same_query_with_different_values_counts_as_a_repeat(db, monkeypatch, capsys):
+    with db.app.test_request_context("/page"):
+        conn = _traced(db, monkeypatch)
+        for user_id in (1, 2, 3):
+            conn.execute("SELECT name FROM users WHERE id=?", (user_id,)).fetchone()
+        conn.close()
+
+        stats = db.g.sql_stats
+        assert stats["count"] == 3
+        assert stats["statements"]["SELECT name FROM users WHERE id=?"] == 3
+
+        db.report_sql_stats(db.app.response_class())
+    assert "Possible N+1 on /page: 3x SELECT name FROM users WHERE id=?" in capsys.readouterr().out
+
+
+def test_transaction_statements_are_not_reported(db, monkeypatch, capsys):
+    with db.app.test_request_context("/page"):
+        conn = _traced(db, monkeypatch)
+        for _ in range(3):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.commit()
+        conn.close()
+        db.report_sql_stats(db.app.response_class())
+    assert "Possible N+1" not in capsys.readouterr().out
+
+
+def test_blank_statements_are_skipped(db, monkeypatch, capsys):
+    with db.app.test_request_context("/page"):
+        db.g.sql_stats = {"count": 3, "time": 0.0, "statements": db.Counter({"   ": 3, "": 3})}
+        db.report_sql_stats(db.app.response_class())
+    assert "Possible N+1" not in capsys.readouterr().out
+
+
+def test_slow_query_is_logged_once_its_rows_are_read(db, monkeypatch, capsys):
+    with db.app.test_request_context("/page"):
+        conn = _traced(db, monkeypatch, slow_ms=0)
+        cursor = conn.execute("SELECT id FROM doctors ORDER BY id")
+        assert "Slow query" not in capsys.readouterr().out
+
+        assert [row["id"] for row in cursor] == list(range(1, 8))
+        conn.close()
+        assert db.g.sql_stats["time"] > 0
+    out = capsys.readouterr().out
+    assert out.count("Slow query") == 1
+    assert "SELECT id FROM doctors ORDER BY id" in out
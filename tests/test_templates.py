@@ -0,0 +1,77 @@
+"""Templates are compiled once at build time and again (from bytecode) as each worker starts."""
+import os
+import runpy
+
+import pytest
+from jinja2 import ChoiceLoader, Environment, FileSystemBytecodeCache, FileSystemLoader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_precompiled_templates_load_from_the_bytecode_cache(db, monkeypatch):
+    compiled, failed = db.precompile_templates()
+    assert (compiled, failed) == (len(db.site_templates()), [])
+
+    # A new process: same cache directory, nothing compiled in memory yet
+    env = Environment(loader=FileSystemLoader(ROOT),
+                      bytecode_cache=FileSystemBytecodeCache(db.app.config['JINJA_CACHE_DIR']))
+    monkeypatch.setattr(env, "compile", lambda *args, **kwargs: pytest.fail("compiled instead of loading bytecode"))
+    for name in db.site_templates():
+        env.get_template(name)
+
+
+def test_warming_compiles_without_rendering(db, monkeypatch):
+    monkeypatch.setattr(db, "render_template", lambda *args, **kwargs: pytest.fail("warm-up rendered a page"))
+
+    compiled, failed = db.warm_templates()
+
+    assert (compiled, failed) == (len(db.site_templates()), [])
+
+
+@pytest.fixture
+def broken_template(db, tmp_path, monkeypatch):
+    (tmp_path / "broken.html").write_text("{% if %}")
+    monkeypatch.setattr(db.app.jinja_env, "loader", ChoiceLoader([FileSystemLoader(str(tmp_path)), db.app.jinja_env.loader]))
+    monkeypatch.setattr(db, "site_templates", lambda: ["index.html", "broken.html"])
+
+
+def test_precompile_command_fails_the_build_on_a_broken_template(db, broken_template):
+    result = db.app.test_cli_runner().invoke(args=["precompile-templates"])
+
+    assert result.exit_code != 0
+    assert "broken.html (TemplateSyntaxError" in result.output
+
+
+def test_broken_template_does_not_stop_a_worker(db, broken_template):
+    compiled, failed = db.warm_templates()
+
+    assert compiled == 1
+    assert [failure.split(" ")[0] for failure in failed] == ["broken.html"]
+
+
+@pytest.fixture
+def fresh_worker(db, monkeypatch):
+    """A process that hasn't run startup() yet, with warm-up on; returns the warm-up calls"""
+    calls = []
+    monkeypatch.setattr(db, "_started_pid", None)
+    monkeypatch.setattr(db, "setup_static_files", lambda: None)
+    monkeypatch.setitem(db.app.config, "WARMUP_TEMPLATES", True)
+    monkeypatch.setattr(db, "warm_templates", lambda: calls.append("warm"))
+    return calls
+
+
+def test_gunicorn_worker_warms_up_before_taking_traffic(db, fresh_worker):
+    hooks = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+
+    hooks["post_worker_init"](None)
+    db.app.test_client().get("/")
+
+    assert fresh_worker == ["warm"]
+
+
+def test_first_request_warms_up_without_gunicorn(db, fresh_worker):
+    client = db.app.test_client()
+    client.get("/")
+    client.get("/")
+
+    assert fresh_worker == ["warm"]
@@ -0,0 +1,73 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+
+def hold_first_free_slot(db, user_id=999):
+    """Put an open offer for another patient on the earliest free General Physician slot"""
+    conn = db.get_db()
+    slot = db.slot_board.earliest(conn, "General Physician", limit=1)[0]
+    expires_at = (datetime.now() + timedelta(minutes=15)).strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (0, ?, ?, ?, ?, ?)
+    """, (user_id, slot["doctor_id"], slot["date"], slot["time"], expires_at))
+    conn.commit()
+    conn.close()
+    return slot
+
+
+def test_held_slot_is_not_offered_as_earliest(db):
+    slot = hold_first_free_slot(db)
+
+    conn = db.get_db()
+    after = db.slot_board.earliest(conn, "General Physician", limit=1)[0]
+    conn.close()
+
+    assert (after["doctor_id"], after["date"], after["time"]) != (slot["doctor_id"], slot["date"], slot["time"])
+
+
+def test_booking_page_greys_out_slots_held_for_someone_else(db, patient):
+    slot = hold_first_free_slot(db)
+
+    page = patient.get(f"/book/{slot['doctor_id']}").get_data(as_text=True)
+
+    booked = json.loads(page.split("JSON.parse('", 1)[1].split("');", 1)[0])
+    assert {"date": slot["date"], "time": slot["time"]} in booked
+
+
+def test_dashboard_only_reads_offers_between_sweeps(db, patient, monkeypatch):
+    def sweep():
+        raise AssertionError("the dashboard must not sweep offers")
+    monkeypatch.setattr(db, "expire_waitlist_offers", sweep)
+    # A sweep just ran in this worker, so the next one is WAITLIST_SWEEP_SECONDS away
+    monkeypatch.setattr(db, "_offers_swept_at", time.monotonic())
+
+    assert patient.get("/dashboard").status_code == 200
+
+
+def test_lapsed_offer_moves_on_without_the_sweeper(db, patient, monkeypatch):
+    monkeypatch.setattr(db, "_offers_swept_at", 0)
+    conn = db.get_db()
+    doctor_id = conn.execute("SELECT id FROM doctors LIMIT 1").fetchone()["id"]
+    patient_id = conn.execute("SELECT id FROM users WHERE email = 'pat@example.com'").fetchone()["id"]
+    other_id = conn.execute("INSERT INTO users(name, email, password) VALUES ('Olly', 'olly@example.com', 'x')").lastrowid
+    day = (datetime.now() + timedelta(days=3)).strftime("%Y-%m-%d")
+    first = conn.execute("INSERT INTO waitlist(user_id, doctor_id, date_from, date_to) VALUES (?, ?, ?, ?)",
+                         (other_id, doctor_id, day, day)).lastrowid
+    conn.execute("INSERT INTO waitlist(user_id, doctor_id, date_from, date_to) VALUES (?, ?, ?, ?)",
+                 (patient_id, doctor_id, day, day))
+    conn.execute("""
+        INSERT INTO waitlist_offers(waitlist_id, user_id, doctor_id, date, time, expires_at)
+        VALUES (?, ?, ?, ?, '09:00 AM', '2000-01-01 00:00:00')
+    """, (first, other_id, doctor_id, day))
+    conn.commit()
+    conn.close()
+
+    assert patient.get("/dashboard").status_code == 200
+
+    conn = db.get_db()
+    offers = [(row["user_id"], row["status"]) for row in conn.execute(
+        "SELECT user_id, status FROM waitlist_offers ORDER BY id")]
+    conn.close()
+    assert offers == [(other_id, "Expired"), (patient_id, "Open")]